@@ -1,23 +1,240 @@
-import requests
+import os
+import asyncio
+import base64
+import inspect
+import uuid
+import weakref
+import zlib
 import pymongo
 from datetime import datetime
 from langchain.tools import tool
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Callable, Generator, Union
+from dotenv import load_dotenv
+from cache import (
+    product_cache, customer_cache,
+    notify_change, start_change_stream_invalidation, add_change_listener,
+)
+from telemetry import mongo_listener
+from facts import current_facts
+from weather import weather_provider
+from product_search import (
+    PRODUCT_SEARCH_BACKEND, product_index, ensure_text_index,
+    text_search_query, text_search_projection,
+)
+from weather_index import WeatherProductIndex
+from similar_products import SIMILAR_PRODUCTS_ENABLED, similarity_index
 
+load_dotenv()
+MONGODB_URI = os.getenv("MONGODB_URI", "mongodb://localhost:27017")
+DB_NAME = "ecommerce_system"
 
-client = pymongo.MongoClient("")
-db = client["ecommerce_system"]
+client = pymongo.MongoClient(MONGODB_URI, event_listeners=[mongo_listener])
+db = client[DB_NAME]
 
+# Async clients are bound to the event loop they were first used on, so keep
+# one per loop instead of a single module-level instance.
+_async_clients = weakref.WeakKeyDictionary()
 
-@tool
-def check_order_status(order_id: str) -> str:
-    """Check the status of an order by order ID."""
-    try:
-        order = db.orders.find_one({"order_id": order_id})
-        if not order:
-            return f"Order {order_id} not found."
-        
-        return f"""
+
+def get_async_db():
+    """Return the async database handle for the running event loop."""
+    loop = asyncio.get_running_loop()
+    async_client = _async_clients.get(loop)
+    if async_client is None:
+        async_client = pymongo.AsyncMongoClient(MONGODB_URI, event_listeners=[mongo_listener])
+        _async_clients[loop] = async_client
+    return async_client[DB_NAME]
+
+
+change_stream_watcher = start_change_stream_invalidation(db)
+
+
+# Tool bodies are written once, as generators that yield the I/O they need
+# (a MongoCall or a WeatherLookup) and get its result sent back. run() does
+# that I/O with the sync client and arun() awaits it with the async one, so a
+# tool and its coroutine only differ in the driver. An error raised by the
+# I/O is thrown back into the generator at the yield.
+
+class MongoCall:
+    """One collection method call; for find(), sort/limit and reading the cursor to a list."""
+
+    def __init__(self, collection: str, method: Union[str, Callable], *args, **kwargs):
+        self.collection = collection
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+        self._sort = None
+        self._limit = None
+
+    def sort(self, sort):
+        self._sort = sort
+        return self
+
+    def limit(self, limit: int):
+        self._limit = limit
+        return self
+
+    def _call(self, database):
+        collection = database[self.collection]
+        if callable(self.method):
+            return self.method(collection, *self.args, **self.kwargs)
+        result = getattr(collection, self.method)(*self.args, **self.kwargs)
+        if self.method == "find":
+            if self._sort is not None:
+                result = result.sort(self._sort)
+            if self._limit is not None:
+                result = result.limit(self._limit)
+        return result
+
+    def run(self):
+        result = self._call(db)
+        return list(result) if self.method == "find" else result
+
+    async def arun(self):
+        result = self._call(get_async_db())
+        if self.method == "find":
+            return await result.to_list()
+        return await result if inspect.isawaitable(result) else result
+
+
+class WeatherLookup:
+    """Current weather for a location from the configured provider (weather.py)."""
+
+    def __init__(self, location: str):
+        self.location = location
+
+    def run(self):
+        return weather_provider.get(self.location)
+
+    async def arun(self):
+        return await weather_provider.aget(self.location)
+
+
+class WaitForBuild:
+    """Wait for an in-memory index's background build, off the event loop when async."""
+
+    def __init__(self, index):
+        self.index = index
+
+    def run(self):
+        return self.index.wait_built()
+
+    async def arun(self):
+        return await asyncio.to_thread(self.index.wait_built)
+
+
+Steps = Generator[Any, Any, Any]
+
+def run(steps: Steps):
+    """Drive a tool body with blocking I/O and return its result."""
+    result, error = None, None
+    while True:
+        try:
+            call = steps.throw(error) if error is not None else steps.send(result)
+        except StopIteration as stop:
+            return stop.value
+        result, error = None, None
+        try:
+            result = call.run()
+        except Exception as e:
+            error = e
+
+async def arun(steps: Steps):
+    """Drive a tool body with awaited I/O on the running event loop and return its result."""
+    result, error = None, None
+    while True:
+        try:
+            call = steps.throw(error) if error is not None else steps.send(result)
+        except StopIteration as stop:
+            return stop.value
+        result, error = None, None
+        try:
+            result = await call.arun()
+        except Exception as e:
+            error = e
+
+
+# Documents already fetched while answering the current request (facts.py)
+# are reused first, so agents on later hops do not fetch them again.
+
+def recall(kind: str, key: str) -> Optional[Dict[str, Any]]:
+    facts = current_facts()
+    return facts.get(kind, key) if facts is not None else None
+
+def remember(kind: str, key: str, document: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    facts = current_facts()
+    if facts is not None and document:
+        facts.put(kind, key, document)
+    return document
+
+def forget(kind: str, keys: List[str]):
+    facts = current_facts()
+    if facts is not None:
+        facts.discard(kind, keys)
+
+
+# Read-through loaders for rarely changing catalog and customer documents.
+# The request's facts and then the cache are consulted first, and misses are
+# filled from Mongo.
+
+def load_product_steps(product_id: str) -> Steps:
+    product = recall("products", product_id)
+    if product is not None:
+        return product
+    product = product_cache.get(product_id)
+    if product is None:
+        product = yield MongoCall("products", "find_one", {"product_id": product_id}, {"_id": 0})
+        if product:
+            product_cache.set(product_id, product)
+    return remember("products", product_id, product)
+
+def load_product(product_id: str) -> Optional[Dict[str, Any]]:
+    return run(load_product_steps(product_id))
+
+async def aload_product(product_id: str) -> Optional[Dict[str, Any]]:
+    return await arun(load_product_steps(product_id))
+
+def load_products_steps(product_ids: List[str]) -> Steps:
+    facts = current_facts()
+    cached, missing = facts.get_many("products", product_ids) if facts is not None else ({}, product_ids)
+    for product_id in missing:
+        product = product_cache.get(product_id)
+        if product is not None:
+            cached[product_id] = remember("products", product_id, product)
+    missing = [product_id for product_id in product_ids if product_id not in cached]
+    fetched = (yield MongoCall("products", "find", {"product_id": {"$in": missing}}, {"_id": 0})) if missing else []
+    for product in fetched:
+        product_cache.set(product["product_id"], product)
+        cached[product["product_id"]] = remember("products", product["product_id"], product)
+    return [cached[product_id] for product_id in product_ids if product_id in cached]
+
+def load_products(product_ids: List[str]) -> List[Dict[str, Any]]:
+    """Load several products in order, fetching only the cache misses with one $in query."""
+    return run(load_products_steps(product_ids))
+
+async def aload_products(product_ids: List[str]) -> List[Dict[str, Any]]:
+    return await arun(load_products_steps(product_ids))
+
+def load_customer_steps(customer_id: str) -> Steps:
+    customer = recall("customers", customer_id)
+    if customer is not None:
+        return customer
+    customer = customer_cache.get(customer_id)
+    if customer is None:
+        customer = yield MongoCall("customers", "find_one", {"customer_id": customer_id}, {"_id": 0})
+        if customer:
+            customer_cache.set(customer_id, customer)
+    return remember("customers", customer_id, customer)
+
+def load_customer(customer_id: str) -> Optional[Dict[str, Any]]:
+    return run(load_customer_steps(customer_id))
+
+async def aload_customer(customer_id: str) -> Optional[Dict[str, Any]]:
+    return await arun(load_customer_steps(customer_id))
+
+
+def format_order_status(order: Dict[str, Any]) -> str:
+    return f"""
 Order ID: {order['order_id']}
 Status: {order['status'].upper()}
 Customer: {order['customer_id']}
@@ -28,101 +245,433 @@ Shipping Address: {order['shipping_address']}
 Can Cancel: {'Yes' if order['can_cancel'] else 'No'}
 Can Return: {'Yes' if order['can_return'] else 'No'}
         """.strip()
+
+def check_order_status_steps(order_id: str) -> Steps:
+    try:
+        order = recall("orders", order_id)
+        if order is None:
+            order = remember("orders", order_id, (yield MongoCall("orders", "find_one", {"order_id": order_id}, {"_id": 0})))
+        if not order:
+            return f"Order {order_id} not found."
+
+        return format_order_status(order)
     except Exception as e:
         return f"Error checking order status: {str(e)}"
 
 @tool
-def cancel_order(order_id: str) -> str:
-    """Cancel an order if it meets business rules (can_cancel = True)."""
+def check_order_status(order_id: str) -> str:
+    """Check the status of an order by order ID."""
+    return run(check_order_status_steps(order_id))
+
+async def acheck_order_status(order_id: str) -> str:
+    return await arun(check_order_status_steps(order_id))
+
+check_order_status.coroutine = acheck_order_status
+
+# Order mutations are single conditional find_one_and_update calls: the
+# filter carries the eligibility rules, so an order can only be cancelled or
+# returned once even under concurrent requests. The follow-up lookup only
+# runs on the failure path, to tell "not found" from "not eligible".
+
+def order_id_match(order_id: Union[str, List[str]]):
+    return {"$in": order_id} if isinstance(order_id, list) else order_id
+
+def cancel_filter(order_id: Union[str, List[str]]) -> Dict[str, Any]:
+    return {"order_id": order_id_match(order_id), "can_cancel": True, "status": {"$ne": "cancelled"}}
+
+def cancel_update(batch_id: Optional[str] = None) -> Dict[str, Any]:
+    fields = {
+        "status": "cancelled",
+        "cancelled_date": datetime.now(),
+        "can_cancel": False,
+        "can_return": False
+    }
+    if batch_id:
+        fields["batch_id"] = batch_id
+    return {"$set": fields}
+
+def return_filter(order_id: Union[str, List[str]]) -> Dict[str, Any]:
+    return {"order_id": order_id_match(order_id), "can_return": True, "status": {"$ne": "returned"}}
+
+def return_update(reason: str, batch_id: Optional[str] = None) -> Dict[str, Any]:
+    fields = {
+        "status": "returned",
+        "return_date": datetime.now(),
+        "return_reason": reason,
+        "can_cancel": False,
+        "can_return": False
+    }
+    if batch_id:
+        fields["batch_id"] = batch_id
+    return {"$set": fields}
+
+def format_return_processed(order: Dict[str, Any], reason: str) -> str:
+    return f"Return processed for order {order['order_id']}. Refund of ${order['total_amount']} will be processed within 3-5 business days. Reason: {reason}"
+
+def cancel_order_steps(order_id: str) -> Steps:
     try:
-        order = db.orders.find_one({"order_id": order_id})
-        if not order:
-            return f"Order {order_id} not found."
-        
-        if not order['can_cancel']:
-            return f"Order {order_id} cannot be cancelled. Status: {order['status']}"
-        
-        result = db.orders.update_one(
-            {"order_id": order_id},
-            {"$set": {"status": "cancelled", "cancelled_date": datetime.now()}}
+        order = yield MongoCall(
+            "orders", "find_one_and_update",
+            cancel_filter(order_id),
+            cancel_update(),
+            return_document=pymongo.ReturnDocument.AFTER
         )
-        
-        if result.modified_count > 0:
+        if order:
+            remember("orders", order_id, order)
             return f"Order {order_id} has been successfully cancelled."
-        else:
-            return f"Failed to cancel order {order_id}."
-            
+
+        existing = yield MongoCall("orders", "find_one", {"order_id": order_id}, {"status": 1})
+        if not existing:
+            return f"Order {order_id} not found."
+        return f"Order {order_id} cannot be cancelled. Status: {existing['status']}"
+
     except Exception as e:
         return f"Error cancelling order: {str(e)}"
 
+@tool
+def cancel_order(order_id: str) -> str:
+    """Cancel an order if it meets business rules (can_cancel = True)."""
+    return run(cancel_order_steps(order_id))
+
+async def acancel_order(order_id: str) -> str:
+    return await arun(cancel_order_steps(order_id))
+
+cancel_order.coroutine = acancel_order
+
+def process_return_steps(order_id: str, reason: str) -> Steps:
+    try:
+        order = yield MongoCall(
+            "orders", "find_one_and_update",
+            return_filter(order_id),
+            return_update(reason),
+            return_document=pymongo.ReturnDocument.AFTER
+        )
+        if order:
+            remember("orders", order_id, order)
+            return format_return_processed(order, reason)
+
+        existing = yield MongoCall("orders", "find_one", {"order_id": order_id}, {"status": 1})
+        if not existing:
+            return f"Order {order_id} not found."
+        return f"Order {order_id} is not eligible for return. Status: {existing['status']}"
+
+    except Exception as e:
+        return f"Error processing return: {str(e)}"
+
 @tool
 def process_return(order_id: str, reason: str = "Customer request") -> str:
     """Process a return/refund for an order if eligible."""
-    try:
-        order = db.orders.find_one({"order_id": order_id})
+    return run(process_return_steps(order_id, reason))
+
+async def aprocess_return(order_id: str, reason: str = "Customer request") -> str:
+    return await arun(process_return_steps(order_id, reason))
+
+process_return.coroutine = aprocess_return
+
+# Bulk variants answer N orders with one $in query, or one conditional
+# update_many over the $in list plus one $in read-back. The update writes a
+# batch_id unique to the call into every order it changes, so the read-back
+# tells exactly which orders this batch cancelled or returned, whatever else
+# ran at the same time. A last update_many removes the batch_id again, so it
+# only lives for the duration of the call.
+
+def new_batch_id() -> str:
+    return uuid.uuid4().hex
+
+def batch_filter(order_ids: List[str], batch_id: str) -> Dict[str, Any]:
+    return {"order_id": {"$in": order_ids}, "batch_id": batch_id}
+
+BATCH_CLEANUP = {"$unset": {"batch_id": ""}}
+
+def unique_ids(ids: List[str]) -> List[str]:
+    return list(dict.fromkeys(ids))
+
+def load_orders_steps(order_ids: List[str]) -> Steps:
+    facts = current_facts()
+    known, missing = facts.get_many("orders", order_ids) if facts is not None else ({}, order_ids)
+    fetched = (yield MongoCall("orders", "find", {"order_id": {"$in": missing}}, {"_id": 0})) if missing else []
+    for order in fetched:
+        remember("orders", order["order_id"], order)
+    return list(known.values()) + fetched
+
+def load_orders(order_ids: List[str]) -> List[Dict[str, Any]]:
+    """Load several orders, querying only the ones not yet fetched in this request with one $in query."""
+    return run(load_orders_steps(order_ids))
+
+async def aload_orders(order_ids: List[str]) -> List[Dict[str, Any]]:
+    return await arun(load_orders_steps(order_ids))
+
+def format_bulk_status(order_ids: List[str], orders: List[Dict[str, Any]]) -> str:
+    by_id = {order["order_id"]: order for order in orders}
+    return "\n\n".join(
+        format_order_status(by_id[order_id]) if order_id in by_id else f"Order {order_id} not found."
+        for order_id in order_ids
+    )
+
+def format_bulk_cancel(order_ids: List[str], orders: List[Dict[str, Any]], batch_id: str) -> str:
+    by_id = {order["order_id"]: order for order in orders}
+    lines = []
+    for order_id in order_ids:
+        order = by_id.get(order_id)
         if not order:
-            return f"Order {order_id} not found."
-        
-        if not order['can_return']:
-            return f"Order {order_id} is not eligible for return. Status: {order['status']}"
-        
-        result = db.orders.update_one(
-            {"order_id": order_id},
-            {"$set": {
-                "status": "returned", 
-                "return_date": datetime.now(),
-                "return_reason": reason
-            }}
-        )
-        
-        if result.modified_count > 0:
-            return f"Return processed for order {order_id}. Refund of ${order['total_amount']} will be processed within 3-5 business days. Reason: {reason}"
+            lines.append(f"• Order {order_id} not found.")
+        elif order.get("batch_id") == batch_id:
+            lines.append(f"• Order {order_id} has been successfully cancelled.")
         else:
-            return f"Failed to process return for order {order_id}."
-            
+            lines.append(f"• Order {order_id} cannot be cancelled. Status: {order['status']}")
+    return "\n".join(lines)
+
+def format_bulk_return(order_ids: List[str], orders: List[Dict[str, Any]], reason: str, batch_id: str) -> str:
+    by_id = {order["order_id"]: order for order in orders}
+    lines = []
+    for order_id in order_ids:
+        order = by_id.get(order_id)
+        if not order:
+            lines.append(f"• Order {order_id} not found.")
+        elif order.get("batch_id") == batch_id:
+            lines.append(f"• {format_return_processed(order, reason)}")
+        else:
+            lines.append(f"• Order {order_id} is not eligible for return. Status: {order['status']}")
+    return "\n".join(lines)
+
+BULK_READBACK = {"_id": 0, "order_id": 1, "status": 1, "total_amount": 1, "batch_id": 1}
+
+def check_orders_status_steps(order_ids: List[str]) -> Steps:
+    try:
+        order_ids = unique_ids(order_ids)
+        return format_bulk_status(order_ids, (yield from load_orders_steps(order_ids)))
     except Exception as e:
-        return f"Error processing return: {str(e)}"
+        return f"Error checking order status: {str(e)}"
 
 @tool
-def search_products(query: str, category: Optional[str] = None) -> str:
-    """Search products by name or category."""
+def check_orders_status(order_ids: List[str]) -> str:
+    """Check the status of several orders at once. Prefer this over repeated check_order_status calls."""
+    return run(check_orders_status_steps(order_ids))
+
+async def acheck_orders_status(order_ids: List[str]) -> str:
+    return await arun(check_orders_status_steps(order_ids))
+
+check_orders_status.coroutine = acheck_orders_status
+
+def bulk_cancel_orders_steps(order_ids: List[str]) -> Steps:
+    try:
+        order_ids = unique_ids(order_ids)
+        batch_id = new_batch_id()
+        yield MongoCall("orders", "update_many", cancel_filter(order_ids), cancel_update(batch_id))
+        forget("orders", order_ids)
+        orders = yield MongoCall("orders", "find", {"order_id": {"$in": order_ids}}, BULK_READBACK)
+        yield MongoCall("orders", "update_many", batch_filter(order_ids, batch_id), BATCH_CLEANUP)
+        return format_bulk_cancel(order_ids, orders, batch_id)
+    except Exception as e:
+        return f"Error cancelling orders: {str(e)}"
+
+@tool
+def bulk_cancel_orders(order_ids: List[str]) -> str:
+    """Cancel several orders at once. Each order is only cancelled if it is eligible (can_cancel = True)."""
+    return run(bulk_cancel_orders_steps(order_ids))
+
+async def abulk_cancel_orders(order_ids: List[str]) -> str:
+    return await arun(bulk_cancel_orders_steps(order_ids))
+
+bulk_cancel_orders.coroutine = abulk_cancel_orders
+
+def bulk_process_returns_steps(order_ids: List[str], reason: str) -> Steps:
+    try:
+        order_ids = unique_ids(order_ids)
+        batch_id = new_batch_id()
+        yield MongoCall("orders", "update_many", return_filter(order_ids), return_update(reason, batch_id))
+        forget("orders", order_ids)
+        orders = yield MongoCall("orders", "find", {"order_id": {"$in": order_ids}}, BULK_READBACK)
+        yield MongoCall("orders", "update_many", batch_filter(order_ids, batch_id), BATCH_CLEANUP)
+        return format_bulk_return(order_ids, orders, reason, batch_id)
+    except Exception as e:
+        return f"Error processing returns: {str(e)}"
+
+@tool
+def bulk_process_returns(order_ids: List[str], reason: str = "Customer request") -> str:
+    """Process returns/refunds for several orders at once. Each order is only returned if it is eligible."""
+    return run(bulk_process_returns_steps(order_ids, reason))
+
+async def abulk_process_returns(order_ids: List[str], reason: str = "Customer request") -> str:
+    return await arun(bulk_process_returns_steps(order_ids, reason))
+
+bulk_process_returns.coroutine = abulk_process_returns
+
+# Order history uses keyset pagination over the compound index
+# (customer_id, order_date desc, order_id desc): each page is a bounded
+# index range scan that starts right after the previous page's last order.
+
+ORDER_HISTORY_INDEX = [
+    ("customer_id", pymongo.ASCENDING),
+    ("order_date", pymongo.DESCENDING),
+    ("order_id", pymongo.DESCENDING),
+]
+ORDER_HISTORY_SORT = ORDER_HISTORY_INDEX[1:]
+ORDER_SUMMARY_PROJECTION = {
+    "_id": 0, "order_id": 1, "status": 1, "total_amount": 1, "order_date": 1,
+    "items.product_id": 1,
+}
+MAX_HISTORY_PAGE_SIZE = 50
+
+def encode_history_cursor(order: Dict[str, Any]) -> str:
+    raw = f"{order['order_date'].isoformat()}|{order['order_id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_history_cursor(cursor: str):
+    order_date, order_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+    return datetime.fromisoformat(order_date), order_id
+
+def order_history_filter(customer_id: str, cursor: Optional[str] = None) -> Dict[str, Any]:
+    history_filter: Dict[str, Any] = {"customer_id": customer_id}
+    if cursor:
+        order_date, order_id = decode_history_cursor(cursor)
+        history_filter["$or"] = [
+            {"order_date": {"$lt": order_date}},
+            {"order_date": order_date, "order_id": {"$lt": order_id}},
+        ]
+    return history_filter
+
+def history_page_size(page_size: int) -> int:
+    return max(1, min(page_size, MAX_HISTORY_PAGE_SIZE))
+
+def format_order_history(customer_id: str, orders: List[Dict[str, Any]], page_size: int, cursor: Optional[str]) -> str:
+    if not orders:
+        return f"No orders found for customer {customer_id}." if not cursor else f"No more orders for customer {customer_id}."
+
+    has_more = len(orders) > page_size
+    orders = orders[:page_size]
+    result = f"Orders for customer {customer_id} (newest first, {len(orders)} shown):\n"
+    for order in orders:
+        result += (
+            f"• {order['order_id']} | {order['order_date'].strftime('%Y-%m-%d')} | "
+            f"{order['status'].upper()} | ${order['total_amount']} | {len(order.get('items', []))} item(s)\n"
+        )
+    if has_more:
+        result += f"More orders available. Next cursor: {encode_history_cursor(orders[-1])}"
+    else:
+        result += "End of order history."
+    return result.strip()
+
+def get_customer_order_history_steps(customer_id: str, cursor: Optional[str], page_size: int) -> Steps:
     try:
-        search_filter = {}
-        
+        page_size = history_page_size(page_size)
+        orders = yield (
+            MongoCall("orders", "find", order_history_filter(customer_id, cursor), ORDER_SUMMARY_PROJECTION)
+            .sort(ORDER_HISTORY_SORT)
+            .limit(page_size + 1)
+        )
+        return format_order_history(customer_id, orders, page_size, cursor)
+    except Exception as e:
+        return f"Error getting order history: {str(e)}"
+
+@tool
+def get_customer_order_history(customer_id: str, cursor: Optional[str] = None, page_size: int = 10) -> str:
+    """List a customer's orders newest first, one page at a time. Pass the returned cursor to fetch the next page."""
+    return run(get_customer_order_history_steps(customer_id, cursor, page_size))
+
+async def aget_customer_order_history(customer_id: str, cursor: Optional[str] = None, page_size: int = 10) -> str:
+    return await arun(get_customer_order_history_steps(customer_id, cursor, page_size))
+
+get_customer_order_history.coroutine = aget_customer_order_history
+
+def build_search_filter(query: str, category: Optional[str] = None) -> Dict[str, Any]:
+    search_filter = {}
+
+    if query:
+        search_filter["$or"] = [
+            {"name": {"$regex": query, "$options": "i"}},
+            {"description": {"$regex": query, "$options": "i"}}
+        ]
+
+    if category:
+        search_filter["category"] = {"$regex": category, "$options": "i"}
+
+    return search_filter
+
+add_change_listener("products", product_index.on_change)
+_text_index_ready = False
+
+weather_index = WeatherProductIndex()
+add_change_listener("products", weather_index.on_change)
+add_change_listener("products", similarity_index.on_change)
+
+def all_products():
+    return db.products.find({}, {"_id": 0})
+
+def start_index_builds():
+    """Build the in-memory product indexes in the background, so no request has to."""
+    if PRODUCT_SEARCH_BACKEND == "memory":
+        product_index.build_in_background(all_products)
+    weather_index.build_in_background(all_products)
+    if SIMILAR_PRODUCTS_ENABLED:
+        similarity_index.build_in_background(all_products, similarity_scope())
+
+def similarity_scope() -> str:
+    """Scope of a saved similarity index: the database name plus a hash of the server URI."""
+    return f"{db.name}-{zlib.crc32(MONGODB_URI.encode()):08x}"
+
+def all_products_steps() -> Steps:
+    return (yield MongoCall("products", "find", {}, {"_id": 0}))
+
+def find_products_steps(query: str, category: Optional[str] = None, limit: int = 10) -> Steps:
+    global _text_index_ready
+    if PRODUCT_SEARCH_BACKEND == "memory":
+        if not product_index.is_built and product_index.building:
+            yield WaitForBuild(product_index)
+        if not product_index.is_built:
+            product_index.build((yield from all_products_steps()))
+        product_index.ensure_built(all_products)
+        return product_index.search(query, category, limit)
+    if PRODUCT_SEARCH_BACKEND == "text":
+        if not _text_index_ready:
+            yield MongoCall("products", ensure_text_index)
+            _text_index_ready = True
+        call = MongoCall("products", "find", text_search_query(query, category), text_search_projection(query))
         if query:
-            search_filter["$or"] = [
-                {"name": {"$regex": query, "$options": "i"}},
-                {"description": {"$regex": query, "$options": "i"}}
-            ]
-        
-        if category:
-            search_filter["category"] = {"$regex": category, "$options": "i"}
-        
-        products = list(db.products.find(search_filter, {"_id": 0}).limit(10))
-        
-        if not products:
-            return f"No products found for query: {query}"
-        
-        result = f"Found {len(products)} products:\n\n"
-        for product in products:
-            result += f"• {product['name']} ({product['product_id']})\n"
-            result += f"  Category: {product['category']} | Price: ${product['price']} | Available: {product['availability']}\n"
-            result += f"  Description: {product['description']}\n\n"
-        
-        return result.strip()
-        
+            call.sort([("score", {"$meta": "textScore"})])
+        return (yield call.limit(limit))
+    return (yield MongoCall("products", "find", build_search_filter(query, category), {"_id": 0}).limit(limit))
+
+def find_products(query: str, category: Optional[str] = None, limit: int = 10) -> List[Dict[str, Any]]:
+    """Run a product search on the configured backend (see product_search.py)."""
+    return run(find_products_steps(query, category, limit))
+
+async def afind_products(query: str, category: Optional[str] = None, limit: int = 10) -> List[Dict[str, Any]]:
+    return await arun(find_products_steps(query, category, limit))
+
+def format_search_results(query: str, products: List[Dict[str, Any]]) -> str:
+    if not products:
+        return f"No products found for query: {query}"
+
+    result = f"Found {len(products)} products:\n\n"
+    for product in products:
+        result += f"• {product['name']} ({product['product_id']})\n"
+        result += f"  Category: {product['category']} | Price: ${product['price']} | Available: {product['availability']}\n"
+        result += f"  Description: {product['description']}\n\n"
+
+    return result.strip()
+
+def search_products_steps(query: str, category: Optional[str]) -> Steps:
+    try:
+        products = yield from find_products_steps(query, category)
+
+        return format_search_results(query, products)
+
     except Exception as e:
         return f"Error searching products: {str(e)}"
 
 @tool
-def get_product_details(product_id: str) -> str:
-    """Get detailed information about a specific product."""
-    try:
-        product = db.products.find_one({"product_id": product_id}, {"_id": 0})
-        if not product:
-            return f"Product {product_id} not found."
-        
-        return f"""
+def search_products(query: str, category: Optional[str] = None) -> str:
+    """Search products by name or category."""
+    return run(search_products_steps(query, category))
+
+async def asearch_products(query: str, category: Optional[str] = None) -> str:
+    return await arun(search_products_steps(query, category))
+
+search_products.coroutine = asearch_products
+
+def format_product_details(product: Dict[str, Any]) -> str:
+    return f"""
 Product ID: {product['product_id']}
 Name: {product['name']}
 Category: {product['category']}
@@ -131,48 +680,77 @@ Availability: {product['availability']} units in stock
 Description: {product['description']}
 Weather Suitable: {', '.join(product['weather_suitable'])}
         """.strip()
-        
+
+def get_product_details_steps(product_id: str) -> Steps:
+    try:
+        product = yield from load_product_steps(product_id)
+        if not product:
+            return f"Product {product_id} not found."
+
+        return format_product_details(product)
+
     except Exception as e:
         return f"Error getting product details: {str(e)}"
 
 @tool
-def get_product_recommendations(product_id: str) -> str:
-    """Get product recommendations based on a given product."""
+def get_product_details(product_id: str) -> str:
+    """Get detailed information about a specific product."""
+    return run(get_product_details_steps(product_id))
+
+async def aget_product_details(product_id: str) -> str:
+    return await arun(get_product_details_steps(product_id))
+
+get_product_details.coroutine = aget_product_details
+
+def format_recommendations(product: Dict[str, Any], recommended_products: List[Dict[str, Any]], similar: bool = False) -> str:
+    result = f"{'Similar products to' if similar else 'Recommendations for'} {product['name']}:\n\n"
+    for rec_product in recommended_products:
+        result += f"• {rec_product['name']} ({rec_product['product_id']})\n"
+        result += f"  Price: ${rec_product['price']} | Available: {rec_product['availability']}\n"
+        result += f"  {rec_product['description']}\n\n"
+
+    return result.strip()
+
+def get_product_recommendations_steps(product_id: str) -> Steps:
     try:
-        product = db.products.find_one({"product_id": product_id})
+        product = yield from load_product_steps(product_id)
         if not product:
             return f"Product {product_id} not found."
-        
+
         recommended_ids = product.get('recommendations', [])
+        similar = not recommended_ids and SIMILAR_PRODUCTS_ENABLED
+        if similar:
+            scope = similarity_scope()
+            if not similarity_index.is_built:
+                # One background load or build serves every caller; async callers wait off the event loop
+                similarity_index.build_in_background(all_products, scope)
+                if not (yield WaitForBuild(similarity_index)):
+                    return "Error getting recommendations: the similarity index could not be built"
+            similarity_index.ensure_built(all_products, scope)
+            recommended_ids = similarity_index.similar(product, 5)
         if not recommended_ids:
             return f"No recommendations available for {product['name']}"
-        
-        recommended_products = list(db.products.find(
-            {"product_id": {"$in": recommended_ids}}, 
-            {"_id": 0}
-        ))
-        
-        result = f"Recommendations for {product['name']}:\n\n"
-        for rec_product in recommended_products:
-            result += f"• {rec_product['name']} ({rec_product['product_id']})\n"
-            result += f"  Price: ${rec_product['price']} | Available: {rec_product['availability']}\n"
-            result += f"  {rec_product['description']}\n\n"
-        
-        return result.strip()
-        
+
+        recommended_products = yield from load_products_steps(recommended_ids)
+
+        return format_recommendations(product, recommended_products, similar)
+
     except Exception as e:
         return f"Error getting recommendations: {str(e)}"
 
-
 @tool
-def get_customer_info(customer_id: str) -> str:
-    """Retrieve customer information by customer ID."""
-    try:
-        customer = db.customers.find_one({"customer_id": customer_id}, {"_id": 0})
-        if not customer:
-            return f"Customer {customer_id} not found."
-        
-        return f"""
+def get_product_recommendations(product_id: str) -> str:
+    """Get product recommendations based on a given product."""
+    return run(get_product_recommendations_steps(product_id))
+
+async def aget_product_recommendations(product_id: str) -> str:
+    return await arun(get_product_recommendations_steps(product_id))
+
+get_product_recommendations.coroutine = aget_product_recommendations
+
+
+def format_customer_info(customer: Dict[str, Any]) -> str:
+    return f"""
 Customer ID: {customer['customer_id']}
 Name: {customer['name']}
 Email: {customer['email']}
@@ -182,135 +760,204 @@ Preferences: {', '.join(customer['preferences'])}
 Loyalty Points: {customer['loyalty_points']} points
 Membership Tier: {customer['membership_tier']}
         """.strip()
-        
+
+def get_customer_info_steps(customer_id: str) -> Steps:
+    try:
+        customer = yield from load_customer_steps(customer_id)
+        if not customer:
+            return f"Customer {customer_id} not found."
+
+        return format_customer_info(customer)
+
     except Exception as e:
         return f"Error getting customer info: {str(e)}"
 
 @tool
-def update_customer_preferences(customer_id: str, new_preferences: str) -> str:
-    """Update customer preferences (comma-separated list)."""
+def get_customer_info(customer_id: str) -> str:
+    """Retrieve customer information by customer ID."""
+    return run(get_customer_info_steps(customer_id))
+
+async def aget_customer_info(customer_id: str) -> str:
+    return await arun(get_customer_info_steps(customer_id))
+
+get_customer_info.coroutine = aget_customer_info
+
+def update_customer_preferences_steps(customer_id: str, new_preferences: str) -> Steps:
     try:
-        customer = db.customers.find_one({"customer_id": customer_id})
+        customer = yield from load_customer_steps(customer_id)
         if not customer:
             return f"Customer {customer_id} not found."
-        
+
         preferences_list = [pref.strip() for pref in new_preferences.split(',')]
-        
-        result = db.customers.update_one(
+
+        result = yield MongoCall(
+            "customers", "update_one",
             {"customer_id": customer_id},
             {"$set": {"preferences": preferences_list}}
         )
-        
+        notify_change("customers", customer_id)
+        forget("customers", [customer_id])
+
         if result.modified_count > 0:
             return f"Successfully updated preferences for {customer['name']} to: {', '.join(preferences_list)}"
         else:
             return f"Failed to update preferences for customer {customer_id}"
-            
+
     except Exception as e:
         return f"Error updating customer preferences: {str(e)}"
 
 @tool
-def check_loyalty_points(customer_id: str) -> str:
-    """Check customer's loyalty points and rewards."""
-    try:
-        customer = db.customers.find_one({"customer_id": customer_id})
-        if not customer:
-            return f"Customer {customer_id} not found."
-        
-        points = customer['loyalty_points']
-        tier = customer['membership_tier']
-        
-        # Calculate available rewards based on points
-        available_rewards = []
-        if points >= 500:
-            available_rewards.append("$5 discount coupon (500 points)")
-        if points >= 1000:
-            available_rewards.append("$10 discount coupon (1000 points)")
-        if points >= 2000:
-            available_rewards.append("Free shipping for 1 month (2000 points)")
-        
-        result = f"""
+def update_customer_preferences(customer_id: str, new_preferences: str) -> str:
+    """Update customer preferences (comma-separated list)."""
+    return run(update_customer_preferences_steps(customer_id, new_preferences))
+
+async def aupdate_customer_preferences(customer_id: str, new_preferences: str) -> str:
+    return await arun(update_customer_preferences_steps(customer_id, new_preferences))
+
+update_customer_preferences.coroutine = aupdate_customer_preferences
+
+def format_loyalty_points(customer: Dict[str, Any]) -> str:
+    points = customer['loyalty_points']
+    tier = customer['membership_tier']
+
+    # Calculate available rewards based on points
+    available_rewards = []
+    if points >= 500:
+        available_rewards.append("$5 discount coupon (500 points)")
+    if points >= 1000:
+        available_rewards.append("$10 discount coupon (1000 points)")
+    if points >= 2000:
+        available_rewards.append("Free shipping for 1 month (2000 points)")
+
+    result = f"""
 Customer: {customer['name']}
 Current Loyalty Points: {points}
 Membership Tier: {tier}
         """
-        
-        if available_rewards:
-            result += f"\nAvailable Rewards:\n" + "\n".join([f"• {reward}" for reward in available_rewards])
-        else:
-            result += f"\nNo rewards available yet. Earn {500 - points} more points for first reward!"
-        
-        return result.strip()
-        
+
+    if available_rewards:
+        result += f"\nAvailable Rewards:\n" + "\n".join([f"• {reward}" for reward in available_rewards])
+    else:
+        result += f"\nNo rewards available yet. Earn {500 - points} more points for first reward!"
+
+    return result.strip()
+
+def check_loyalty_points_steps(customer_id: str) -> Steps:
+    try:
+        customer = yield from load_customer_steps(customer_id)
+        if not customer:
+            return f"Customer {customer_id} not found."
+
+        return format_loyalty_points(customer)
+
     except Exception as e:
         return f"Error checking loyalty points: {str(e)}"
 
 @tool
-def get_current_weather(location: str) -> str:
-    """Get current weather for shipping estimates and recommendations."""
-    try:
-        #simulated data here in this api for demo purposes
-        # api_key = "your_openweather_api_key"
-        # url = f"http://api.openweathermap.org/data/2.5/weather?q={location}&appid={api_key}&units=metric"
-        
-        weather_conditions = {
-            "New York, NY": {"temp": 22, "condition": "rainy", "humidity": 78},
-            "Los Angeles, CA": {"temp": 28, "condition": "sunny", "humidity": 45},
-            "Chicago, IL": {"temp": 15, "condition": "cold", "humidity": 65},
-            "Miami, FL": {"temp": 32, "condition": "sunny", "humidity": 82}
-        }
-        
-        weather = weather_conditions.get(location, {"temp": 20, "condition": "mild", "humidity": 60})
-        
-        shipping_impact = "Normal delivery times expected"
-        if weather["condition"] == "rainy":
-            shipping_impact = "Possible 1-2 day delay due to weather"
-        elif weather["condition"] == "snowy":
-            shipping_impact = "Possible 2-3 day delay due to snow"
-        
-        return f"""
+def check_loyalty_points(customer_id: str) -> str:
+    """Check customer's loyalty points and rewards."""
+    return run(check_loyalty_points_steps(customer_id))
+
+async def acheck_loyalty_points(customer_id: str) -> str:
+    return await arun(check_loyalty_points_steps(customer_id))
+
+check_loyalty_points.coroutine = acheck_loyalty_points
+
+# Weather comes from the configured provider (weather.py), which caches it
+# per location and coalesces concurrent lookups.
+
+def load_weather_steps(location: str) -> Steps:
+    weather = recall("weather", location)
+    if weather is None:
+        weather = remember("weather", location, (yield WeatherLookup(location)))
+    return weather
+
+def load_weather(location: str) -> Dict[str, Any]:
+    return run(load_weather_steps(location))
+
+async def aload_weather(location: str) -> Dict[str, Any]:
+    return await arun(load_weather_steps(location))
+
+def format_current_weather(location: str, weather: Dict[str, Any]) -> str:
+    shipping_impact = "Normal delivery times expected"
+    if weather["condition"] == "rainy":
+        shipping_impact = "Possible 1-2 day delay due to weather"
+    elif weather["condition"] == "snowy":
+        shipping_impact = "Possible 2-3 day delay due to snow"
+
+    return f"""
 Weather in {location}:
 Temperature: {weather['temp']}°C
 Condition: {weather['condition'].title()}
 Humidity: {weather['humidity']}%
 Shipping Impact: {shipping_impact}
         """.strip()
-        
+
+def get_current_weather_steps(location: str) -> Steps:
+    try:
+        return format_current_weather(location, (yield from load_weather_steps(location)))
     except Exception as e:
         return f"Error getting weather info: {str(e)}"
 
 @tool
-def get_weather_based_recommendations(location: str) -> str:
-    """Get product recommendations based on current weather."""
+def get_current_weather(location: str) -> str:
+    """Get current weather for shipping estimates and recommendations."""
+    return run(get_current_weather_steps(location))
+
+async def aget_current_weather(location: str) -> str:
+    return await arun(get_current_weather_steps(location))
+
+get_current_weather.coroutine = aget_current_weather
+
+def format_weather_recommendations(location: str, condition: str, suitable_products: List[Dict[str, Any]]) -> str:
+    if not suitable_products:
+        return f"No specific weather-based recommendations for {location}"
+
+    result = f"Weather-based recommendations for {location} ({condition} weather):\n\n"
+    for product in suitable_products:
+        result += f"• {product['name']} - ${product['price']}\n"
+        result += f"  Perfect for {condition} weather! {product['description']}\n\n"
+
+    return result.strip()
+
+def customer_preferences(customer: Optional[Dict[str, Any]]) -> List[str]:
+    return list(customer.get("preferences") or []) if customer else []
+
+def get_weather_based_recommendations_steps(location: str, customer_id: Optional[str]) -> Steps:
     try:
-        weather_conditions = {
-            "New York, NY": "rainy",
-            "Los Angeles, CA": "sunny", 
-            "Chicago, IL": "cold",
-            "Miami, FL": "sunny"
-        }
-        
-        condition = weather_conditions.get(location, "mild")
-        
-        suitable_products = list(db.products.find(
-            {"weather_suitable": {"$in": [condition, "all_weather"]}},
-            {"_id": 0}
-        ).limit(5))
-        
-        if not suitable_products:
-            return f"No specific weather-based recommendations for {location}"
-        
-        result = f"Weather-based recommendations for {location} ({condition} weather):\n\n"
+        condition = (yield from load_weather_steps(location))["condition"]
+        preferences = customer_preferences((yield from load_customer_steps(customer_id))) if customer_id else []
+
+        if not weather_index.is_built:
+            # One background build serves every caller; async callers wait off the event loop
+            weather_index.build_in_background(all_products)
+            if not (yield WaitForBuild(weather_index)):
+                return "Error getting weather recommendations: the product index could not be built"
+        weather_index.ensure_built(all_products)
+        suitable_products = weather_index.recommend(condition, 5, preferences)
         for product in suitable_products:
-            result += f"• {product['name']} - ${product['price']}\n"
-            result += f"  Perfect for {condition} weather! {product['description']}\n\n"
-        
-        return result.strip()
-        
+            remember("products", product["product_id"], product)
+
+        return format_weather_recommendations(location, condition, suitable_products)
+
     except Exception as e:
         return f"Error getting weather recommendations: {str(e)}"
 
-order_tools = [check_order_status, cancel_order, process_return]
+@tool
+def get_weather_based_recommendations(location: str, customer_id: Optional[str] = None) -> str:
+    """Get product recommendations based on current weather. Pass the customer ID when known to rank their preferred categories first."""
+    return run(get_weather_based_recommendations_steps(location, customer_id))
+
+async def aget_weather_based_recommendations(location: str, customer_id: Optional[str] = None) -> str:
+    return await arun(get_weather_based_recommendations_steps(location, customer_id))
+
+get_weather_based_recommendations.coroutine = aget_weather_based_recommendations
+
+order_tools = [
+    check_order_status, cancel_order, process_return,
+    check_orders_status, bulk_cancel_orders, bulk_process_returns,
+    get_customer_order_history,
+]
 
 product_tools = [search_products, get_product_details, get_product_recommendations]
 
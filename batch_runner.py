@@ -0,0 +1,361 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from typing import Any, Dict, Iterator, Optional, Set, Tuple
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+
+# Runs a JSONL file of customer queries through ecommerce_system, many
+# conversations at once, within the provider's requests-per-minute and
+# tokens-per-minute limits. Every conversation reserves its expected LLM
+# calls and tokens from two token buckets before it starts and settles the
+# difference afterwards. Concurrency grows additively while calls succeed
+# and halves on a 429, and rate-limited conversations are retried with
+# exponential backoff, unless the failed attempt already ran a tool that
+# changes data: those are recorded as "partial" and never run again.
+# Results are appended to the output file as they finish; a rerun skips the
+# queries it already answered.
+#
+# Batch queries are one-off conversations, so conversation memory is off by
+# default; it must be set before main is imported.
+os.environ.setdefault("CHECKPOINT_ENABLED", "false")
+
+BATCH_RPM = float(os.getenv("BATCH_RPM", "500"))
+BATCH_TPM = float(os.getenv("BATCH_TPM", "200000"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "32"))
+BATCH_MAX_RETRIES = int(os.getenv("BATCH_MAX_RETRIES", "5"))
+# Starting guesses for one conversation; replaced by measured averages.
+BATCH_CALLS_PER_QUERY = float(os.getenv("BATCH_CALLS_PER_QUERY", "3"))
+BATCH_TOKENS_PER_QUERY = float(os.getenv("BATCH_TOKENS_PER_QUERY", "3000"))
+
+QUERY_FIELDS = ("query", "message", "body", "text")
+ID_FIELDS = ("id", "request_id", "query_id")
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 60.0
+# Tools whose effects a retry would repeat
+MUTATING_TOOLS = {
+    "cancel_order", "process_return", "bulk_cancel_orders", "bulk_process_returns", "update_customer_preferences",
+}
+
+
+class TokenBucket:
+    """Refills at per_minute / 60 per second and holds at most one minute's worth.
+
+    settle() may take the level below zero when a conversation used more than
+    it reserved; later acquires then wait until the debt is paid off.
+    """
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60
+        self.capacity = per_minute
+        self.level = per_minute
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float):
+        amount = min(amount, self.capacity)
+        # Waiters are served in arrival order
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.level >= amount:
+                    self.level -= amount
+                    return
+                await asyncio.sleep((amount - self.level) / self.rate)
+
+    def settle(self, amount: float):
+        """Charge (positive) or refund (negative) the difference to an earlier acquire."""
+        self._refill()
+        self.level = min(self.capacity, self.level - amount)
+
+
+class AdaptiveLimit:
+    """Concurrency limit with additive increase and multiplicative decrease (AIMD).
+
+    Until the first decrease every success adds a whole slot, so the limit
+    ramps up quickly to where the provider starts pushing back.
+    """
+
+    def __init__(self, maximum: int, initial: int = 4, minimum: int = 1):
+        self.maximum = maximum
+        self.minimum = minimum
+        self.limit = float(min(initial, maximum))
+        self.in_flight = 0
+        self._last_decrease: Optional[float] = None
+        self._condition = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self):
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def increase(self):
+        # After the first decrease: about one more slot per limit's worth of successes
+        step = 1 if self._last_decrease is None else 1 / self.limit
+        self.limit = min(self.maximum, self.limit + step)
+
+    def decrease(self, cooldown: float):
+        """Halve the limit, once per cooldown however many calls were rejected together."""
+        now = time.monotonic()
+        if self._last_decrease is None or now - self._last_decrease >= cooldown:
+            self.limit = max(self.minimum, self.limit / 2)
+            self._last_decrease = now
+
+
+class UsageCounter(BaseCallbackHandler):
+    """Counts the LLM calls and tokens of one conversation, and the data-changing tools it started."""
+
+    def __init__(self):
+        self.calls = 0
+        self.tokens = 0
+        self.mutations = []
+
+    def on_tool_start(self, serialized, input_str, **kwargs):
+        name = (serialized or {}).get("name") or kwargs.get("name")
+        if name in MUTATING_TOOLS:
+            self.mutations.append(name)
+
+    def on_llm_end(self, response, **kwargs):
+        self.calls += 1
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                self.tokens += usage.get("total_tokens", 0)
+
+
+def is_rate_limited(error: Exception) -> bool:
+    return getattr(error, "status_code", None) == 429 or type(error).__name__ == "RateLimitError"
+
+
+def is_retryable(error: Exception) -> bool:
+    status = getattr(error, "status_code", None)
+    return is_rate_limited(error) or (isinstance(status, int) and status >= 500) or isinstance(error, asyncio.TimeoutError)
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """The provider's Retry-After hint, if the error carries a response."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def read_queries(path: str, query_field: Optional[str] = None, id_field: Optional[str] = None) -> Iterator[Tuple[str, str]]:
+    """Stream (id, query) pairs from a JSONL file; lines without an ID are numbered."""
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            query_key = query_field or next((field for field in QUERY_FIELDS if field in record), None)
+            id_key = id_field or next((field for field in ID_FIELDS if field in record), None)
+            if query_key is None or not record.get(query_key):
+                print(f"⚠️ Line {number} has no query, skipped")
+                continue
+            yield str(record[id_key]) if id_key else f"line-{number}", str(record[query_key])
+
+
+def completed_ids(path: str) -> Set[str]:
+    """IDs already answered or partly run in an earlier run; failed queries are tried again."""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A line cut off by a crash
+                continue
+            # A partial query already changed data; running it again would repeat that
+            if record.get("status") in ("ok", "partial"):
+                done.add(record["id"])
+    return done
+
+
+class BatchRunner:
+    """Runs queries through the graph under shared rate budgets; see the module comment."""
+
+    def __init__(self, system=None, rpm: float = BATCH_RPM, tpm: float = BATCH_TPM,
+                 max_concurrency: int = BATCH_MAX_CONCURRENCY, max_retries: int = BATCH_MAX_RETRIES):
+        if system is None:
+            import main as system
+        self.system = system
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.concurrency = AdaptiveLimit(max_concurrency)
+        self.max_retries = max_retries
+        self.calls_per_query = BATCH_CALLS_PER_QUERY
+        self.tokens_per_query = BATCH_TOKENS_PER_QUERY
+        # Nothing new starts before this time after the provider pushed back
+        self.paused_until = 0.0
+        self.stats = {"ok": 0, "error": 0, "partial": 0, "skipped": 0, "retries": 0, "rate_limited": 0,
+                      "calls": 0, "tokens": 0}
+
+    def _learn(self, usage: UsageCounter):
+        if usage.calls:
+            self.calls_per_query = 0.9 * self.calls_per_query + 0.1 * usage.calls
+        if usage.tokens:
+            self.tokens_per_query = 0.9 * self.tokens_per_query + 0.1 * usage.tokens
+
+    async def _attempt(self, query: str, usage: UsageCounter) -> Dict[str, Any]:
+        calls, tokens = self.calls_per_query, self.tokens_per_query
+        await self.requests.acquire(calls)
+        await self.tokens.acquire(tokens)
+        config = {"callbacks": [usage], "configurable": {"thread_id": uuid.uuid4().hex}}
+        answers = []
+        try:
+            async for event in self.system.astream_events(query, config):
+                if event["type"] == "answer":
+                    answers.append({"agent": event["agent"], "text": event["text"]})
+        finally:
+            self.requests.settle(usage.calls - calls)
+            self.tokens.settle(usage.tokens - tokens)
+            self.stats["calls"] += usage.calls
+            self.stats["tokens"] += usage.tokens
+            await self._drop_thread(config["configurable"]["thread_id"])
+        return {"answers": answers}
+
+    async def _drop_thread(self, thread_id: str):
+        """Delete the conversation's checkpoints if the graph keeps any; batch threads are never resumed."""
+        checkpointer = getattr(getattr(self.system, "ecommerce_system", None), "checkpointer", None)
+        if checkpointer:
+            await checkpointer.adelete_thread(thread_id)
+
+    async def run_one(self, query_id: str, query: str) -> Dict[str, Any]:
+        started = time.perf_counter()
+        for attempt in range(1, self.max_retries + 2):
+            delay = self.paused_until - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await self.concurrency.acquire()
+            usage = UsageCounter()
+            error = None
+            try:
+                result = await self._attempt(query, usage)
+            except Exception as e:
+                error = e
+            finally:
+                await self.concurrency.release()
+
+            if error is None:
+                self.concurrency.increase()
+                self._learn(usage)
+                return {"id": query_id, "query": query, "status": "ok", **result, "attempts": attempt,
+                        "llm_calls": usage.calls, "tokens": usage.tokens,
+                        "latency_ms": round((time.perf_counter() - started) * 1000, 1)}
+            if usage.mutations:
+                # A retry would run the conversation again from the start and repeat these changes
+                return {"id": query_id, "query": query, "status": "partial", "error": f"{type(error).__name__}: {str(error)}",
+                        "mutating_tools": usage.mutations, "attempts": attempt,
+                        "latency_ms": round((time.perf_counter() - started) * 1000, 1)}
+            if not is_retryable(error) or attempt > self.max_retries:
+                return {"id": query_id, "query": query, "status": "error", "error": f"{type(error).__name__}: {str(error)}",
+                        "attempts": attempt, "latency_ms": round((time.perf_counter() - started) * 1000, 1)}
+            backoff = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** (attempt - 1))
+            backoff = retry_after(error) or backoff * random.uniform(0.5, 1.0)
+            if is_rate_limited(error):
+                self.stats["rate_limited"] += 1
+                self.concurrency.decrease(cooldown=backoff)
+                self.paused_until = max(self.paused_until, time.monotonic() + backoff)
+            self.stats["retries"] += 1
+            # The slot is free while this conversation backs off
+            await asyncio.sleep(backoff)
+
+    async def run(self, input_path: str, output_path: str, query_field: Optional[str] = None,
+                  id_field: Optional[str] = None, limit: Optional[int] = None, progress_every: int = 50) -> Dict[str, Any]:
+        """Answer every query of input_path not yet in output_path, appending results as they finish."""
+        done = completed_ids(output_path)
+        started = time.perf_counter()
+        pending: Set[asyncio.Task] = set()
+        # Reading ahead is bounded, so the input file is streamed, not loaded
+        read_ahead = 2 * self.concurrency.maximum
+        finished = 0
+
+        with open(output_path, "a", encoding="utf-8") as output:
+            if output.tell() and not self._ends_with_newline(output_path):
+                output.write("\n")
+
+            def write(task: asyncio.Task):
+                nonlocal finished
+                record = task.result()
+                self.stats[record["status"]] += 1
+                output.write(json.dumps(record, default=str) + "\n")
+                output.flush()
+                finished += 1
+                if progress_every and finished % progress_every == 0:
+                    self._report(finished, time.perf_counter() - started)
+
+            for number, (query_id, query) in enumerate(read_queries(input_path, query_field, id_field)):
+                if limit is not None and number >= limit:
+                    break
+                if query_id in done:
+                    self.stats["skipped"] += 1
+                    continue
+                while len(pending) >= read_ahead:
+                    completed, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in completed:
+                        write(task)
+                pending.add(asyncio.create_task(self.run_one(query_id, query)))
+            while pending:
+                completed, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in completed:
+                    write(task)
+
+        elapsed = time.perf_counter() - started
+        self._report(finished, elapsed)
+        return {**self.stats, "elapsed_s": round(elapsed, 2), "concurrency": round(self.concurrency.limit, 1)}
+
+    @staticmethod
+    def _ends_with_newline(path: str) -> bool:
+        with open(path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def _report(self, finished: int, elapsed: float):
+        minutes = max(elapsed, 1e-9) / 60
+        print(f"📦 {finished} done ({self.stats['ok']} ok, {self.stats['error']} failed, {self.stats['partial']} partial, "
+              f"{self.stats['skipped']} skipped), "
+              f"concurrency {self.concurrency.limit:.1f}, {self.stats['calls'] / minutes:.0f} calls/min, "
+              f"{self.stats['tokens'] / minutes:.0f} tokens/min, {self.stats['rate_limited']} rate-limited")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Run a JSONL file of customer queries through the assistant.")
+    parser.add_argument("input", help="JSONL file with one query per line")
+    parser.add_argument("--output", default="batch_results.jsonl", help="results are appended here; rerunning resumes")
+    parser.add_argument("--query-field", help=f"field holding the query (default: first of {', '.join(QUERY_FIELDS)})")
+    parser.add_argument("--id-field", help=f"field holding the query ID (default: first of {', '.join(ID_FIELDS)})")
+    parser.add_argument("--rpm", type=float, default=BATCH_RPM, help="LLM requests per minute")
+    parser.add_argument("--tpm", type=float, default=BATCH_TPM, help="LLM tokens per minute")
+    parser.add_argument("--max-concurrency", type=int, default=BATCH_MAX_CONCURRENCY)
+    parser.add_argument("--max-retries", type=int, default=BATCH_MAX_RETRIES)
+    parser.add_argument("--limit", type=int, help="only the first N queries of the file")
+    args = parser.parse_args(argv)
+
+    runner = BatchRunner(rpm=args.rpm, tpm=args.tpm, max_concurrency=args.max_concurrency, max_retries=args.max_retries)
+    stats = asyncio.run(runner.run(args.input, args.output, args.query_field, args.id_field, args.limit))
+    print(f"✅ Batch finished in {stats['elapsed_s']}s: {stats['ok']} ok, {stats['error']} failed, "
+          f"{stats['partial']} partial, {stats['skipped']} already done, {stats['retries']} retries")
+    return 0 if stats["error"] == 0 and stats["partial"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,666 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import re
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+# The benchmark never talks to OpenAI and seeds its own database, so these
+# must be set before main/agent_tools are imported.
+os.environ.setdefault("OPENAI_API_KEY", "offline-benchmark")
+os.environ.setdefault("ENSURE_INDEXES_ON_STARTUP", "false")
+os.environ.setdefault("CHECKPOINT_ENABLED", "false")
+
+import pymongo
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+import agent_tools
+from cache import cache_stats, notify_change
+from db_indexes import ensure_indexes
+from pre_router import pre_router, last_user_index, answered_agents, RouterStats
+
+
+# Replays a query corpus through the full supervisor graph with a scripted
+# chat model and a local or in-memory Mongo, then reports hops, tool calls,
+# per-node latency and tool microbenchmarks as JSON. With --baseline the run
+# fails when it is slower or does more work than the baseline. --mode async
+# replays through the async graph (astream, as astream_query does), with
+# async tools and prefetch on the event loop.
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_queries.jsonl")
+BENCHMARK_DB_NAME = "ecommerce_benchmark"
+DEFAULT_LOCATION = "New York, NY"
+
+ORDER_ID = re.compile(r"\bORD\d+\b", re.IGNORECASE)
+PRODUCT_ID = re.compile(r"\bPRD\d+\b", re.IGNORECASE)
+CUSTOMER_ID = re.compile(r"\bCUST\d+\b", re.IGNORECASE)
+LOCATION = re.compile(r"\b((?:[A-Z][a-z]+ )*[A-Z][a-z]+, [A-Z]{2})\b")
+CATEGORY = re.compile(r"\bin (Electronics|Clothing|Footwear|Fitness|Accessories|Outdoor|Home)\b", re.IGNORECASE)
+
+
+def ids(pattern, text: str) -> List[str]:
+    return list(dict.fromkeys(match.upper() for match in pattern.findall(text)))
+
+
+def script_tool_call(tool_names: List[str], text: str) -> Optional[Dict[str, Any]]:
+    """Pick the tool call a well-behaved agent would make for the query."""
+    lower = text.lower()
+    orders, products, customers = ids(ORDER_ID, text), ids(PRODUCT_ID, text), ids(CUSTOMER_ID, text)
+    location = LOCATION.search(text)
+    location = location.group(1) if location else DEFAULT_LOCATION
+    category = CATEGORY.search(text)
+    preferences = re.search(r"\bto (.+)$", text)
+
+    candidates = [
+        ("bulk_cancel_orders", len(orders) > 1 and "cancel" in lower, {"order_ids": orders}),
+        ("bulk_process_returns", len(orders) > 1 and "return" in lower, {"order_ids": orders}),
+        ("check_orders_status", len(orders) > 1, {"order_ids": orders}),
+        ("cancel_order", bool(orders) and "cancel" in lower, {"order_id": orders[:1] and orders[0]}),
+        ("process_return", bool(orders) and "return" in lower, {"order_id": orders[:1] and orders[0]}),
+        ("check_order_status", bool(orders), {"order_id": orders[:1] and orders[0]}),
+        ("get_customer_order_history", bool(customers) and "history" in lower, {"customer_id": customers[:1] and customers[0]}),
+        ("get_product_recommendations", bool(products) and re.search(r"recommend|similar|like", lower) is not None,
+         {"product_id": products[:1] and products[0]}),
+        ("get_product_details", bool(products), {"product_id": products[:1] and products[0]}),
+        ("search_products", True, {"query": text, **({"category": category.group(1)} if category else {})}),
+        ("check_loyalty_points", bool(customers) and re.search(r"points|loyalty", lower) is not None,
+         {"customer_id": customers[:1] and customers[0]}),
+        ("update_customer_preferences", bool(customers) and "preferences" in lower and preferences is not None,
+         {"customer_id": customers[:1] and customers[0], "new_preferences": preferences and preferences.group(1)}),
+        ("get_customer_info", bool(customers), {"customer_id": customers[:1] and customers[0]}),
+        ("get_weather_based_recommendations", re.search(r"recommend|suggest|products|gear|wear", lower) is not None,
+         {"location": location}),
+        ("get_current_weather", True, {"location": location}),
+    ]
+    for name, applies, args in candidates:
+        if applies and name in tool_names:
+            return {"name": name, "args": args}
+    return None
+
+
+class ScriptedChatModel(BaseChatModel):
+    """Deterministic stand-in for ChatOpenAI.
+
+    Supervisor calls route to the agents the query mentions that have not
+    answered yet; agent calls make one scripted tool call and then answer with
+    the tool output. A corpus entry can pin "route" and "tool_calls" for its
+    query. latency_ms adds a fixed delay to every call to mimic the network.
+    """
+
+    model_name: str = "scripted"
+    tools: List[Dict[str, Any]] = []
+    script: Dict[str, Dict[str, Any]] = {}
+    latency_ms: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def bind_tools(self, tools, **kwargs):
+        return self.model_copy(update={"tools": [convert_to_openai_tool(t) for t in tools]})
+
+    def _tool_call(self, name: str, args: Dict[str, Any]) -> Dict[str, Any]:
+        return {"name": name, "args": args, "id": f"call_{uuid.uuid4().hex[:12]}"}
+
+    def respond(self, messages) -> AIMessage:
+        tool_names = [t["function"]["name"] for t in self.tools]
+        user_index = last_user_index(messages)
+        query = messages[user_index].content if user_index >= 0 else ""
+        entry = self.script.get(query, {})
+
+        if "Router" in tool_names or "RouterPlan" in tool_names:
+            route = entry.get("route") or [intent.agent for intent in pre_router.detect_intents(query)]
+            answered = answered_agents(messages)
+            remaining = [agent for agent in dict.fromkeys(route) if agent not in answered] or ["FINISH"]
+            if "RouterPlan" in tool_names:
+                return AIMessage("", tool_calls=[self._tool_call("RouterPlan", {"next": remaining})])
+            return AIMessage("", tool_calls=[self._tool_call("Router", {"next": remaining[0]})])
+
+        if isinstance(messages[-1], ToolMessage):
+            results = []
+            for message in reversed(messages):
+                if not isinstance(message, ToolMessage):
+                    break
+                results.insert(0, str(message.content))
+            return AIMessage("\n\n".join(results))
+
+        scripted = [call for call in entry.get("tool_calls", []) if call["name"] in tool_names]
+        call = scripted[0] if scripted else script_tool_call(tool_names, query)
+        if call is None:
+            return AIMessage("I'm sorry, I can't help with that request.")
+        return AIMessage("", tool_calls=[self._tool_call(call["name"], call["args"])])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        return ChatResult(generations=[ChatGeneration(message=self.respond(messages))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        return ChatResult(generations=[ChatGeneration(message=self.respond(messages))])
+
+
+class QueryMetrics(BaseCallbackHandler):
+    """Callback handler that times graph nodes, tool calls and model calls for one query."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started: Dict[uuid.UUID, tuple] = {}
+        self.nodes: Dict[str, List[float]] = {}
+        self.tools: Dict[str, List[float]] = {}
+        self.llm_ms: List[float] = []
+
+    def _start(self, run_id, kind: str, name: str):
+        with self._lock:
+            self._started[run_id] = (kind, name, time.perf_counter())
+
+    def _end(self, run_id):
+        with self._lock:
+            started = self._started.pop(run_id, None)
+            if started is None:
+                return
+            kind, name, start = started
+            elapsed = (time.perf_counter() - start) * 1000
+            if kind == "llm":
+                self.llm_ms.append(elapsed)
+            else:
+                target = self.nodes if kind == "node" else self.tools
+                target.setdefault(name, []).append(elapsed)
+
+    def on_chain_start(self, serialized, inputs, *, run_id, metadata=None, **kwargs):
+        node = (metadata or {}).get("langgraph_node")
+        if node and kwargs.get("name") == node:
+            self._start(run_id, "node", node)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self._start(run_id, "tool", (serialized or {}).get("name") or kwargs.get("name", "tool"))
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._start(run_id, "llm", "llm")
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id)
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Linearly interpolated percentile."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    low, high = math.floor(rank), math.ceil(rank)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def latency_summary(values: List[float]) -> Dict[str, float]:
+    return {
+        "count": len(values),
+        "p50": round(percentile(values, 50), 3),
+        "p95": round(percentile(values, 95), 3),
+        "p99": round(percentile(values, 99), 3),
+        "mean": round(sum(values) / len(values), 3) if values else 0.0,
+        "max": round(max(values), 3) if values else 0.0,
+    }
+
+
+def load_corpus(path: str) -> List[Dict[str, Any]]:
+    """Read a JSONL corpus; each line needs a "query" and may pin "route" and "tool_calls"."""
+    entries = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                entries.append(json.loads(line))
+    return entries
+
+
+def connect_database(mongo: str):
+    """"memory" gives an in-process mongomock database; anything else is a Mongo URI."""
+    if mongo == "memory":
+        try:
+            import mongomock
+        except ImportError:
+            raise SystemExit("The in-memory Mongo needs mongomock (pip install mongomock), or pass --mongo <uri>.")
+        return mongomock.MongoClient()[BENCHMARK_DB_NAME]
+    return pymongo.MongoClient(mongo)[BENCHMARK_DB_NAME]
+
+
+class AsyncCursor:
+    """Async cursor facade over a mongomock cursor, for the async replay mode."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def sort(self, *args, **kwargs):
+        self._cursor = self._cursor.sort(*args, **kwargs)
+        return self
+
+    def limit(self, limit: int):
+        self._cursor = self._cursor.limit(limit)
+        return self
+
+    async def to_list(self, length: Optional[int] = None) -> List[Dict[str, Any]]:
+        documents = list(self._cursor)
+        return documents if length is None else documents[:length]
+
+
+class AsyncCollection:
+    """Async facade over a mongomock collection: calls run inline and are returned as coroutines."""
+
+    def __init__(self, collection):
+        self._collection = collection
+
+    def find(self, *args, **kwargs) -> AsyncCursor:
+        return AsyncCursor(self._collection.find(*args, **kwargs))
+
+    def __getattr__(self, name: str):
+        method = getattr(self._collection, name)
+
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+
+        return call
+
+
+class AsyncDatabase:
+    def __init__(self, database):
+        self._database = database
+
+    def __getitem__(self, name: str) -> AsyncCollection:
+        return AsyncCollection(self._database[name])
+
+    def __getattr__(self, name: str) -> AsyncCollection:
+        return AsyncCollection(self._database[name])
+
+
+def use_async_database(mongo: str, database):
+    """Point agent_tools' async path at the benchmark database."""
+    if mongo == "memory":
+        async_database = AsyncDatabase(database)
+        agent_tools.get_async_db = lambda: async_database
+    else:
+        agent_tools.MONGODB_URI = mongo
+        agent_tools.DB_NAME = BENCHMARK_DB_NAME
+
+
+def seed_database(database, products: int = 0, customers: int = 0, orders: int = 0, seed: int = 42):
+    """Load the demo dataset, or a synthetic one when any volume is given."""
+    for collection in ("orders", "products", "customers"):
+        database[collection].delete_many({})
+    if products or customers or orders:
+        from data_generator import chunk_rng, generate_customers, generate_orders, generate_products
+
+        counts = {"products": products or 500, "customers": customers or 2_000, "orders": orders or 10_000}
+        now = datetime.now().replace(microsecond=0)
+        database.products.insert_many(generate_products(
+            chunk_rng(seed, "products", 0), seed, range(1, counts["products"] + 1), counts["products"]))
+        database.customers.insert_many(generate_customers(
+            chunk_rng(seed, "customers", 0), range(1, counts["customers"] + 1), counts["customers"]))
+        database.orders.insert_many(generate_orders(
+            chunk_rng(seed, "orders", 0), seed, range(1, counts["orders"] + 1), counts, now))
+    else:
+        from mongodb_population import sample_customers, sample_orders, sample_products
+
+        database.orders.insert_many([dict(order) for order in sample_orders])
+        database.products.insert_many([dict(product) for product in sample_products])
+        database.customers.insert_many([dict(customer) for customer in sample_customers])
+    ensure_indexes(database)
+
+
+def reset_state(database, seed_args: Dict[str, int]):
+    """Reseed Mongo and drop every cache so each iteration starts from the same data."""
+    seed_database(database, **seed_args)
+    notify_change("products", None)
+    notify_change("customers", None)
+
+
+def run_query(graph, entry: Dict[str, Any]) -> Dict[str, Any]:
+    metrics = QueryMetrics()
+    error = None
+    started = time.perf_counter()
+    try:
+        graph.invoke({"messages": [HumanMessage(entry["query"])]}, config={"callbacks": [metrics]})
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    return query_result(entry, metrics, (time.perf_counter() - started) * 1000, error)
+
+
+async def arun_query(graph, entry: Dict[str, Any]) -> Dict[str, Any]:
+    from main import STREAM_MODES
+
+    metrics = QueryMetrics()
+    error = None
+    started = time.perf_counter()
+    try:
+        async for _ in graph.astream({"messages": [HumanMessage(entry["query"])]}, config={"callbacks": [metrics]},
+                                     stream_mode=STREAM_MODES, subgraphs=True):
+            pass
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    return query_result(entry, metrics, (time.perf_counter() - started) * 1000, error)
+
+
+def replay_corpus(graph, corpus, concurrency: int, mode: str) -> List[Dict[str, Any]]:
+    """One pass over the corpus with up to concurrency queries in flight, on threads or on one event loop."""
+    if mode == "async":
+        async def replay():
+            slots = asyncio.Semaphore(concurrency)
+
+            async def one(entry):
+                async with slots:
+                    return await arun_query(graph, entry)
+
+            return await asyncio.gather(*(one(entry) for entry in corpus))
+
+        return asyncio.run(replay())
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(lambda entry: run_query(graph, entry), corpus))
+
+
+def query_result(entry: Dict[str, Any], metrics: QueryMetrics, latency: float, error: Optional[str]) -> Dict[str, Any]:
+    return {
+        "query": entry["query"],
+        "latency_ms": round(latency, 3),
+        "supervisor_hops": len(metrics.nodes.get("supervisor", [])),
+        "tool_calls": sum(len(calls) for calls in metrics.tools.values()),
+        "llm_calls": len(metrics.llm_ms),
+        "tools": sorted(metrics.tools),
+        "node_ms": {name: round(sum(values), 3) for name, values in metrics.nodes.items()},
+        "error": error,
+        "_nodes": metrics.nodes,
+        "_tools": metrics.tools,
+    }
+
+
+def run_replay(graph, corpus, database, seed_args, iterations: int, warmup: int, concurrency: int, mode: str = "sync"):
+    """Replay the corpus and summarise latency, throughput and work per query."""
+    for _ in range(warmup):
+        reset_state(database, seed_args)
+        replay_corpus(graph, corpus, 1, mode)
+
+    pre_router.stats = RouterStats()
+    results = []
+    wall = 0.0
+    for _ in range(iterations):
+        reset_state(database, seed_args)
+        started = time.perf_counter()
+        results += replay_corpus(graph, corpus, concurrency, mode)
+        wall += time.perf_counter() - started
+
+    node_latencies: Dict[str, List[float]] = {}
+    tool_latencies: Dict[str, List[float]] = {}
+    for result in results:
+        for name, values in result.pop("_nodes").items():
+            node_latencies.setdefault(name, []).extend(values)
+        for name, values in result.pop("_tools").items():
+            tool_latencies.setdefault(name, []).extend(values)
+
+    count = len(results)
+
+    def work(key):
+        total = sum(result[key] for result in results)
+        return {"total": total, "mean": round(total / count, 4) if count else 0.0}
+
+    summary = {
+        "queries": count,
+        "errors": sum(1 for result in results if result["error"]),
+        "wall_seconds": round(wall, 4),
+        "throughput_qps": round(count / wall, 3) if wall else 0.0,
+        "latency_ms": latency_summary([result["latency_ms"] for result in results]),
+        "supervisor_hops": work("supervisor_hops"),
+        "tool_calls": work("tool_calls"),
+        "llm_calls": work("llm_calls"),
+        "nodes": {name: latency_summary(values) for name, values in sorted(node_latencies.items())},
+        "graph_tools": {name: latency_summary(values) for name, values in sorted(tool_latencies.items())},
+    }
+    return results, summary
+
+
+def tool_cases(database) -> List[Dict[str, Any]]:
+    """Representative arguments for every agent tool, taken from the seeded data."""
+    order_ids = [order["order_id"] for order in database.orders.find({}, {"order_id": 1}).sort("order_id", 1).limit(10)]
+    cancellable = [order["order_id"] for order in database.orders.find({"can_cancel": True}, {"order_id": 1}).limit(10)]
+    returnable = [order["order_id"] for order in database.orders.find({"can_return": True}, {"order_id": 1}).limit(10)]
+    product = database.products.find_one({}, sort=[("product_id", 1)])
+    customer_id = database.orders.find_one({}, sort=[("order_id", 1)])["customer_id"]
+    search_term = product["name"].split()[-1]
+
+    cases = [
+        {"tool": "check_order_status", "args": {"order_id": order_ids[0]}},
+        {"tool": "check_orders_status", "args": {"order_ids": order_ids}},
+        {"tool": "get_customer_order_history", "args": {"customer_id": customer_id}},
+        {"tool": "search_products", "args": {"query": search_term}},
+        {"tool": "search_products", "label": "search_products (category)",
+         "args": {"query": search_term, "category": product["category"]}},
+        {"tool": "get_product_details", "args": {"product_id": product["product_id"]}},
+        {"tool": "get_product_recommendations", "args": {"product_id": product["product_id"]}},
+        {"tool": "get_customer_info", "args": {"customer_id": customer_id}},
+        {"tool": "check_loyalty_points", "args": {"customer_id": customer_id}},
+        {"tool": "update_customer_preferences", "args": {"customer_id": customer_id, "new_preferences": "Electronics, Fitness"},
+         "restore": ("customers", {"customer_id": customer_id})},
+        {"tool": "get_current_weather", "args": {"location": DEFAULT_LOCATION}},
+        {"tool": "get_weather_based_recommendations", "args": {"location": DEFAULT_LOCATION}},
+    ]
+    # Mutating tools are measured on the success path: the documents they
+    # touch are restored (untimed) before every call.
+    if cancellable:
+        cases += [
+            {"tool": "cancel_order", "args": {"order_id": cancellable[0]},
+             "restore": ("orders", {"order_id": cancellable[0]})},
+            {"tool": "bulk_cancel_orders", "args": {"order_ids": cancellable},
+             "restore": ("orders", {"order_id": {"$in": cancellable}})},
+        ]
+    if returnable:
+        cases += [
+            {"tool": "process_return", "args": {"order_id": returnable[0], "reason": "Benchmark"},
+             "restore": ("orders", {"order_id": returnable[0]})},
+            {"tool": "bulk_process_returns", "args": {"order_ids": returnable, "reason": "Benchmark"},
+             "restore": ("orders", {"order_id": {"$in": returnable}})},
+        ]
+    return cases
+
+
+def run_tool_benchmarks(database, iterations: int) -> Dict[str, Dict[str, Any]]:
+    """Time each agent tool directly: one cold call with empty caches, then warm calls."""
+    tools = {
+        t.name: t
+        for t in agent_tools.order_tools + agent_tools.product_tools
+        + agent_tools.customer_tools + agent_tools.weather_tools
+    }
+    report = {}
+    for case in tool_cases(database):
+        tool = tools[case["tool"]]
+        snapshot = []
+        if case.get("restore"):
+            collection, query = case["restore"]
+            snapshot = list(database[collection].find(query))
+
+        def restore():
+            for document in snapshot:
+                database[collection].replace_one({"_id": document["_id"]}, document)
+            if snapshot and collection == "customers":
+                notify_change("customers", None)
+
+        notify_change("products", None)
+        notify_change("customers", None)
+        timings = []
+        output = ""
+        for _ in range(iterations + 1):
+            restore()
+            started = time.perf_counter()
+            output = tool.invoke(case["args"])
+            timings.append((time.perf_counter() - started) * 1000)
+        restore()
+
+        cold, warm = timings[0], timings[1:]
+        stats = latency_summary(warm)
+        report[case.get("label", case["tool"])] = {
+            "iterations": len(warm),
+            "cold_ms": round(cold, 3),
+            "p50_ms": stats["p50"],
+            "p95_ms": stats["p95"],
+            "p99_ms": stats["p99"],
+            "mean_ms": stats["mean"],
+            "ops_per_sec": round(1000 / stats["mean"], 1) if stats["mean"] else 0.0,
+            "error": str(output).startswith("Error"),
+        }
+    return report
+
+
+def find_regressions(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float, min_delta_ms: float) -> List[str]:
+    """Compare a run with a baseline report and describe everything that got worse."""
+    failures = []
+
+    def slower(label: str, now: float, before: float):
+        if before and now > before * (1 + tolerance) and now - before > min_delta_ms:
+            failures.append(f"{label}: {before:.3f} ms -> {now:.3f} ms (+{(now / before - 1):.0%})")
+
+    summary, previous = current["summary"], baseline.get("summary", {})
+    if previous:
+        for pct in ("p50", "p95", "p99"):
+            slower(f"query latency {pct}", summary["latency_ms"][pct], previous["latency_ms"][pct])
+        if summary["throughput_qps"] < previous["throughput_qps"] / (1 + tolerance):
+            failures.append(f"throughput: {previous['throughput_qps']} -> {summary['throughput_qps']} queries/s")
+        # Work per query is deterministic with the scripted model, so any increase is a regression.
+        for key in ("supervisor_hops", "tool_calls", "llm_calls"):
+            if summary[key]["mean"] > previous[key]["mean"] + 1e-9:
+                failures.append(f"{key} per query: {previous[key]['mean']} -> {summary[key]['mean']}")
+        if summary["errors"] > previous["errors"]:
+            failures.append(f"errors: {previous['errors']} -> {summary['errors']}")
+
+    for name, stats in current.get("tools", {}).items():
+        before = baseline.get("tools", {}).get(name)
+        if before:
+            slower(f"{name} p95", stats["p95_ms"], before["p95_ms"])
+            if stats["error"] and not before["error"]:
+                failures.append(f"{name}: now returns an error")
+    return failures
+
+
+def print_report(report: Dict[str, Any]):
+    summary = report["summary"]
+    latency = summary["latency_ms"]
+    print(f"📊 {summary['queries']} queries, {summary['errors']} error(s), "
+          f"{summary['throughput_qps']} queries/s")
+    print(f"⏱️ Latency p50 {latency['p50']} ms, p95 {latency['p95']} ms, p99 {latency['p99']} ms")
+    print(f"🔁 Per query: {summary['supervisor_hops']['mean']} supervisor hop(s), "
+          f"{summary['tool_calls']['mean']} tool call(s), {summary['llm_calls']['mean']} LLM call(s)")
+    for name, stats in summary["nodes"].items():
+        print(f"   node {name}: p50 {stats['p50']} ms, p95 {stats['p95']} ms ({stats['count']} runs)")
+    for name, stats in report.get("tools", {}).items():
+        marker = "❌" if stats["error"] else "🔧"
+        print(f"{marker} {name}: p50 {stats['p50_ms']} ms, p95 {stats['p95_ms']} ms, "
+              f"cold {stats['cold_ms']} ms, {stats['ops_per_sec']} ops/s")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Offline replay benchmark for the e-commerce multi-agent system.")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="JSONL file with one {\"query\": ...} per line")
+    parser.add_argument("--iterations", type=int, default=3, help="times to replay the corpus")
+    parser.add_argument("--warmup", type=int, default=1, help="untimed replays before measuring")
+    parser.add_argument("--concurrency", type=int, default=1, help="queries in flight at once")
+    parser.add_argument("--mode", choices=("sync", "async"), default="sync",
+                        help="replay through the sync graph on threads or the async graph on one event loop")
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="simulated delay per model call")
+    parser.add_argument("--mongo", default="memory", help="\"memory\" (mongomock) or a Mongo URI")
+    parser.add_argument("--products", type=int, default=0, help="synthetic products instead of the demo data")
+    parser.add_argument("--customers", type=int, default=0, help="synthetic customers instead of the demo data")
+    parser.add_argument("--orders", type=int, default=0, help="synthetic orders instead of the demo data")
+    parser.add_argument("--tool-iterations", type=int, default=200, help="warm calls per tool microbenchmark")
+    parser.add_argument("--skip-tools", action="store_true", help="skip the tool microbenchmarks")
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--baseline", help="JSON report to compare against; regressions exit with status 1")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown against the baseline")
+    parser.add_argument("--min-delta-ms", type=float, default=0.5, help="ignore slowdowns smaller than this")
+    parser.add_argument("--verbose", action="store_true", help="show the graph's own output")
+    args = parser.parse_args(argv)
+
+    corpus = load_corpus(args.corpus)
+    seed_args = {"products": args.products, "customers": args.customers, "orders": args.orders}
+    database = connect_database(args.mongo)
+    seed_database(database, **seed_args)
+    agent_tools.db = database
+    use_async_database(args.mongo, database)
+
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    with quiet:
+        from main import build_ecommerce_system
+
+        model = ScriptedChatModel(
+            script={entry["query"]: entry for entry in corpus},
+            latency_ms=args.llm_latency_ms,
+        )
+        graph = build_ecommerce_system(model)
+        queries, summary = run_replay(
+            graph, corpus, database, seed_args, args.iterations, args.warmup, args.concurrency, args.mode
+        )
+        tools = {} if args.skip_tools else run_tool_benchmarks(database, args.tool_iterations)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "corpus": os.path.basename(args.corpus),
+            "mongo": "memory" if args.mongo == "memory" else "uri",
+            **{key: getattr(args, key) for key in ("mode", "iterations", "warmup", "concurrency", "llm_latency_ms")},
+            **seed_args,
+        },
+        "summary": summary,
+        "queries": queries,
+        "tools": tools,
+        "pre_router": pre_router.stats.snapshot(),
+        "cache": cache_stats(),
+    }
+    print_report(report)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Report written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        failures = find_regressions(report, baseline, args.tolerance, args.min_delta_ms)
+        if failures:
+            print(f"\n❌ {len(failures)} regression(s) against {args.baseline}:")
+            for failure in failures:
+                print(f"   {failure}")
+            return 1
+        print(f"\n✅ No regressions against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
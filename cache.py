@@ -0,0 +1,209 @@
+import asyncio
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "300"))
+CACHE_MAXSIZE = int(os.getenv("CACHE_MAXSIZE", "10000"))
+CACHE_CHANGE_STREAMS = os.getenv("CACHE_CHANGE_STREAMS", "false").lower() in ("1", "true", "yes")
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after a fixed TTL.
+
+    Cached values are shared between callers and must be treated as read-only.
+    """
+
+    def __init__(self, name: str, maxsize: int = CACHE_MAXSIZE, ttl: float = CACHE_TTL_SECONDS):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        if not CACHE_ENABLED:
+            return None
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any):
+        if not CACHE_ENABLED:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key: Hashable):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hit_rate, 4),
+        }
+
+
+product_cache = TTLCache("products")
+customer_cache = TTLCache("customers")
+# Current weather keyed by normalised location; it changes slowly, so a few minutes is fine.
+weather_cache = TTLCache("weather", maxsize=1024, ttl=float(os.getenv("WEATHER_CACHE_TTL_SECONDS", "600")))
+
+caches = [product_cache, customer_cache, weather_cache]
+
+
+def cache_stats() -> Dict[str, Dict[str, Any]]:
+    return {cache.name: cache.stats() for cache in caches}
+
+
+class SingleFlight:
+    """Collapses concurrent loads of the same key into one call.
+
+    Callers that ask for a key while a load of it is in flight wait for that
+    load and share its result (or its exception) instead of starting another.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Future] = {}
+        # In-flight tasks per event loop, since a task can only be awaited on its own loop
+        self._tasks: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Hashable, asyncio.Task]]" = weakref.WeakKeyDictionary()
+
+    def do(self, key: Hashable, load: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = Future()
+        if not leader:
+            return call.result()
+        try:
+            result = load()
+            call.set_result(result)
+            return result
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    async def ado(self, key: Hashable, load: Callable[[], Awaitable[Any]]) -> Any:
+        loop = asyncio.get_running_loop()
+        tasks = self._tasks.setdefault(loop, {})
+        task = tasks.get(key)
+        if task is None:
+            task = tasks[key] = loop.create_task(load())
+            task.add_done_callback(lambda _: tasks.pop(key, None))
+        # Shielded so one cancelled caller does not cancel the load for the others
+        return await asyncio.shield(task)
+
+
+# Callbacks run when a catalog document changes: callback(key, document).
+# The document is None for deletes; the key is None when it is unknown.
+ChangeListener = Callable[[Optional[str], Optional[Dict[str, Any]]], None]
+_listeners: Dict[str, List[ChangeListener]] = {"products": [], "customers": []}
+
+
+def add_change_listener(collection: str, listener: ChangeListener):
+    """Register a callback for product or customer changes."""
+    _listeners[collection].append(listener)
+
+
+def notify_change(collection: str, key: Optional[str], document: Optional[Dict[str, Any]] = None):
+    """Invalidate cached entries for a changed document and tell the listeners."""
+    if collection == "products":
+        if key is None:
+            product_cache.clear()
+        else:
+            product_cache.invalidate(key)
+    elif collection == "customers":
+        if key is None:
+            customer_cache.clear()
+        else:
+            customer_cache.invalidate(key)
+    for listener in _listeners.get(collection, []):
+        listener(key, document)
+
+
+KEY_FIELDS = {"products": "product_id", "customers": "customer_id"}
+
+
+class ChangeStreamInvalidator(threading.Thread):
+    """Background thread that invalidates caches from a Mongo change stream.
+
+    Change streams need a replica set or sharded cluster; on a standalone
+    server the thread logs the error and stops, leaving TTL expiry in charge.
+    """
+
+    def __init__(self, db):
+        super().__init__(name="cache-change-stream", daemon=True)
+        self.db = db
+        self._stop_event = threading.Event()
+
+    def run(self):
+        pipeline = [{"$match": {"ns.coll": {"$in": list(KEY_FIELDS)}}}]
+        try:
+            with self.db.watch(pipeline, full_document="updateLookup") as stream:
+                while not self._stop_event.is_set():
+                    change = stream.try_next()
+                    if change is None:
+                        time.sleep(0.1)
+                        continue
+                    collection = change["ns"]["coll"]
+                    document = change.get("fullDocument")
+                    key = document.get(KEY_FIELDS[collection]) if document else None
+                    notify_change(collection, key, document)
+        except Exception as e:
+            print(f"⚠️ Cache change stream stopped: {e}")
+
+    def stop(self):
+        self._stop_event.set()
+
+
+def start_change_stream_invalidation(db) -> Optional[ChangeStreamInvalidator]:
+    """Start the change stream watcher when CACHE_CHANGE_STREAMS is enabled."""
+    if not CACHE_CHANGE_STREAMS:
+        return None
+    watcher = ChangeStreamInvalidator(db)
+    watcher.start()
+    return watcher
@@ -1,11 +1,16 @@
 import streamlit as st
-from langgraph.graph import END
-from langchain_core.messages import HumanMessage
-from main import ecommerce_system 
+from main import stream_events
+from checkpoints import new_thread_id
+
+def agent_label(agent: str) -> str:
+    return agent.replace("_", " ").title()
 
 # Initialize session state
 if "chat_history" not in st.session_state:
     st.session_state.chat_history = []
+# The graph keeps the conversation under this thread_id, so each turn only sends the new message
+if "thread_id" not in st.session_state:
+    st.session_state.thread_id = new_thread_id()
 
 st.set_page_config(page_title="🛒 E-Commerce Assistant", layout="wide")
 st.title("🛍️ E-Commerce AI Assistant")
@@ -20,25 +25,38 @@ if user_input:
     with st.chat_message("user"):
         st.markdown(user_input)
 
-    messages = [("user", user_input)]
-    for step in ecommerce_system.stream({"messages": messages}, subgraphs=True):
-        if isinstance(step, tuple) and len(step) == 2:
-            thread_id, data = step
-            if thread_id == ():
-                for key, value in data.items():
-                    if key != "supervisor" and value is not None:
-                        if "messages" in value and value["messages"]:
-                            bot_reply = value["messages"][0].content
-
-                            with st.chat_message("assistant"):
-                                st.markdown(f"**{key.replace('_', ' ').title()} Agent**: {bot_reply}")
-
-                            st.session_state.chat_history.append((f"{key}_agent", bot_reply))
-
-    if step[1] == END:
-        with st.chat_message("assistant"):
-            st.markdown("✅ Conversation complete!")
-        st.session_state.chat_history.append(("system", "Conversation complete!"))
+    status = st.status("Working on your request...")
+    placeholders = {}
+    replies = {}
+    for event in stream_events(user_input, {"configurable": {"thread_id": st.session_state.thread_id}}):
+        agent = event.get("agent")
+        if event["type"] == "route":
+            agents = [name for name in event["agents"] if name != "FINISH"]
+            if agents:
+                status.update(label=f"Asking the {', '.join(agent_label(name) for name in agents)} agent(s)...")
+                status.write(f"🎯 Routed to {', '.join(agent_label(name) for name in agents)} ({event['source']})")
+        elif event["type"] == "tool_start":
+            status.write(f"🔧 {agent_label(agent)} Agent is calling `{event['tool']}`")
+        elif event["type"] in ("token", "answer"):
+            if agent not in placeholders:
+                with st.chat_message("assistant"):
+                    placeholders[agent] = st.empty()
+                replies[agent] = ""
+            if event["type"] == "token":
+                replies[agent] += event["text"]
+                placeholders[agent].markdown(f"**{agent_label(agent)} Agent**: {replies[agent]}▌")
+            else:
+                placeholders[agent].markdown(f"**{agent_label(agent)} Agent**: {event['text']}")
+                st.session_state.chat_history.append((f"{agent}_agent", event["text"]))
+    status.update(label="Done", state="complete", expanded=False)
+
+    with st.chat_message("assistant"):
+        st.markdown("✅ Conversation complete!")
+    st.session_state.chat_history.append(("system", "Conversation complete!"))
+
+if st.sidebar.button("🆕 New conversation"):
+    st.session_state.thread_id = new_thread_id()
+    st.session_state.chat_history = []
 
 if st.session_state.chat_history:
     st.sidebar.markdown("### 📜 Chat History")
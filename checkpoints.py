@@ -0,0 +1,211 @@
+import argparse
+import asyncio
+import os
+import sqlite3
+import sys
+import time
+import uuid
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from langchain_core.messages import HumanMessage, RemoveMessage
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+
+# Conversations are checkpointed per thread_id so a new turn only sends the
+# new message. Old checkpoints are pruned after every turn and idle threads
+# expire, so the database stays small and loading a thread stays fast.
+CHECKPOINT_ENABLED = os.getenv("CHECKPOINT_ENABLED", "true").lower() in ("1", "true", "yes")
+CHECKPOINT_DB = os.getenv("CHECKPOINT_DB", "checkpoints.sqlite")
+# Checkpoints kept per thread; only the latest one is needed to continue a chat.
+CHECKPOINT_KEEP = int(os.getenv("CHECKPOINT_KEEP", "2"))
+CHECKPOINT_THREAD_TTL_HOURS = float(os.getenv("CHECKPOINT_THREAD_TTL_HOURS", "72"))
+# Older turns are dropped from a thread's state once it holds more messages than this.
+CHECKPOINT_MAX_MESSAGES = int(os.getenv("CHECKPOINT_MAX_MESSAGES", "60"))
+
+
+class SqliteCheckpointer(SqliteSaver):
+    """SqliteSaver that also serves the async graph path.
+
+    SqliteSaver only implements the sync interface. Its connection is
+    guarded by a lock, so the async methods simply run the sync ones on a
+    worker thread instead of opening a second, loop-bound connection.
+    """
+
+    def __init__(self, path: str = CHECKPOINT_DB):
+        conn = sqlite3.connect(path, check_same_thread=False)
+        super().__init__(conn)
+        self.path = path
+        self.setup()
+        with self.cursor() as cur:
+            cur.execute(
+                "CREATE TABLE IF NOT EXISTS thread_activity (thread_id TEXT PRIMARY KEY, updated_at REAL NOT NULL)"
+            )
+
+    async def aget_tuple(self, config):
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None) -> AsyncIterator:
+        items = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for item in items:
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        return await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id):
+        return await asyncio.to_thread(self.delete_thread, thread_id)
+
+    def delete_thread(self, thread_id: str):
+        super().delete_thread(thread_id)
+        with self.cursor() as cur:
+            cur.execute("DELETE FROM thread_activity WHERE thread_id = ?", (thread_id,))
+
+    def prune_thread(self, thread_id: str, keep: int = CHECKPOINT_KEEP) -> int:
+        """Delete all but the newest checkpoints of a thread and mark it active.
+
+        Checkpoint IDs are time-ordered UUIDs, so the newest sort last.
+        Returns the number of checkpoints removed.
+        """
+        with self.cursor() as cur:
+            cur.execute(
+                """
+                DELETE FROM checkpoints
+                WHERE thread_id = ? AND checkpoint_id NOT IN (
+                    SELECT checkpoint_id FROM checkpoints
+                    WHERE thread_id = ? AND checkpoint_ns = ''
+                    ORDER BY checkpoint_id DESC LIMIT ?
+                )
+                """,
+                (thread_id, thread_id, keep),
+            )
+            removed = cur.rowcount
+            cur.execute(
+                """
+                DELETE FROM writes
+                WHERE thread_id = ? AND checkpoint_id NOT IN (
+                    SELECT checkpoint_id FROM checkpoints WHERE thread_id = ?
+                )
+                """,
+                (thread_id, thread_id),
+            )
+            cur.execute(
+                "INSERT INTO thread_activity (thread_id, updated_at) VALUES (?, ?) "
+                "ON CONFLICT(thread_id) DO UPDATE SET updated_at = excluded.updated_at",
+                (thread_id, time.time()),
+            )
+        return removed
+
+    def expire_threads(self, ttl_hours: float = CHECKPOINT_THREAD_TTL_HOURS) -> int:
+        """Delete threads that have been idle for longer than the TTL."""
+        cutoff = time.time() - ttl_hours * 3600
+        with self.cursor(transaction=False) as cur:
+            cur.execute("SELECT thread_id FROM thread_activity WHERE updated_at < ?", (cutoff,))
+            expired = [row[0] for row in cur.fetchall()]
+        for thread_id in expired:
+            self.delete_thread(thread_id)
+        return len(expired)
+
+    def vacuum(self):
+        """Return the space freed by pruning to the filesystem."""
+        with self.lock:
+            self.conn.execute("VACUUM")
+            self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def stats(self) -> Dict[str, Any]:
+        with self.cursor(transaction=False) as cur:
+            cur.execute("SELECT COUNT(DISTINCT thread_id), COUNT(*) FROM checkpoints")
+            threads, checkpoints = cur.fetchone()
+            cur.execute("SELECT COUNT(*) FROM writes")
+            writes = cur.fetchone()[0]
+        size = sum(os.path.getsize(path) for path in (self.path, self.path + "-wal") if os.path.exists(path))
+        return {"threads": threads, "checkpoints": checkpoints, "writes": writes, "bytes": size}
+
+
+def create_checkpointer(path: str = CHECKPOINT_DB) -> Optional[SqliteCheckpointer]:
+    """Open the checkpoint database and expire idle threads, when checkpointing is enabled."""
+    if not CHECKPOINT_ENABLED:
+        return None
+    checkpointer = SqliteCheckpointer(path)
+    checkpointer.expire_threads()
+    return checkpointer
+
+
+def new_thread_id() -> str:
+    return uuid.uuid4().hex
+
+
+def thread_config(config: Optional[dict] = None) -> dict:
+    """Make sure a run config names a thread; one-off runs get a fresh thread."""
+    config = dict(config or {})
+    configurable = dict(config.get("configurable", {}))
+    configurable.setdefault("thread_id", new_thread_id())
+    config["configurable"] = configurable
+    return config
+
+
+def stale_messages(messages: List[Any], max_messages: int = CHECKPOINT_MAX_MESSAGES) -> List[Any]:
+    """Oldest messages to drop so at most max_messages remain, cutting at a customer turn."""
+    if len(messages) <= max_messages:
+        return []
+    for index in range(len(messages) - max_messages, len(messages)):
+        message = messages[index]
+        if isinstance(message, HumanMessage) and not message.name:
+            return messages[:index]
+    return []
+
+
+def compact_update(messages: List[Any], max_messages: int = CHECKPOINT_MAX_MESSAGES) -> Optional[dict]:
+    """State update that removes the stale turns, or None when nothing needs removing."""
+    stale = stale_messages(messages, max_messages)
+    if not stale:
+        return None
+    return {"messages": [RemoveMessage(id=message.id) for message in stale]}
+
+
+def compact_thread(graph, config: dict, max_messages: int = CHECKPOINT_MAX_MESSAGES):
+    """Trim a finished turn's thread and prune its old checkpoints."""
+    checkpointer = graph.checkpointer
+    if not isinstance(checkpointer, SqliteCheckpointer):
+        return
+    update = compact_update(graph.get_state(config).values.get("messages", []), max_messages)
+    if update:
+        graph.update_state(config, update)
+    checkpointer.prune_thread(config["configurable"]["thread_id"])
+
+
+async def acompact_thread(graph, config: dict, max_messages: int = CHECKPOINT_MAX_MESSAGES):
+    checkpointer = graph.checkpointer
+    if not isinstance(checkpointer, SqliteCheckpointer):
+        return
+    state = await graph.aget_state(config)
+    update = compact_update(state.values.get("messages", []), max_messages)
+    if update:
+        await graph.aupdate_state(config, update)
+    await asyncio.to_thread(checkpointer.prune_thread, config["configurable"]["thread_id"])
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Inspect and maintain the conversation checkpoint database.")
+    parser.add_argument("command", choices=["stats", "prune", "vacuum"])
+    parser.add_argument("--db", default=CHECKPOINT_DB)
+    parser.add_argument("--ttl-hours", type=float, default=CHECKPOINT_THREAD_TTL_HOURS)
+    args = parser.parse_args(argv)
+
+    checkpointer = SqliteCheckpointer(args.db)
+    if args.command == "prune":
+        expired = checkpointer.expire_threads(args.ttl_hours)
+        print(f"🧹 Expired {expired} idle thread(s)")
+    elif args.command == "vacuum":
+        checkpointer.vacuum()
+        print("🧹 Database compacted")
+    stats = checkpointer.stats()
+    print(f"💾 {stats['threads']} thread(s), {stats['checkpoints']} checkpoint(s), "
+          f"{stats['writes']} pending write(s), {stats['bytes']:,} bytes")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
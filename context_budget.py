@@ -0,0 +1,145 @@
+import json
+import os
+import re
+from typing import List, Optional, Sequence
+
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+
+from pre_router import pre_router
+
+
+# Prompts are built from the latest turn plus as many earlier turns as fit in
+# the node's token budget. Turns that do not fit are replaced by a one-line
+# note with the entity IDs they mentioned, so prompt size stays flat however
+# long the conversation gets.
+CONTEXT_BUDGET_ENABLED = os.getenv("CONTEXT_BUDGET_ENABLED", "true").lower() in ("1", "true", "yes")
+SUPERVISOR_CONTEXT_TOKENS = int(os.getenv("SUPERVISOR_CONTEXT_TOKENS", "2000"))
+AGENT_CONTEXT_TOKENS = int(os.getenv("AGENT_CONTEXT_TOKENS", "4000"))
+
+ENTITY_PATTERN = re.compile(r"\b(?:ORD|PRD|CUST)\d+\b", re.IGNORECASE)
+# Room left for the note that summarises dropped turns.
+NOTE_RESERVE_TOKENS = 60
+# Only the most recently mentioned IDs go into that note, so it stays bounded too.
+NOTE_MAX_IDS = 12
+MIN_REPLY_CHARS = 400
+
+
+def estimate_tokens(message: BaseMessage) -> int:
+    """Cheap token estimate (~4 characters per token plus per-message overhead)."""
+    content = message.content if isinstance(message.content, str) else json.dumps(message.content)
+    tokens = len(content) // 4 + 4
+    for call in getattr(message, "tool_calls", None) or []:
+        tokens += len(json.dumps(call.get("args", {}))) // 4 + 4
+    return tokens
+
+
+def estimate_prompt_tokens(messages: Sequence) -> int:
+    total = 0
+    for message in messages:
+        if isinstance(message, dict):
+            total += len(str(message.get("content", ""))) // 4 + 4
+        else:
+            total += estimate_tokens(message)
+    return total
+
+
+def is_customer_message(message: BaseMessage) -> bool:
+    return isinstance(message, HumanMessage) and not message.name
+
+
+def split_turns(messages: Sequence[BaseMessage]) -> List[List[BaseMessage]]:
+    """Group messages into turns, each starting at a customer message."""
+    turns: List[List[BaseMessage]] = []
+    for message in messages:
+        if is_customer_message(message) or not turns:
+            turns.append([message])
+        else:
+            turns[-1].append(message)
+    return turns
+
+
+def turn_is_relevant(turn: List[BaseMessage], agent: Optional[str]) -> bool:
+    """Whether an earlier turn concerns the agent's domain (always true for the supervisor)."""
+    if agent is None:
+        return True
+    if any(message.name == agent for message in turn if isinstance(message, HumanMessage)):
+        return True
+    question = turn[0].content if is_customer_message(turn[0]) else ""
+    return any(intent.agent == agent for intent in pre_router.detect_intents(str(question)))
+
+
+def entity_ids(messages: Sequence[BaseMessage]) -> List[str]:
+    """Order/product/customer IDs in the messages, ordered by their latest mention."""
+    found = []
+    for message in messages:
+        found += [match.upper() for match in ENTITY_PATTERN.findall(str(message.content))]
+    return list(reversed(dict.fromkeys(reversed(found))))
+
+
+def dropped_turns_note(dropped: List[List[BaseMessage]]) -> Optional[SystemMessage]:
+    if not dropped:
+        return None
+    note = f"{len(dropped)} earlier turn(s) of this conversation were omitted to save context."
+    ids = entity_ids([message for turn in dropped for message in turn])[-NOTE_MAX_IDS:]
+    if ids:
+        note += f" They referred to: {', '.join(ids)}."
+    return SystemMessage(note)
+
+
+def truncate(message: BaseMessage, max_chars: int) -> BaseMessage:
+    content = message.content
+    if not isinstance(content, str) or len(content) <= max_chars:
+        return message
+    return message.model_copy(update={"content": content[:max_chars] + " …"})
+
+
+def fit_current_turn(turn: List[BaseMessage], budget: int) -> List[BaseMessage]:
+    """Shorten other agents' replies in the current turn when it alone exceeds the budget.
+
+    The customer's message and the agent's own tool-call loop are never cut.
+    """
+    if sum(estimate_tokens(message) for message in turn) <= budget:
+        return turn
+    replies = [message for message in turn[1:] if isinstance(message, HumanMessage)]
+    if not replies:
+        return turn
+    fixed = sum(estimate_tokens(message) for message in turn if message not in replies)
+    max_chars = max(MIN_REPLY_CHARS, (budget - fixed) * 4 // len(replies))
+    return [truncate(message, max_chars) if message in replies else message for message in turn]
+
+
+def build_context(messages: Sequence[BaseMessage], budget: int, agent: Optional[str] = None) -> List[BaseMessage]:
+    """Messages to send to a node's LLM within its token budget.
+
+    The latest turn is always included. Earlier turns are added newest
+    first while they fit (for an agent, only turns about its own domain);
+    everything older is summarised by dropped_turns_note().
+    """
+    if not CONTEXT_BUDGET_ENABLED:
+        return list(messages)
+    turns = split_turns(messages)
+    if not turns:
+        return []
+    current = fit_current_turn(turns[-1], budget)
+    used = sum(estimate_tokens(message) for message in current) + NOTE_RESERVE_TOKENS
+
+    kept: List[List[BaseMessage]] = []
+    dropped: List[List[BaseMessage]] = []
+    for index in range(len(turns) - 2, -1, -1):
+        turn = turns[index]
+        if not turn_is_relevant(turn, agent):
+            dropped.append(turn)
+            continue
+        cost = sum(estimate_tokens(message) for message in turn)
+        if used + cost > budget:
+            # Keep the history contiguous: once a turn does not fit, drop all older ones
+            dropped += turns[:index + 1][::-1]
+            break
+        kept.insert(0, turn)
+        used += cost
+
+    note = dropped_turns_note(dropped[::-1])
+    context = [note] if note else []
+    for turn in kept:
+        context += turn
+    return context + current
@@ -0,0 +1,330 @@
+import argparse
+import hashlib
+import math
+import os
+import random
+import time
+from datetime import datetime, timedelta
+from multiprocessing import Pool
+from typing import Any, Dict, List, Tuple
+
+import pymongo
+from pymongo.errors import BulkWriteError
+
+from db_indexes import ensure_indexes
+
+
+# Synthetic data with the same document schemas as mongodb_population.py
+# (including the order fields the tools add later, documented there), at
+# any volume. Every chunk of every collection is generated from its own
+# seeded RNG, so chunks can be produced by any worker in any order and a
+# resumed run regenerates exactly the same documents.
+
+CHUNK_SIZE = 10_000
+PROGRESS_COLLECTION = "_generator_progress"
+
+CATEGORIES = {
+    # category: (share of catalog, median price, weather tags, product nouns)
+    "Electronics": (0.25, 80.0, [["all_weather"]], ["Headphones", "Charger", "Speaker", "Smart Watch", "Tablet", "Earbuds"]),
+    "Clothing": (0.20, 35.0, [["rainy", "snowy"], ["cold", "snowy"], ["sunny"], ["all_weather"]], ["Jacket", "Hoodie", "T-Shirt", "Raincoat", "Sweater"]),
+    "Footwear": (0.12, 90.0, [["all_weather", "rainy"], ["sunny"], ["snowy", "cold"]], ["Hiking Boots", "Sneakers", "Sandals", "Rain Boots"]),
+    "Fitness": (0.10, 30.0, [["all_weather"]], ["Yoga Mat", "Dumbbells", "Resistance Bands", "Jump Rope"]),
+    "Accessories": (0.13, 20.0, [["rainy"], ["sunny"], ["cold", "snowy"], ["all_weather"]], ["Umbrella", "Sunglasses", "Scarf", "Backpack", "Cap"]),
+    "Outdoor": (0.10, 60.0, [["sunny"], ["mild", "sunny"], ["all_weather"]], ["Tent", "Camping Chair", "Water Bottle", "Cooler"]),
+    "Home": (0.10, 45.0, [["cold"], ["all_weather"]], ["Blanket", "Space Heater", "Desk Lamp", "Fan"]),
+}
+ADJECTIVES = ["Lightweight", "Premium", "Compact", "Durable", "Waterproof", "Wireless", "Classic", "Eco", "Pro", "Ultra"]
+FEATURES = ["for everyday use", "with a two-year warranty", "for outdoor activities", "with fast charging",
+            "made from recycled materials", "with ergonomic design", "for travel", "for home workouts"]
+
+CITIES = [("New York, NY", 0.22), ("Los Angeles, CA", 0.18), ("Chicago, IL", 0.14), ("Miami, FL", 0.10),
+          ("Houston, TX", 0.10), ("Seattle, WA", 0.08), ("Denver, CO", 0.07), ("Boston, MA", 0.06),
+          ("Phoenix, AZ", 0.05)]
+STREETS = ["Main St", "Oak Ave", "Pine St", "Maple Dr", "Cedar Ln", "Elm St", "Lake Rd", "Hill Blvd"]
+FIRST_NAMES = ["John", "Sarah", "Mike", "Emma", "Olivia", "Liam", "Noah", "Ava", "Mia", "Lucas", "Zoe", "Ethan"]
+LAST_NAMES = ["Smith", "Johnson", "Davis", "Wilson", "Brown", "Garcia", "Miller", "Lee", "Clark", "Lopez"]
+
+ORDER_HISTORY_DAYS = 730
+
+
+def chunk_rng(seed: int, collection: str, chunk: int) -> random.Random:
+    digest = hashlib.sha256(f"{seed}:{collection}:{chunk}".encode()).hexdigest()
+    return random.Random(int(digest[:16], 16))
+
+
+def id_width(count: int) -> int:
+    return max(3, len(str(count)))
+
+
+def format_id(prefix: str, number: int, count: int) -> str:
+    return f"{prefix}{number:0{id_width(count)}d}"
+
+
+def category_ranges(product_count: int) -> List[Tuple[str, int, int]]:
+    """Split product numbers 1..N into one contiguous range per category."""
+    ranges, start = [], 1
+    names = list(CATEGORIES)
+    for index, name in enumerate(names):
+        share = CATEGORIES[name][0]
+        end = product_count if index == len(names) - 1 else min(product_count, start + round(share * product_count) - 1)
+        ranges.append((name, start, end))
+        start = end + 1
+    return [(name, start, end) for name, start, end in ranges if start <= end]
+
+
+def category_of(number: int, ranges: List[Tuple[str, int, int]]) -> Tuple[str, int, int]:
+    for entry in ranges:
+        if entry[1] <= number <= entry[2]:
+            return entry
+    return ranges[-1]
+
+
+def product_price(seed: int, number: int, category: str) -> float:
+    """Log-normal price around the category median, derived only from the product number."""
+    rng = random.Random(f"{seed}:price:{number}")
+    median = CATEGORIES[category][1]
+    return round(max(2.99, rng.lognormvariate(math.log(median), 0.6)), 2)
+
+
+def zipf_pick(rng: random.Random, count: int, skew: float) -> int:
+    """Pick 1..count with a heavy head: a few popular items, a long tail."""
+    u = rng.random()
+    if abs(skew - 1.0) < 1e-9:
+        value = count ** u
+    else:
+        value = ((count ** (1 - skew) - 1) * u + 1) ** (1 / (1 - skew))
+    return min(count, max(1, int(value)))
+
+
+def generate_products(rng: random.Random, seed: int, numbers: range, product_count: int) -> List[Dict[str, Any]]:
+    ranges = category_ranges(product_count)
+    documents = []
+    for number in numbers:
+        category, first, last = category_of(number, ranges)
+        _, _, weather_options, nouns = CATEGORIES[category]
+        noun = rng.choice(nouns)
+        # Recommendations stay inside the category, biased towards nearby numbers
+        recommendations = set()
+        for _ in range(rng.randint(2, 4)):
+            neighbour = min(last, max(first, number + int(rng.gauss(0, 25))))
+            if neighbour != number:
+                recommendations.add(format_id("PRD", neighbour, product_count))
+        documents.append({
+            "product_id": format_id("PRD", number, product_count),
+            "name": f"{rng.choice(ADJECTIVES)} {noun}",
+            "category": category,
+            "price": product_price(seed, number, category),
+            "availability": 0 if rng.random() < 0.08 else int(rng.expovariate(1 / 120)) + 1,
+            "description": f"{rng.choice(ADJECTIVES)} {noun.lower()} {rng.choice(FEATURES)}",
+            "recommendations": sorted(recommendations),
+            "weather_suitable": rng.choice(weather_options),
+        })
+    return documents
+
+
+def membership_tier(points: int) -> str:
+    if points >= 2000:
+        return "Platinum"
+    if points >= 1000:
+        return "Gold"
+    if points >= 500:
+        return "Silver"
+    return "Bronze"
+
+
+def generate_customers(rng: random.Random, numbers: range, customer_count: int) -> List[Dict[str, Any]]:
+    cities, weights = zip(*CITIES)
+    documents = []
+    for number in numbers:
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        points = int(rng.expovariate(1 / 700))
+        documents.append({
+            "customer_id": format_id("CUST", number, customer_count),
+            "name": f"{first} {last}",
+            "email": f"{first.lower()}.{last.lower()}{number}@email.com",
+            "age": min(80, max(18, int(rng.gauss(38, 12)))),
+            "preferences": rng.sample(list(CATEGORIES), rng.randint(1, 3)),
+            "loyalty_points": points,
+            "membership_tier": membership_tier(points),
+            "location": rng.choices(cities, weights)[0],
+        })
+    return documents
+
+
+def order_status(rng: random.Random, age_days: int) -> str:
+    if age_days < 2:
+        return rng.choices(["pending", "processing", "cancelled"], [0.5, 0.45, 0.05])[0]
+    if age_days < 7:
+        return rng.choices(["processing", "shipped", "cancelled"], [0.2, 0.75, 0.05])[0]
+    return rng.choices(["delivered", "returned", "cancelled"], [0.9, 0.06, 0.04])[0]
+
+
+def generate_orders(rng: random.Random, seed: int, numbers: range, counts: Dict[str, int], now: datetime) -> List[Dict[str, Any]]:
+    product_count, customer_count, order_count = counts["products"], counts["customers"], counts["orders"]
+    ranges = category_ranges(product_count)
+    cities = [city for city, _ in CITIES]
+    documents = []
+    for number in numbers:
+        customer_number = zipf_pick(rng, customer_count, 0.6)
+        items = []
+        for _ in range(min(5, 1 + int(rng.expovariate(1.2)))):
+            product_number = zipf_pick(rng, product_count, 0.9)
+            category = category_of(product_number, ranges)[0]
+            items.append({
+                "product_id": format_id("PRD", product_number, product_count),
+                "quantity": rng.choices([1, 2, 3], [0.75, 0.18, 0.07])[0],
+                "price": product_price(seed, product_number, category),
+            })
+        # Recent orders are more common than old ones
+        age_days = min(ORDER_HISTORY_DAYS, int(rng.expovariate(1 / 120)))
+        status = order_status(rng, age_days)
+        documents.append({
+            "order_id": format_id("ORD", number, order_count),
+            "customer_id": format_id("CUST", customer_number, customer_count),
+            "status": status,
+            "items": items,
+            "total_amount": round(sum(item["price"] * item["quantity"] for item in items), 2),
+            "order_date": now - timedelta(days=age_days, seconds=rng.randint(0, 86399)),
+            "shipping_address": f"{rng.randint(1, 9999)} {rng.choice(STREETS)}, {rng.choice(cities)}",
+            "can_cancel": status in ("pending", "processing"),
+            "can_return": status == "delivered" and age_days <= 30,
+        })
+    return documents
+
+
+_worker_db = None
+
+
+def _init_worker(uri: str, db_name: str):
+    global _worker_db
+    _worker_db = pymongo.MongoClient(uri)[db_name]
+
+
+def insert_batches(collection, documents: List[Dict[str, Any]], batch_size: int) -> int:
+    """Unordered insert_many in batches; duplicates from an interrupted run are skipped."""
+    inserted = 0
+    for start in range(0, len(documents), batch_size):
+        batch = documents[start:start + batch_size]
+        try:
+            inserted += len(collection.insert_many(batch, ordered=False).inserted_ids)
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if any(error.get("code") != 11000 for error in errors):
+                raise
+            inserted += e.details.get("nInserted", 0)
+    return inserted
+
+
+def generate_chunk(task: Tuple[str, int, Dict[str, Any]]) -> Tuple[str, int, int]:
+    collection, chunk, params = task
+    counts, seed = params["counts"], params["seed"]
+    rng = chunk_rng(seed, collection, chunk)
+    first = chunk * params["chunk_size"] + 1
+    numbers = range(first, min(counts[collection], first + params["chunk_size"] - 1) + 1)
+    if collection == "products":
+        documents = generate_products(rng, seed, numbers, counts["products"])
+    elif collection == "customers":
+        documents = generate_customers(rng, numbers, counts["customers"])
+    else:
+        documents = generate_orders(rng, seed, numbers, counts, params["now"])
+
+    inserted = insert_batches(_worker_db[collection], documents, params["batch_size"])
+    _worker_db[PROGRESS_COLLECTION].update_one(
+        {"_id": f"{collection}:{chunk}"},
+        {"$set": {"run": params["run"], "inserted": inserted, "finished_at": datetime.now()}},
+        upsert=True,
+    )
+    return collection, chunk, inserted
+
+
+def run_key(counts: Dict[str, int], seed: int, chunk_size: int) -> str:
+    return f"p{counts['products']}-c{counts['customers']}-o{counts['orders']}-s{seed}-k{chunk_size}"
+
+
+def generate(
+    orders: int,
+    products: int,
+    customers: int,
+    uri: str = os.getenv("MONGODB_URI", "mongodb://localhost:27017"),
+    db_name: str = "ecommerce_system",
+    workers: int = os.cpu_count() or 4,
+    batch_size: int = 1000,
+    chunk_size: int = CHUNK_SIZE,
+    seed: int = 42,
+    resume: bool = False,
+):
+    """Generate and insert a synthetic dataset.
+
+    With resume=True, chunks recorded as finished by a previous run with the
+    same parameters are skipped, and partially inserted chunks are redone
+    (the unique ID indexes turn their duplicates into no-ops).
+    """
+    client = pymongo.MongoClient(uri)
+    db = client[db_name]
+    counts = {"products": products, "customers": customers, "orders": orders}
+    run = run_key(counts, seed, chunk_size)
+
+    progress = db[PROGRESS_COLLECTION]
+    if not resume:
+        for collection in counts:
+            db[collection].delete_many({})
+        progress.delete_many({})
+    elif progress.find_one({"run": {"$ne": run}}):
+        raise ValueError("Existing progress was recorded with different parameters; rerun without --resume.")
+    ensure_indexes(db)
+
+    # Dates are anchored once per dataset so resumed chunks match the first run
+    anchor = progress.find_one({"_id": "anchor"})
+    if anchor is None:
+        anchor = {"_id": "anchor", "run": run, "now": datetime.now().replace(microsecond=0)}
+        progress.insert_one(anchor)
+    params = {"counts": counts, "seed": seed, "chunk_size": chunk_size, "batch_size": batch_size,
+              "run": run, "now": anchor["now"]}
+
+    done = {entry["_id"] for entry in progress.find({"run": run}, {"_id": 1})}
+    tasks = [
+        (collection, chunk, params)
+        for collection in ("products", "customers", "orders")
+        for chunk in range(math.ceil(counts[collection] / chunk_size))
+        if f"{collection}:{chunk}" not in done
+    ]
+    total_chunks = sum(math.ceil(count / chunk_size) for count in counts.values())
+    print(f"🏭 Generating {products:,} products, {customers:,} customers, {orders:,} orders "
+          f"({len(tasks)}/{total_chunks} chunks to do, {workers} workers)")
+
+    started = time.perf_counter()
+    inserted_total = 0
+    with Pool(workers, initializer=_init_worker, initargs=(uri, db_name)) as pool:
+        for index, (collection, chunk, inserted) in enumerate(pool.imap_unordered(generate_chunk, tasks), 1):
+            inserted_total += inserted
+            if index % max(1, len(tasks) // 20) == 0 or index == len(tasks):
+                elapsed = time.perf_counter() - started
+                print(f"  {index}/{len(tasks)} chunks, {inserted_total:,} docs, "
+                      f"{inserted_total / max(elapsed, 1e-9):,.0f} docs/s")
+
+    print(f"✅ Done in {time.perf_counter() - started:.1f}s")
+    return inserted_total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic ecommerce_system dataset for load testing.")
+    parser.add_argument("--orders", type=int, default=100_000)
+    parser.add_argument("--products", type=int, default=5_000)
+    parser.add_argument("--customers", type=int, default=20_000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--resume", action="store_true", help="continue an interrupted run with the same parameters")
+    parser.add_argument("--uri", default=os.getenv("MONGODB_URI", "mongodb://localhost:27017"))
+    parser.add_argument("--db", default="ecommerce_system")
+    args = parser.parse_args(argv)
+    generate(
+        args.orders, args.products, args.customers,
+        uri=args.uri, db_name=args.db, workers=args.workers, batch_size=args.batch_size,
+        chunk_size=args.chunk_size, seed=args.seed, resume=args.resume,
+    )
+
+
+if __name__ == "__main__":
+    main()
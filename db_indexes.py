@@ -0,0 +1,155 @@
+import argparse
+import os
+import sys
+from typing import Any, Dict, List
+
+import pymongo
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+
+# Every index the tools rely on. create_indexes() is a no-op for indexes that
+# already exist with the same spec, so ensure_indexes() is safe to rerun.
+INDEXES: Dict[str, List[IndexModel]] = {
+    "orders": [
+        IndexModel([("order_id", ASCENDING)], name="order_id_unique", unique=True),
+        IndexModel(
+            [("customer_id", ASCENDING), ("order_date", DESCENDING), ("order_id", DESCENDING)],
+            name="customer_order_history",
+        ),
+    ],
+    "products": [
+        IndexModel([("product_id", ASCENDING)], name="product_id_unique", unique=True),
+        IndexModel([("category", ASCENDING)], name="category"),
+        IndexModel(
+            [("name", "text"), ("description", "text")],
+            name="product_text",
+            weights={"name": 3, "description": 1},
+        ),
+    ],
+    "customers": [
+        IndexModel([("customer_id", ASCENDING)], name="customer_id_unique", unique=True),
+    ],
+}
+
+# Indexes no query uses any more. They only add write cost, so
+# ensure_indexes() drops them from existing databases.
+OBSOLETE_INDEXES: Dict[str, List[str]] = {
+    # Weather recommendations are served from weather_index.py
+    "products": ["weather_suitable"],
+}
+
+
+def ensure_indexes(db) -> Dict[str, List[str]]:
+    """Create all indexes the tools need and drop obsolete ones. Returns the index names per collection."""
+    for collection, names in OBSOLETE_INDEXES.items():
+        existing = db[collection].index_information()
+        for name in names:
+            if name in existing:
+                db[collection].drop_index(name)
+    created = {}
+    for collection, indexes in INDEXES.items():
+        try:
+            created[collection] = db[collection].create_indexes(indexes)
+        except OperationFailure as e:
+            # Usually an existing index with the same name but different options
+            raise RuntimeError(f"Could not create indexes on {collection}: {e}") from e
+    return created
+
+
+def query_shapes() -> List[Dict[str, Any]]:
+    """Every query shape the tools send to Mongo, with representative values.
+
+    Updates are audited through the plan of a find() with the same filter.
+    """
+    import agent_tools
+    from product_search import PRODUCT_SEARCH_BACKEND, text_search_query
+
+    order_ids = ["ORD001", "ORD002"]
+    shapes = [
+        {"name": "check_order_status", "collection": "orders", "filter": {"order_id": "ORD001"}},
+        {"name": "cancel_order", "collection": "orders", "filter": agent_tools.cancel_filter("ORD001")},
+        {"name": "process_return", "collection": "orders", "filter": agent_tools.return_filter("ORD001")},
+        {"name": "check_orders_status / bulk read-back", "collection": "orders",
+         "filter": {"order_id": {"$in": order_ids}}},
+        {"name": "bulk_cancel_orders (update_many)", "collection": "orders",
+         "filter": agent_tools.cancel_filter(order_ids)},
+        {"name": "bulk_process_returns (update_many)", "collection": "orders",
+         "filter": agent_tools.return_filter(order_ids)},
+        {"name": "bulk batch_id cleanup (update_many)", "collection": "orders",
+         "filter": agent_tools.batch_filter(order_ids, agent_tools.new_batch_id())},
+        {"name": "get_customer_order_history", "collection": "orders",
+         "filter": agent_tools.order_history_filter("CUST001"),
+         "sort": agent_tools.ORDER_HISTORY_SORT},
+        {"name": "load_product", "collection": "products", "filter": {"product_id": "PRD001"}},
+        {"name": "load_products", "collection": "products",
+         "filter": {"product_id": {"$in": ["PRD001", "PRD002"]}}},
+        {"name": "load_customer / update_customer_preferences", "collection": "customers",
+         "filter": {"customer_id": "CUST001"}},
+    ]
+    if PRODUCT_SEARCH_BACKEND == "text":
+        shapes.append({"name": "search_products (text)", "collection": "products",
+                       "filter": text_search_query("headphones", "Electronics")})
+    elif PRODUCT_SEARCH_BACKEND == "regex":
+        shapes.append({"name": "search_products (regex)", "collection": "products",
+                       "filter": agent_tools.build_search_filter("headphones", "Electronics")})
+    return shapes
+
+
+def plan_stages(plan: Dict[str, Any]) -> List[str]:
+    """Flatten the stage names of an explain() plan tree."""
+    stages = [plan.get("stage", "?")]
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            stages += plan_stages(plan[key])
+    for child in plan.get("inputStages", []):
+        stages += plan_stages(child)
+    return stages
+
+
+def audit_query_plans(db) -> List[Dict[str, Any]]:
+    """Explain every query shape and flag the ones whose winning plan is a COLLSCAN."""
+    report = []
+    for shape in query_shapes():
+        cursor = db[shape["collection"]].find(shape["filter"])
+        if shape.get("sort"):
+            cursor = cursor.sort(shape["sort"])
+        explain = cursor.limit(10).explain()
+        winning_plan = explain.get("queryPlanner", {}).get("winningPlan", {})
+        stages = plan_stages(winning_plan)
+        report.append({
+            "name": shape["name"],
+            "collection": shape["collection"],
+            "stages": stages,
+            "collscan": "COLLSCAN" in stages,
+        })
+    return report
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Manage and audit ecommerce_system indexes.")
+    parser.add_argument("command", choices=["ensure", "audit"])
+    parser.add_argument("--uri", default=os.getenv("MONGODB_URI", "mongodb://localhost:27017"))
+    parser.add_argument("--db", default="ecommerce_system")
+    args = parser.parse_args(argv)
+
+    db = pymongo.MongoClient(args.uri)[args.db]
+    if args.command == "ensure":
+        for collection, names in ensure_indexes(db).items():
+            print(f"✅ {collection}: {', '.join(names)}")
+        return 0
+
+    report = audit_query_plans(db)
+    for entry in report:
+        marker = "❌ COLLSCAN" if entry["collscan"] else "✅"
+        print(f"{marker} {entry['name']} ({entry['collection']}): {' -> '.join(entry['stages'])}")
+    collscans = [entry for entry in report if entry["collscan"]]
+    if collscans:
+        print(f"\n{len(collscans)} query shape(s) scan a whole collection.")
+        return 1
+    print("\nAll query shapes use an index.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,168 @@
+import os
+import threading
+import weakref
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from typing_extensions import TypedDict
+
+from langchain_core.messages import HumanMessage
+
+
+# Documents fetched while answering one customer message are kept in graph
+# state, so a later agent hop (or another agent in a fan-out) reuses them
+# instead of going back to Mongo. The store starts empty on every new
+# customer message, so orders are never served from an earlier turn.
+FACTS_ENABLED = os.getenv("FACTS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+FACT_KINDS = ("orders", "customers", "products", "weather")
+
+
+class Facts(TypedDict, total=False):
+    """Graph-state form of a FactStore: documents by kind and ID for one request."""
+    request: Optional[str]
+    orders: Dict[str, Dict[str, Any]]
+    customers: Dict[str, Dict[str, Any]]
+    products: Dict[str, Dict[str, Any]]
+    weather: Dict[str, Dict[str, Any]]
+    # Keys by kind of documents a tool changed, so merging drops older copies
+    discarded: Dict[str, List[str]]
+    # Number of changes the store had seen when this snapshot was taken
+    version: int
+
+
+def request_key(messages: Sequence) -> Optional[str]:
+    """ID of the customer message being answered; facts belong to it."""
+    for message in reversed(messages):
+        if isinstance(message, HumanMessage) and not message.name:
+            return message.id
+    return None
+
+
+def merge_facts(left: Optional[Facts], right: Optional[Facts]) -> Facts:
+    """State reducer: facts of the same request are merged, a new request replaces them.
+
+    The newer snapshot wins: documents it discarded are dropped from the
+    older one, so a copy from before a write never comes back.
+    """
+    if not left or not right or left.get("request") != right.get("request"):
+        return right or left or {}
+    older, newer = (right, left) if right.get("version", 0) < left.get("version", 0) else (left, right)
+    merged: Facts = {"request": left.get("request"), "discarded": {},
+                     "version": max(left.get("version", 0), right.get("version", 0))}
+    for kind in FACT_KINDS:
+        newer_documents = newer.get(kind, {})
+        gone = set(newer.get("discarded", {}).get(kind, ()))
+        documents = {key: document for key, document in older.get(kind, {}).items() if key not in gone}
+        documents.update(newer_documents)
+        gone |= set(older.get("discarded", {}).get(kind, ())) - set(newer_documents)
+        for key in gone:
+            documents.pop(key, None)
+        merged[kind] = documents
+        if gone:
+            merged["discarded"][kind] = sorted(gone)
+    return merged
+
+
+class FactStore:
+    """Thread-safe, request-scoped store of fetched documents.
+
+    Documents are shared with the caller and must be treated as read-only.
+    """
+
+    def __init__(self, request: Optional[str] = None, facts: Optional[Facts] = None):
+        self.request = request
+        self._data: Dict[str, Dict[str, Any]] = {kind: {} for kind in FACT_KINDS}
+        self._discarded: Dict[str, set] = {kind: set() for kind in FACT_KINDS}
+        self._version = 0
+        if facts and facts.get("request") == request:
+            self._version = facts.get("version", 0)
+            for kind in FACT_KINDS:
+                self._data[kind].update(facts.get(kind, {}))
+                self._discarded[kind].update(facts.get("discarded", {}).get(kind, ()))
+        self.hits = 0
+        # Background load of the entities the message mentions, see prefetch.py
+        self.pending: Any = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_state(cls, state: Dict[str, Any]) -> "FactStore":
+        """The store for the request in a graph state, reusing facts it already carries.
+
+        Agents running in parallel for the same request share one store, so a
+        document one of them has fetched is visible to the others right away.
+        """
+        request = request_key(state["messages"])
+        if request is None:
+            return cls(None, state.get("facts"))
+        with _live_lock:
+            store = _live_stores.get(request)
+            if store is None:
+                store = cls(request, state.get("facts"))
+                _live_stores[request] = store
+            return store
+
+    def get(self, kind: str, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            document = self._data[kind].get(key)
+            if document is not None:
+                self.hits += 1
+            return document
+
+    def get_many(self, kind: str, keys: List[str]) -> Tuple[Dict[str, Dict[str, Any]], List[str]]:
+        """Known documents by key, and the keys still to fetch."""
+        with self._lock:
+            found = {key: self._data[kind][key] for key in keys if key in self._data[kind]}
+            self.hits += len(found)
+        return found, [key for key in keys if key not in found]
+
+    def put(self, kind: str, key: str, document: Dict[str, Any]):
+        # ObjectIds are not needed by the tools and would not survive checkpointing
+        if "_id" in document:
+            document = {field: value for field, value in document.items() if field != "_id"}
+        with self._lock:
+            self._data[kind][key] = document
+            self._discarded[kind].discard(key)
+            self._version += 1
+
+    def discard(self, kind: str, keys: List[str]):
+        """Forget documents a tool has just changed."""
+        with self._lock:
+            for key in keys:
+                self._data[kind].pop(key, None)
+                self._discarded[kind].add(key)
+            self._version += 1
+
+    def snapshot(self) -> Facts:
+        with self._lock:
+            facts: Facts = {"request": self.request, "version": self._version}
+            for kind in FACT_KINDS:
+                facts[kind] = dict(self._data[kind])
+            facts["discarded"] = {kind: sorted(keys) for kind, keys in self._discarded.items() if keys}
+            return facts
+
+    def __len__(self) -> int:
+        return sum(len(documents) for documents in self._data.values())
+
+
+# Stores of requests that agents are working on right now, by request key.
+_live_stores: "weakref.WeakValueDictionary[str, FactStore]" = weakref.WeakValueDictionary()
+_live_lock = threading.Lock()
+
+_current_facts: ContextVar[Optional[FactStore]] = ContextVar("current_facts", default=None)
+
+
+def current_facts() -> Optional[FactStore]:
+    """The fact store of the request being handled, or None outside a graph run."""
+    return _current_facts.get() if FACTS_ENABLED else None
+
+
+@contextmanager
+def use_facts(store: FactStore) -> Iterator[FactStore]:
+    """Make a store visible to the tools called in this block (including worker threads)."""
+    token = _current_facts.set(store)
+    try:
+        yield store
+    finally:
+        _current_facts.reset(token)
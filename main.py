@@ -1,16 +1,56 @@
-from typing import Literal, Sequence, Annotated
+import os
+import asyncio
+from typing import List, Literal, Optional, Annotated
 from typing_extensions import TypedDict
 from langgraph.graph import MessagesState, START, END, StateGraph
-from langgraph.types import Command
+from langgraph.types import Command, Send
+from langgraph.config import get_stream_writer
 from langgraph.prebuilt import ToolNode, tools_condition
-from langchain_core.messages import BaseMessage, HumanMessage
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.runnables import RunnableLambda
 from langchain.tools import tool
-from langchain_openai import ChatOpenAI
-from agent_tools import order_tools, product_tools, customer_tools, weather_tools
+from agent_tools import order_tools, product_tools, customer_tools, weather_tools, db, start_index_builds
+from db_indexes import ensure_indexes
+from pre_router import pre_router, PRE_ROUTER_ENABLED
+from cache import cache_stats
+from checkpoints import create_checkpointer, thread_config, compact_thread, acompact_thread
+from message_log import MessageLog, append_messages
+from facts import Facts, FactStore, merge_facts, use_facts, current_facts, FACTS_ENABLED
+from prefetch import start_prefetch, astart_prefetch, wait_for_prefetch, await_prefetch
+from models import create_model, node_models, escalation_model, model_label, ROUTER_ESCALATION_CONFIDENCE
+from context_budget import build_context, estimate_prompt_tokens, SUPERVISOR_CONTEXT_TOKENS, AGENT_CONTEXT_TOKENS
+from telemetry import (
+    span, current_span, record_route, record_llm_usage,
+    trace_tool_call, atrace_tool_call, start_metrics_server,
+)
 from dotenv import load_dotenv
 
 load_dotenv()
-llm = ChatOpenAI(model_name="gpt-4o")
+# The default (largest) model; the supervisor and each agent can be given
+# their own model through the environment (see models.py).
+llm = create_model()
+
+if os.getenv("ENSURE_INDEXES_ON_STARTUP", "true").lower() in ("1", "true", "yes"):
+    try:
+        ensure_indexes(db)
+    except Exception as e:
+        print(f"⚠️ Could not ensure MongoDB indexes: {e}")
+
+# Build the in-memory product indexes off the request path, while the rest of
+# the system starts up.
+if os.getenv("BUILD_INDEXES_ON_STARTUP", "true").lower() in ("1", "true", "yes"):
+    start_index_builds()
+
+metrics_server = start_metrics_server()
+# Conversation state per thread_id (see checkpoints.py); None disables memory.
+checkpointer = create_checkpointer()
+
+# Let agents end the graph themselves when the query had a single intent,
+# skipping the supervisor hop whose only output would be FINISH.
+FAST_FINISH = os.getenv("FAST_FINISH", "true").lower() in ("1", "true", "yes")
+# Run every agent a multi-intent query needs at the same time instead of
+# bouncing through the supervisor between each of them.
+PARALLEL_FANOUT = os.getenv("PARALLEL_FANOUT", "true").lower() in ("1", "true", "yes")
 
 members = ["order_management", "product_information", "customer_service", "weather_service"]
 options = members + ["FINISH"]
@@ -39,139 +79,347 @@ Examples:
 - "What's the weather and recommend products" → weather_service (can handle both)
 """
 
+fanout_prompt = """
+- You may return several agents at once; they run in parallel and their answers come back together
+- Return only FINISH when no agent is needed
+"""
+
 class Router(TypedDict):
     """Worker to route to next. If no workers needed, route to FINISH."""
     next: Literal["order_management", "product_information", "customer_service", "weather_service", "FINISH"]
+    confidence: Annotated[float, 1.0, "How sure you are of this routing decision, from 0 to 1"]
+
+class RouterPlan(TypedDict):
+    """Workers to run in parallel next. If no workers needed, route to FINISH."""
+    next: List[Literal["order_management", "product_information", "customer_service", "weather_service", "FINISH"]]
+    confidence: Annotated[float, 1.0, "How sure you are of this routing decision, from 0 to 1"]
+
+def emit(event: dict):
+    """Send a status event to stream_mode="custom" consumers (a no-op otherwise)."""
+    get_stream_writer()(event)
 
-def supervisor_node(state: MessagesState) -> Command[Literal["order_management", "product_information", "customer_service", "weather_service", "__end__"]]:
-    messages = [
+def pre_route(state: MessagesState) -> Optional[List[str]]:
+    """Agents chosen by the pre-router, or None when the LLM has to decide."""
+    decision = pre_router.route(state["messages"]) if PRE_ROUTER_ENABLED else None
+    if decision is None:
+        return None
+    goto = decision.pending if PARALLEL_FANOUT and len(decision.pending) > 1 else [decision.next]
+    record_route(goto, f"pre-router {decision.source}", decision.confidence)
+    emit({"type": "route", "agents": goto, "source": f"pre-router {decision.source}"})
+    return goto
+
+def router_request(state: MessagesState):
+    """Structured output schema and prompt for the supervisor's LLM call."""
+    context = build_context(state["messages"], SUPERVISOR_CONTEXT_TOKENS)
+    if PARALLEL_FANOUT:
+        return RouterPlan, [
+            {"role": "system", "content": system_prompt + fanout_prompt},
+        ] + context
+    return Router, [
         {"role": "system", "content": system_prompt},
-    ] + state["messages"]
-    
-    response = llm.with_structured_output(Router).invoke(messages)
-    goto = response["next"]
-    print(f"🎯 Supervisor Decision: Route to {goto}")
-    
-    if goto == "FINISH":
-        goto = END
-    return Command(goto=goto)
+    ] + context
+
+def llm_goto(llm_span, response, source: str = "llm", can_escalate: bool = False) -> Optional[List[str]]:
+    """Routing targets from a structured-output response requested with include_raw=True.
+
+    Returns None when the decision should be escalated to a larger model:
+    the response did not parse or its confidence is too low.
+    """
+    record_llm_usage(llm_span, "supervisor", response["raw"])
+    parsed = response["parsed"] or {}
+    goto = parsed.get("next")
+    goto = [goto] if isinstance(goto, str) else goto
+    if not isinstance(goto, list) or not set(goto) <= set(options):
+        # TypedDict output is not validated, so check the targets here
+        if can_escalate:
+            if llm_span is not None:
+                llm_span.set_attribute("escalate", "parse error")
+            return None
+        raise response["parsing_error"] or ValueError("Supervisor returned no routing decision")
+    confidence = parsed.get("confidence")
+    if can_escalate and isinstance(confidence, (int, float)) and confidence < ROUTER_ESCALATION_CONFIDENCE:
+        if llm_span is not None:
+            llm_span.set_attribute("escalate", "low confidence")
+        return None
+    goto = list(dict.fromkeys(goto)) or ["FINISH"]
+    record_route(goto, source, confidence)
+    emit({"type": "route", "agents": goto, "source": source})
+    return goto
+
+def route_command(state: MessagesState, goto: List[str]) -> Command:
+    if "FINISH" in goto:
+        return Command(goto=END)
+    if len(goto) > 1:
+        # Agents run in the same step; their replies are merged into one
+        # state update before the supervisor runs once more.
+        return Command(goto=[Send(agent, state) for agent in goto])
+    return Command(goto=goto[0])
+
+def create_supervisor(llm, escalation_llm=None):
+    """Supervisor node that routes with the pre-router first and the given LLM otherwise.
+
+    When escalation_llm is a different model, routing decisions that llm
+    cannot parse or is unsure of are asked again of escalation_llm.
+    """
+    routers = [(llm, "llm")]
+    if escalation_llm is not None and escalation_llm is not llm:
+        routers.append((escalation_llm, "llm escalated"))
+
+    def supervisor_node(state: SupervisorState) -> Command[Literal["order_management", "product_information", "customer_service", "weather_service", "__end__"]]:
+        with span("supervisor", kind="supervisor"):
+            # Load the documents the message names while routing is decided
+            start_prefetch(state)
+            goto = pre_route(state)
+            if goto is None:
+                schema, messages = router_request(state)
+                for index, (router, source) in enumerate(routers):
+                    with span("supervisor", kind="llm", model=model_label(router), prompt_tokens=estimate_prompt_tokens(messages)) as llm_span:
+                        response = router.with_structured_output(schema, include_raw=True).invoke(messages)
+                    goto = llm_goto(llm_span, response, source, can_escalate=index + 1 < len(routers))
+                    if goto is not None:
+                        break
+            return route_command(state, goto)
+
+    async def asupervisor_node(state: SupervisorState) -> Command[Literal["order_management", "product_information", "customer_service", "weather_service", "__end__"]]:
+        with span("supervisor", kind="supervisor"):
+            astart_prefetch(state)
+            goto = pre_route(state)
+            if goto is None:
+                schema, messages = router_request(state)
+                for index, (router, source) in enumerate(routers):
+                    with span("supervisor", kind="llm", model=model_label(router), prompt_tokens=estimate_prompt_tokens(messages)) as llm_span:
+                        response = await router.with_structured_output(schema, include_raw=True).ainvoke(messages)
+                    goto = llm_goto(llm_span, response, source, can_escalate=index + 1 < len(routers))
+                    if goto is not None:
+                        break
+            return route_command(state, goto)
+
+    return RunnableLambda(supervisor_node, afunc=asupervisor_node)
+
+class SupervisorState(MessagesState):
+    """Conversation messages plus the documents fetched while answering the current message."""
+    facts: Annotated[Facts, merge_facts]
 
 class AgentState(TypedDict):
-    """The state of individual agents."""
-    messages: Annotated[Sequence[BaseMessage], lambda x, y: x + y]
+    """The state of individual agents.
+
+    The message log shares the supervisor's message list and appends in
+    place, so entering an agent and each tool-loop step do not copy history.
+    """
+    messages: Annotated[MessageLog, append_messages]
+
+def tool_call_hook(request, execute):
+    """Trace a tool call and announce it to streaming consumers.
+
+    The call first waits for the request's prefetch, so it finds the
+    documents the message named instead of querying them again.
+    """
+    call = request.tool_call
+    emit({"type": "tool_start", "tool": call["name"], "args": call["args"]})
+    wait_for_prefetch(current_facts())
+    result = trace_tool_call(request, execute)
+    emit({"type": "tool_end", "tool": call["name"]})
+    return result
 
-def create_agent(llm, tools, agent_name: str):
-    """Create a specialized agent with given tools."""
+async def atool_call_hook(request, execute):
+    call = request.tool_call
+    emit({"type": "tool_start", "tool": call["name"], "args": call["args"]})
+    await await_prefetch(current_facts())
+    result = await atrace_tool_call(request, execute)
+    emit({"type": "tool_end", "tool": call["name"]})
+    return result
+
+def create_agent(llm, tools, agent_name: str, domain: Optional[str] = None):
+    """Create a specialized agent with given tools.
+
+    domain is the agent's node name; earlier turns of the conversation that
+    did not involve it are left out of its prompt.
+    """
     llm_with_tools = llm.bind_tools(tools)
     
     def chatbot(state: AgentState):
         system_message = f"You are the {agent_name} agent. Use your tools to help customers effectively. Be helpful, accurate, and professional."
-        messages = [{"role": "system", "content": system_message}] + state["messages"]
-        return {"messages": [llm_with_tools.invoke(messages)]}
+        messages = [{"role": "system", "content": system_message}] + build_context(state["messages"], AGENT_CONTEXT_TOKENS, domain)
+        with span(agent_name, kind="llm", prompt_tokens=estimate_prompt_tokens(messages)) as llm_span:
+            response = llm_with_tools.invoke(messages)
+        record_llm_usage(llm_span, agent_name, response)
+        return {"messages": [response]}
+
+    async def achatbot(state: AgentState):
+        system_message = f"You are the {agent_name} agent. Use your tools to help customers effectively. Be helpful, accurate, and professional."
+        messages = [{"role": "system", "content": system_message}] + build_context(state["messages"], AGENT_CONTEXT_TOKENS, domain)
+        with span(agent_name, kind="llm", prompt_tokens=estimate_prompt_tokens(messages)) as llm_span:
+            response = await llm_with_tools.ainvoke(messages)
+        record_llm_usage(llm_span, agent_name, response)
+        return {"messages": [response]}
 
     graph_builder = StateGraph(AgentState)
-    graph_builder.add_node("agent", chatbot)
+    graph_builder.add_node("agent", RunnableLambda(chatbot, afunc=achatbot))
 
-    tool_node = ToolNode(tools=tools)
+    tool_node = ToolNode(tools=tools, wrap_tool_call=tool_call_hook, awrap_tool_call=atool_call_hook)
     graph_builder.add_node("tools", tool_node)
 
     graph_builder.add_conditional_edges("agent", tools_condition)
     graph_builder.add_edge("tools", "agent")
     graph_builder.set_entry_point("agent")
-    return graph_builder.compile()
-
-order_agent = create_agent(llm, order_tools, "Order Management")
-
-def order_management_node(state: MessagesState) -> Command[Literal["supervisor"]]:
-    print("📦 Order Management Agent activated")
-    result = order_agent.invoke(state)
-    return Command(
-        update={
-            "messages": [
-                HumanMessage(content=result["messages"][-1].content, name="order_management")
-            ]
-        },
-        goto="supervisor",
-    )
-
-product_agent = create_agent(llm, product_tools, "Product Information")
-
-def product_information_node(state: MessagesState) -> Command[Literal["supervisor"]]:
-    print("🛍️ Product Information Agent activated")
-    result = product_agent.invoke(state)
-    return Command(
-        update={
-            "messages": [
-                HumanMessage(content=result["messages"][-1].content, name="product_information")
-            ]
-        },
-        goto="supervisor",
-    )
-
-customer_agent = create_agent(llm, customer_tools, "Customer Service")
-
-def customer_service_node(state: MessagesState) -> Command[Literal["supervisor"]]:
-    print("👤 Customer Service Agent activated")
-    result = customer_agent.invoke(state)
-    return Command(
-        update={
-            "messages": [
-                HumanMessage(content=result["messages"][-1].content, name="customer_service")
-            ]
-        },
-        goto="supervisor",
-    )
-
-weather_agent = create_agent(llm, weather_tools, "Weather Service")
-
-def weather_service_node(state: MessagesState) -> Command[Literal["supervisor"]]:
-    print("🌤️ Weather Service Agent activated")
-    result = weather_agent.invoke(state)
-    return Command(
-        update={
-            "messages": [
-                HumanMessage(content=result["messages"][-1].content, name="weather_service")
-            ]
-        },
-        goto="supervisor",
-    )
-
-
-builder = StateGraph(MessagesState)
-
-builder.add_edge(START, "supervisor")
-builder.add_node("supervisor", supervisor_node)
-
-builder.add_node("order_management", order_management_node)
-builder.add_node("product_information", product_information_node)
-builder.add_node("customer_service", customer_service_node)
-builder.add_node("weather_service", weather_service_node)
-
-ecommerce_system = builder.compile()
+    # The parent graph checkpoints the conversation; the agent's inner tool
+    # loop does not need checkpoints of its own.
+    return graph_builder.compile(checkpointer=False)
+
+def agent_command(state: SupervisorState, result: dict, agent_name: str, facts: FactStore) -> Command[Literal["supervisor", "__end__"]]:
+    """Return the agent's answer and the facts it fetched, reporting the request as fully handled when it had one intent."""
+    handled = FAST_FINISH and pre_router.fully_handled(state["messages"], agent_name)
+    agent_span = current_span()
+    if agent_span is not None:
+        agent_span.set_attribute("fast_finish", handled)
+        agent_span.set_attribute("facts_reused", facts.hits)
+        if handled:
+            agent_span.set_attribute("display", f"{agent_span.attributes['display']}, request fully handled 🏁")
+    update = {
+        "messages": [
+            HumanMessage(content=result["messages"][-1].content, name=agent_name)
+        ]
+    }
+    if FACTS_ENABLED:
+        update["facts"] = facts.snapshot()
+    return Command(update=update, goto=END if handled else "supervisor")
+
+def create_agent_node(agent, agent_name: str, banner: str):
+    """Graph node that runs an agent subgraph and hands its answer back."""
+
+    def agent_node(state: SupervisorState) -> Command[Literal["supervisor", "__end__"]]:
+        with span(agent_name, kind="agent", display=banner), use_facts(FactStore.for_state(state)) as facts:
+            result = agent.invoke({"messages": state["messages"]})
+            return agent_command(state, result, agent_name, facts)
+
+    async def aagent_node(state: SupervisorState) -> Command[Literal["supervisor", "__end__"]]:
+        with span(agent_name, kind="agent", display=banner), use_facts(FactStore.for_state(state)) as facts:
+            result = await agent.ainvoke({"messages": state["messages"]})
+            return agent_command(state, result, agent_name, facts)
+
+    return RunnableLambda(agent_node, afunc=aagent_node)
+
+agent_specs = [
+    # (node name, agent title, tools, console line printed when the agent answers)
+    ("order_management", "Order Management", order_tools, "📦 Order Management Agent answered"),
+    ("product_information", "Product Information", product_tools, "🛍️ Product Information Agent answered"),
+    ("customer_service", "Customer Service", customer_tools, "👤 Customer Service Agent answered"),
+    ("weather_service", "Weather Service", weather_tools, "🌤️ Weather Service Agent answered"),
+]
+
+def build_ecommerce_system(llm, checkpointer=None, models=None, escalation_llm=None):
+    """Compile the supervisor graph around the given chat model.
+
+    models maps node names to the chat model that node should use instead
+    of llm; escalation_llm takes over routing decisions the supervisor's
+    model is unsure of.
+    """
+    models = models or {}
+    builder = StateGraph(SupervisorState)
+
+    builder.add_edge(START, "supervisor")
+    builder.add_node("supervisor", create_supervisor(models.get("supervisor", llm), escalation_llm))
+
+    for agent_name, title, tools, banner in agent_specs:
+        agent = create_agent(models.get(agent_name, llm), tools, title, domain=agent_name)
+        builder.add_node(agent_name, create_agent_node(agent, agent_name, banner))
+
+    return builder.compile(checkpointer=checkpointer)
+
+
+ecommerce_system = build_ecommerce_system(llm, checkpointer, models=node_models(), escalation_llm=escalation_model())
 
 print("✅ E-commerce Multi-Agent System created successfully!")
 
 
-def test_system(query: str):
-    """Test the multi-agent system with a query."""
+STREAM_MODES = ["messages", "custom", "updates"]
+
+def stream_event_list(namespace: tuple, mode: str, data) -> List[dict]:
+    """Translate one LangGraph stream part into UI events.
+
+    Events are dicts with a "type":
+    - route: the supervisor chose "agents" (decided by "source");
+    - tool_start / tool_end: an agent is calling "tool";
+    - token: the next piece of an agent's answer, as "text";
+    - answer: the agent's complete reply, as "text".
+    Every event from inside an agent carries that agent's name as "agent".
+    """
+    agent = namespace[0].split(":")[0] if namespace else None
+    if mode == "custom":
+        return [{**data, "agent": agent} if agent else data]
+    if mode == "messages":
+        message, metadata = data
+        # Only the agents' own model output is user-facing; router JSON and
+        # tool-call arguments are not.
+        if agent and metadata.get("langgraph_node") == "agent" and isinstance(message, AIMessage):
+            if isinstance(message.content, str) and message.content:
+                return [{"type": "token", "agent": agent, "text": message.content}]
+        return []
+    if mode == "updates" and not namespace:
+        return [
+            {"type": "answer", "agent": node, "text": update["messages"][0].content}
+            for node, update in data.items()
+            if node in members and update and update.get("messages")
+        ]
+    return []
+
+
+def stream_events(query: str, config: Optional[dict] = None):
+    """Stream routing, tool and token events for a query as they happen.
+
+    Pass {"configurable": {"thread_id": ...}} to continue a conversation;
+    without one the query runs on a fresh thread.
+    """
+    config = thread_config(config)
+    with span("query", kind="query"):
+        for namespace, mode, data in ecommerce_system.stream(
+            {"messages": [("user", query)]}, config, stream_mode=STREAM_MODES, subgraphs=True
+        ):
+            yield from stream_event_list(namespace, mode, data)
+        compact_thread(ecommerce_system, config)
+
+
+async def astream_events(query: str, config: Optional[dict] = None):
+    """Async version of stream_events."""
+    config = thread_config(config)
+    with span("query", kind="query", display="⏱️ Query finished"):
+        async for namespace, mode, data in ecommerce_system.astream(
+            {"messages": [("user", query)]}, config, stream_mode=STREAM_MODES, subgraphs=True
+        ):
+            for event in stream_event_list(namespace, mode, data):
+                yield event
+        await acompact_thread(ecommerce_system, config)
+
+
+async def astream_query(query: str, config: Optional[dict] = None):
+    """Stream (agent, reply) pairs for a query through the async graph."""
+    async for event in astream_events(query, config):
+        if event["type"] == "answer":
+            yield event["agent"], event["text"]
+
+
+async def atest_system(query: str):
+    """Test the multi-agent system with a query on the async path."""
     print(f"\n{'='*60}")
     print(f"🔍 CUSTOMER QUERY: {query}")
     print(f"{'='*60}")
-    
-    for step in ecommerce_system.stream(
-        {"messages": [("user", query)]}, 
-        subgraphs=True
-    ):
-        if isinstance(step, tuple) and len(step) == 2:
-            thread_id, data = step
-            if thread_id == ():  
-                for key, value in data.items():
-                    if key != "supervisor" and value is not None:
-                        print(f"\n📋 {key.upper()} RESPONSE:")
-                        if 'messages' in value and value['messages']:
-                            print(value['messages'][0].content)
-        
+
+    async for agent, reply in astream_query(query):
+        print(f"\n📋 {agent.upper()} RESPONSE:")
+        print(reply)
+
     print(f"\n{'='*60}")
     print("✅ Query completed!")
+    if PRE_ROUTER_ENABLED:
+        stats = pre_router.stats
+        print(f"⚡ Pre-router: {stats.hits}/{stats.total} decisions without the LLM "
+              f"(hit rate {stats.hit_rate:.0%}, mean confidence {stats.mean_confidence:.2f}), "
+              f"{stats.fast_finishes} supervisor hop(s) skipped")
+    for name, stats in cache_stats().items():
+        print(f"🗄️ Cache {name}: {stats['hits']} hit(s), {stats['misses']} miss(es), {stats['size']} entries")
     print(f"{'='*60}\n")
 
+
+def test_system(query: str):
+    """Test the multi-agent system with a query."""
+    asyncio.run(atest_system(query))
@@ -0,0 +1,149 @@
+import argparse
+import sys
+import time
+import tracemalloc
+from itertools import islice
+from typing import Dict, Iterator, List, Optional, Sequence, Union
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, convert_to_messages
+
+
+class MessageLog(Sequence[BaseMessage]):
+    """Append-only message sequence that shares storage with the log it grew from.
+
+    A log is a read-only base (the parent graph's message list, never copied)
+    plus a tail list. Appending to the newest log extends that tail in place
+    and returns a longer view of it, so each step costs only the new messages.
+    Older views still see their own length; appending to one of them copies
+    its tail first. Messages are deduplicated by ID.
+    """
+
+    __slots__ = ("_base", "_tail", "_size", "_index")
+
+    def __init__(self, base: Sequence[BaseMessage] = (), _tail: Optional[List[BaseMessage]] = None,
+                 _size: int = 0, _index: Optional[Dict[str, int]] = None):
+        self._base = base
+        self._tail = [] if _tail is None else _tail
+        self._size = _size
+        # message ID -> position, built on the first append and shared with later views
+        self._index = _index
+
+    def __len__(self) -> int:
+        return len(self._base) + self._size
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self)[index]
+        length = len(self)
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError("MessageLog index out of range")
+        base_length = len(self._base)
+        return self._base[index] if index < base_length else self._tail[index - base_length]
+
+    def __iter__(self) -> Iterator[BaseMessage]:
+        yield from self._base
+        yield from islice(self._tail, self._size)
+
+    def __reversed__(self) -> Iterator[BaseMessage]:
+        for index in range(self._size - 1, -1, -1):
+            yield self._tail[index]
+        yield from reversed(self._base)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Sequence) or isinstance(other, str):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    def __repr__(self) -> str:
+        return f"MessageLog({list(self)!r})"
+
+    def _position(self, message_id: str) -> Optional[int]:
+        if self._index is None:
+            self._index = {message.id: position for position, message in enumerate(self) if message.id}
+        position = self._index.get(message_id)
+        return position if position is not None and position < len(self) else None
+
+    def extend(self, messages: Sequence[BaseMessage]) -> "MessageLog":
+        """A new log with the messages appended; a message whose ID is already logged replaces it."""
+        if self._size == len(self._tail):
+            tail, index = self._tail, self._index
+        else:
+            # Another log has already appended past this one, so branch off a copy
+            tail, index = self._tail[:self._size], None
+        log = MessageLog(self._base, tail, self._size, index)
+        for message in messages:
+            position = log._position(message.id) if message.id else None
+            if position is None:
+                log._tail.append(message)
+                log._size += 1
+                if message.id:
+                    log._index[message.id] = len(log) - 1
+            elif log[position] is not message:
+                log = log._replace(position, message)
+        return log
+
+    def _replace(self, position: int, message: BaseMessage) -> "MessageLog":
+        # Rare (LangGraph only re-sends an ID to edit a message), so just copy
+        messages = list(self)
+        messages[position] = message
+        return MessageLog(messages)
+
+
+def append_messages(left: Union[MessageLog, Sequence], right: Union[BaseMessage, Sequence]) -> MessageLog:
+    """State reducer that appends to a MessageLog instead of concatenating lists."""
+    if not isinstance(right, Sequence) or isinstance(right, str):
+        right = [right]
+    if not all(isinstance(message, BaseMessage) for message in right):
+        right = convert_to_messages(right)
+    if not isinstance(left, MessageLog):
+        left = MessageLog(left)
+    if not len(left):
+        # Entering a subgraph: share the parent's list instead of copying it
+        return right if isinstance(right, MessageLog) else MessageLog(right)
+    return left.extend(right)
+
+
+def concat_messages(left: Sequence, right: Sequence) -> list:
+    """The previous reducer, kept for comparison in the benchmark."""
+    return list(left) + list(right)
+
+
+def measure(reducer, history: int, steps: int, sample_every: int) -> List[dict]:
+    """Memory and time per tool-loop step for a reducer, after entering with `history` messages."""
+    parent = [HumanMessage(f"message {index}", id=f"h{index}") for index in range(history)]
+    new_messages = [[AIMessage(f"step {step}", id=f"a{step}")] for step in range(steps)]
+    state = reducer([] if reducer is concat_messages else MessageLog(), parent)
+    samples = []
+    tracemalloc.start()
+    for step, update in enumerate(new_messages, 1):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        started = time.perf_counter()
+        state = reducer(state, update)
+        elapsed = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1]
+        if step % sample_every == 0:
+            samples.append({"step": step, "bytes": peak - before, "us": round(elapsed * 1e6, 2)})
+    tracemalloc.stop()
+    return samples
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Compare per-step memory of the list-concat and MessageLog reducers.")
+    parser.add_argument("--history", type=int, default=2000, help="messages already in the conversation")
+    parser.add_argument("--steps", type=int, default=2000, help="messages appended one at a time")
+    parser.add_argument("--samples", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    sample_every = max(1, args.steps // args.samples)
+    for name, reducer in (("list concat", concat_messages), ("MessageLog", append_messages)):
+        print(f"📏 {name} reducer ({args.history} messages of history)")
+        for sample in measure(reducer, args.history, args.steps, sample_every):
+            print(f"   step {sample['step']:>6}: {sample['bytes']:>9,} bytes allocated, {sample['us']:>8} µs")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,66 @@
+import os
+from typing import Any, Dict, Optional
+
+from langchain_openai import ChatOpenAI
+
+
+# Each graph node can run on its own model. Routing is a small
+# classification, so the supervisor defaults to a cheaper model and hands the
+# decision to MODEL_NAME when its answer is unsure or unparseable.
+#
+# Per-node settings are read from <NODE>_MODEL, <NODE>_BASE_URL and
+# <NODE>_API_KEY, e.g. SUPERVISOR_MODEL or ORDER_MANAGEMENT_BASE_URL. A base
+# URL points the node at any OpenAI-compatible server (vLLM, Ollama, LM
+# Studio, ...).
+MODEL_NAME = os.getenv("MODEL_NAME", "gpt-4o")
+SUPERVISOR_MODEL = os.getenv("SUPERVISOR_MODEL", "gpt-4o-mini")
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+ROUTER_ESCALATION_ENABLED = os.getenv("ROUTER_ESCALATION_ENABLED", "true").lower() in ("1", "true", "yes")
+# Routing decisions the router model is less sure of than this are re-asked of MODEL_NAME.
+ROUTER_ESCALATION_CONFIDENCE = float(os.getenv("ROUTER_ESCALATION_CONFIDENCE", "0.6"))
+
+NODES = ["supervisor", "order_management", "product_information", "customer_service", "weather_service"]
+
+_models: Dict[tuple, ChatOpenAI] = {}
+
+
+def create_model(model: str = MODEL_NAME, base_url: Optional[str] = OPENAI_BASE_URL, api_key: Optional[str] = None) -> ChatOpenAI:
+    """A chat model client, shared by every node configured the same way."""
+    key = (model, base_url, api_key)
+    if key not in _models:
+        kwargs: Dict[str, Any] = {"model": model}
+        if base_url:
+            kwargs["base_url"] = base_url
+            # Local servers usually accept any key, but the client insists on one
+            api_key = api_key or os.getenv("OPENAI_API_KEY") or "not-needed"
+        if api_key:
+            kwargs["api_key"] = api_key
+        _models[key] = ChatOpenAI(**kwargs)
+    return _models[key]
+
+
+def node_setting(node: str, name: str, default: Optional[str] = None) -> Optional[str]:
+    return os.getenv(f"{node.upper()}_{name}") or default
+
+
+def node_model(node: str) -> ChatOpenAI:
+    default = SUPERVISOR_MODEL if node == "supervisor" else MODEL_NAME
+    return create_model(
+        node_setting(node, "MODEL", default),
+        node_setting(node, "BASE_URL", OPENAI_BASE_URL),
+        node_setting(node, "API_KEY"),
+    )
+
+
+def node_models() -> Dict[str, ChatOpenAI]:
+    """The configured model of every graph node."""
+    return {node: node_model(node) for node in NODES}
+
+
+def escalation_model() -> Optional[ChatOpenAI]:
+    """The model unsure routing decisions are escalated to, or None when escalation is off."""
+    return create_model() if ROUTER_ESCALATION_ENABLED else None
+
+
+def model_label(model: Any) -> str:
+    return getattr(model, "model_name", None) or type(model).__name__
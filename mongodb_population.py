@@ -1,18 +1,21 @@
-
+import os
+import argparse
 import pymongo
 from datetime import datetime, timedelta
-import random
-
-client = pymongo.MongoClient("")
-db = client["ecommerce_system"]
-
-orders_collection = db["orders"]
-products_collection = db["products"]
-customers_collection = db["customers"]
+from db_indexes import ensure_indexes
+from data_generator import generate
 
-orders_collection.delete_many({})
-products_collection.delete_many({})
-customers_collection.delete_many({})
+# Small hand-written demo dataset. For load-testing volumes pass --orders,
+# --products and/or --customers, which hands off to data_generator.py.
+#
+# Order fields written later by the order tools (agent_tools.py):
+#   cancelled_date  datetime, set when the order is cancelled
+#   return_date     datetime, set when the order is returned
+#   return_reason   str, set when the order is returned
+#   batch_id        str, transient: set by bulk_cancel_orders/bulk_process_returns
+#                   on the orders a call changed and unset again before it
+#                   returns. One left over by a call that failed midway is
+#                   never matched by another call and can be ignored.
 
 sample_orders = [
     {
@@ -196,11 +199,44 @@ sample_customers = [
     }
 ]
 
-orders_collection.insert_many(sample_orders)
-products_collection.insert_many(sample_products)
-customers_collection.insert_many(sample_customers)
 
-print("✅ MongoDB populated with sample data!")
-print(f"Orders: {orders_collection.count_documents({})}")
-print(f"Products: {products_collection.count_documents({})}")
-print(f"Customers: {customers_collection.count_documents({})}")
\ No newline at end of file
+def populate_demo_data(uri: str = os.getenv("MONGODB_URI", "mongodb://localhost:27017")):
+    client = pymongo.MongoClient(uri)
+    db = client["ecommerce_system"]
+
+    orders_collection = db["orders"]
+    products_collection = db["products"]
+    customers_collection = db["customers"]
+
+    orders_collection.delete_many({})
+    products_collection.delete_many({})
+    customers_collection.delete_many({})
+
+    orders_collection.insert_many(sample_orders)
+    products_collection.insert_many(sample_products)
+    customers_collection.insert_many(sample_customers)
+
+    ensure_indexes(db)
+
+    print("✅ MongoDB populated with sample data!")
+    print(f"Orders: {orders_collection.count_documents({})}")
+    print(f"Products: {products_collection.count_documents({})}")
+    print(f"Customers: {customers_collection.count_documents({})}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Populate ecommerce_system with demo or synthetic data.")
+    parser.add_argument("--orders", type=int, help="generate this many synthetic orders")
+    parser.add_argument("--products", type=int, help="generate this many synthetic products")
+    parser.add_argument("--customers", type=int, help="generate this many synthetic customers")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+    parser.add_argument("--resume", action="store_true")
+    args = parser.parse_args()
+
+    if args.orders or args.products or args.customers:
+        generate(
+            args.orders or 100_000, args.products or 5_000, args.customers or 20_000,
+            workers=args.workers, resume=args.resume,
+        )
+    else:
+        populate_demo_data()
@@ -0,0 +1,378 @@
+import math
+import os
+import re
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+
+from langchain_core.messages import BaseMessage, HumanMessage
+
+
+AGENTS = ["order_management", "product_information", "customer_service", "weather_service"]
+FINISH = "FINISH"
+
+PRE_ROUTER_ENABLED = os.getenv("PRE_ROUTER_ENABLED", "true").lower() in ("1", "true", "yes")
+PRE_ROUTER_THRESHOLD = float(os.getenv("PRE_ROUTER_THRESHOLD", "0.8"))
+
+
+@dataclass
+class IntentMatch:
+    """A single agent intent detected in a query."""
+    agent: str
+    confidence: float
+    position: int
+    source: str
+
+
+@dataclass
+class RouteDecision:
+    """A routing decision made without calling the LLM."""
+    next: str
+    confidence: float
+    source: str
+    intents: List[str] = field(default_factory=list)
+    pending: List[str] = field(default_factory=list)
+
+
+# A rule takes the raw query text and returns the intents it is sure about.
+Rule = Callable[[str], List[IntentMatch]]
+
+
+ID_PATTERNS = {
+    "order_management": (re.compile(r"\bORD\d+\b", re.IGNORECASE), 0.95),
+    "product_information": (re.compile(r"\bPRD\d+\b", re.IGNORECASE), 0.9),
+    # Customer IDs are often just the caller identifying themselves, so on
+    # their own they only weakly suggest the customer_service agent.
+    "customer_service": (re.compile(r"\bCUST\d+\b", re.IGNORECASE), 0.6),
+}
+
+# A keyword alone never decides a route: keyword matches stay below the
+# default threshold, so they only steer the LLM-free path when an ID rule
+# agrees, and otherwise leave the decision to the LLM.
+KEYWORD_CONFIDENCE = 0.7
+
+# "don't cancel", "no refund", ... a keyword shortly after a negation in the
+# same clause is not a request for that agent.
+NEGATION = re.compile(
+    r"\b(?:not|no|never|without|(?:do|does|did|wo|is|are|was|ca)n'?t)\b(?:\W+\w+){0,3}\W*$",
+    re.IGNORECASE,
+)
+CLAUSE_BREAK = re.compile(r"[.?!;,\n]|\b(?:and|but|also|then|plus)\b", re.IGNORECASE)
+# Clauses made only of these words ask for nothing.
+FILLER_WORDS = {"hi", "hello", "hey", "please", "thanks", "thank", "you", "ok", "okay", "so", "now"}
+
+
+def split_clauses(text: str) -> List[str]:
+    """The parts of a query that may each ask for something, without greetings."""
+    clauses = [clause.strip() for clause in CLAUSE_BREAK.split(text)]
+    return [clause for clause in clauses if set(tokenize(clause)) - FILLER_WORDS]
+
+KEYWORD_PATTERNS = {
+    "order_management": re.compile(
+        r"\b(orders?|cancel\w*|returns?|returning|refunds?|track\w*|shipped|shipment|deliver(y|ed))\b",
+        re.IGNORECASE,
+    ),
+    "product_information": re.compile(
+        r"\b(products?|search|find|recommend\w*|suggest\w*|items?|buy|price|catalog|headphones|"
+        r"watch|charger|jacket|boots|mat|umbrella|gloves)\b",
+        re.IGNORECASE,
+    ),
+    "customer_service": re.compile(
+        r"\b(loyalty|points|preferences?|profile|account|membership|tier|rewards?)\b",
+        re.IGNORECASE,
+    ),
+    "weather_service": re.compile(
+        r"\b(weather|forecast|temperature|rain\w*|snow\w*|sunny|humid\w*|climate)\b",
+        re.IGNORECASE,
+    ),
+}
+
+
+def tokenize(text: str) -> List[str]:
+    return re.findall(r"[a-z]+", text.lower())
+
+
+def id_rule(text: str) -> List[IntentMatch]:
+    """Detect intents from ORDxxx / PRDxxx / CUSTxxx identifiers."""
+    matches = []
+    for agent, (pattern, confidence) in ID_PATTERNS.items():
+        found = pattern.search(text)
+        if found:
+            matches.append(IntentMatch(agent, confidence, found.start(), "id"))
+    return matches
+
+
+def is_negated(text: str, position: int) -> bool:
+    """True when the word at position follows a negation in the same clause."""
+    before = text[:position]
+    clause_start = max((match.end() for match in CLAUSE_BREAK.finditer(before)), default=0)
+    return NEGATION.search(before[clause_start:]) is not None
+
+
+def keyword_rule(text: str) -> List[IntentMatch]:
+    """Detect intents from domain keywords, ignoring negated ones."""
+    matches = []
+    for agent, pattern in KEYWORD_PATTERNS.items():
+        for found in pattern.finditer(text):
+            if not is_negated(text, found.start()):
+                matches.append(IntentMatch(agent, KEYWORD_CONFIDENCE, found.start(), "keyword"))
+                break
+    return matches
+
+
+TRAINING_EXAMPLES = [
+    ("Check my order ORD001", "order_management"),
+    ("What's the status of order ORD002?", "order_management"),
+    ("Cancel my order", "order_management"),
+    ("I want to return my purchase and get a refund", "order_management"),
+    ("Where is my package", "order_management"),
+    ("Has my shipment left the warehouse", "order_management"),
+    ("Find wireless headphones", "product_information"),
+    ("Show me details for PRD003", "product_information"),
+    ("Do you sell yoga mats", "product_information"),
+    ("What goes well with the fitness watch", "product_information"),
+    ("Looking for a cheap phone charger", "product_information"),
+    ("Is this jacket in stock", "product_information"),
+    ("Update my preferences", "customer_service"),
+    ("Show me loyalty points for customer CUST001", "customer_service"),
+    ("What is my membership tier", "customer_service"),
+    ("Change my email address", "customer_service"),
+    ("What rewards can I redeem", "customer_service"),
+    ("Who am I registered as", "customer_service"),
+    ("Weather in New York", "weather_service"),
+    ("Will it rain in Chicago", "weather_service"),
+    ("Is it cold in Miami today", "weather_service"),
+    ("Will the storm delay delivery to Los Angeles", "weather_service"),
+    ("How hot is it outside", "weather_service"),
+    ("What should I wear for the weather", "weather_service"),
+]
+
+
+class NaiveBayesClassifier:
+    """A tiny multinomial naive Bayes intent classifier that runs locally."""
+
+    def __init__(self, examples: Iterable = TRAINING_EXAMPLES, alpha: float = 1.0):
+        self.alpha = alpha
+        self.word_counts: Dict[str, Counter] = defaultdict(Counter)
+        self.class_counts: Counter = Counter()
+        self.vocabulary = set()
+        for text, label in examples:
+            self.learn(text, label)
+
+    def learn(self, text: str, label: str):
+        tokens = tokenize(text)
+        self.class_counts[label] += 1
+        self.word_counts[label].update(tokens)
+        self.vocabulary.update(tokens)
+
+    def predict_proba(self, text: str) -> Dict[str, float]:
+        tokens = [t for t in tokenize(text) if t in self.vocabulary]
+        if not tokens:
+            return {}
+        total_examples = sum(self.class_counts.values())
+        vocabulary_size = len(self.vocabulary)
+        log_scores = {}
+        for label, count in self.class_counts.items():
+            label_total = sum(self.word_counts[label].values())
+            score = math.log(count / total_examples)
+            for token in tokens:
+                score += math.log(
+                    (self.word_counts[label][token] + self.alpha) / (label_total + self.alpha * vocabulary_size)
+                )
+            log_scores[label] = score
+        best = max(log_scores.values())
+        exp_scores = {label: math.exp(score - best) for label, score in log_scores.items()}
+        norm = sum(exp_scores.values())
+        return {label: score / norm for label, score in exp_scores.items()}
+
+    def __call__(self, text: str) -> List[IntentMatch]:
+        probabilities = self.predict_proba(text)
+        if not probabilities:
+            return []
+        label, probability = max(probabilities.items(), key=lambda item: item[1])
+        return [IntentMatch(label, probability, len(text), "classifier")]
+
+
+class RouterStats:
+    """Counters describing how often the pre-router saved an LLM call."""
+
+    def __init__(self):
+        self.total = 0
+        self.hits = 0
+        self.routes: Counter = Counter()
+        self.sources: Counter = Counter()
+        self.confidence_sum = 0.0
+        self.fast_finishes = 0
+
+    def record(self, decision: Optional[RouteDecision]):
+        self.total += 1
+        if decision is None:
+            return
+        self.hits += 1
+        self.routes[decision.next] += 1
+        self.sources[decision.source] += 1
+        self.confidence_sum += decision.confidence
+
+    @property
+    def fallbacks(self) -> int:
+        return self.total - self.hits
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.total if self.total else 0.0
+
+    @property
+    def mean_confidence(self) -> float:
+        return self.confidence_sum / self.hits if self.hits else 0.0
+
+    def snapshot(self) -> Dict:
+        return {
+            "total": self.total,
+            "hits": self.hits,
+            "fallbacks": self.fallbacks,
+            "hit_rate": round(self.hit_rate, 4),
+            "mean_confidence": round(self.mean_confidence, 4),
+            "routes": dict(self.routes),
+            "sources": dict(self.sources),
+            "fast_finishes": self.fast_finishes,
+        }
+
+
+def last_user_index(messages: Sequence[BaseMessage]) -> int:
+    """Index of the latest message written by the customer, or -1."""
+    for index in range(len(messages) - 1, -1, -1):
+        message = messages[index]
+        if isinstance(message, HumanMessage) and message.name not in AGENTS:
+            return index
+    return -1
+
+
+def answered_agents(messages: Sequence[BaseMessage]) -> List[str]:
+    """Agents that already replied to the latest customer message."""
+    start = last_user_index(messages)
+    return [
+        message.name for message in messages[start + 1:]
+        if isinstance(message, HumanMessage) and message.name in AGENTS
+    ]
+
+
+class PreRouter:
+    """Deterministic router that decides Router.next without the LLM when confident.
+
+    Rules are tried in order and each returns the intents it detected. The
+    classifier is only consulted when no rule matched anything.
+    """
+
+    def __init__(
+        self,
+        rules: Optional[List[Rule]] = None,
+        classifier: Optional[Rule] = None,
+        threshold: float = PRE_ROUTER_THRESHOLD,
+    ):
+        self.rules = rules if rules is not None else [id_rule, keyword_rule]
+        self.classifier = classifier if classifier is not None else NaiveBayesClassifier()
+        self.threshold = threshold
+        self.stats = RouterStats()
+
+    def detect_intents(self, text: str) -> List[IntentMatch]:
+        """Return the agents the query needs, ordered by first mention."""
+        best: Dict[str, IntentMatch] = {}
+        for rule in self.rules:
+            for match in rule(text):
+                current = best.get(match.agent)
+                if current is None or match.confidence > current.confidence:
+                    best[match.agent] = IntentMatch(
+                        match.agent,
+                        match.confidence,
+                        min(match.position, current.position) if current else match.position,
+                        match.source,
+                    )
+        if not best and self.classifier is not None:
+            for match in self.classifier(text):
+                best[match.agent] = match
+
+        # A bare customer ID next to another request only identifies the caller.
+        customer = best.get("customer_service")
+        if customer and customer.source == "id" and len(best) > 1:
+            del best["customer_service"]
+
+        # The weather agent handles weather-based product recommendations itself.
+        product = best.get("product_information")
+        if "weather_service" in best and product and product.source != "id":
+            del best["product_information"]
+
+        return sorted(best.values(), key=lambda match: match.position)
+
+    def clause_agents(self, text: str) -> Optional[set]:
+        """Agents the rules are confident about for every clause of the query.
+
+        None when some clause has no confident intent, e.g. "... and what is
+        the email on file for CUST001" or "... also do you ship to Canada?".
+        Such a query needs the LLM to make sure no part of it is dropped.
+        """
+        agents = set()
+        clauses = split_clauses(text)
+        if not clauses:
+            return None
+        for clause in clauses:
+            confident = [match.agent for match in self.detect_intents(clause) if match.confidence >= self.threshold]
+            if not confident:
+                return None
+            agents.update(confident)
+        return agents
+
+    def decide(self, messages: Sequence[BaseMessage]) -> Optional[RouteDecision]:
+        """Pick the next agent (or FINISH) from the conversation, or None to defer to the LLM."""
+        start = last_user_index(messages)
+        if start < 0:
+            return None
+        query = messages[start].content
+        if not isinstance(query, str):
+            return None
+
+        intents = self.detect_intents(query)
+        if not intents:
+            return None
+
+        answered = set(answered_agents(messages))
+        remaining = [match for match in intents if match.agent not in answered]
+        names = [match.agent for match in intents]
+        if remaining:
+            match = remaining[0]
+            confidence = min(pending.confidence for pending in remaining)
+            return RouteDecision(
+                match.agent, confidence, match.source, names, [pending.agent for pending in remaining]
+            )
+        # Only finish without the LLM when the rules understood the whole query
+        if self.clause_agents(query) is None:
+            return None
+        confidence = min(match.confidence for match in intents)
+        return RouteDecision(FINISH, confidence, "answered", names)
+
+    def fully_handled(self, messages: Sequence[BaseMessage], agent: str) -> bool:
+        """True when every clause of the latest query is confidently agent's and nobody else's."""
+        start = last_user_index(messages)
+        if start < 0 or not isinstance(messages[start].content, str):
+            return False
+        query = messages[start].content
+        intents = self.detect_intents(query)
+        handled = (
+            len(intents) == 1
+            and intents[0].agent == agent
+            and intents[0].confidence >= self.threshold
+            and self.clause_agents(query) == {agent}
+        )
+        if handled:
+            self.stats.fast_finishes += 1
+        return handled
+
+    def route(self, messages: Sequence[BaseMessage]) -> Optional[RouteDecision]:
+        """Like decide(), but only returns decisions above the threshold and records stats."""
+        decision = self.decide(messages)
+        if decision is not None and decision.confidence < self.threshold:
+            decision = None
+        self.stats.record(decision)
+        return decision
+
+
+pre_router = PreRouter()
@@ -0,0 +1,151 @@
+import asyncio
+import contextvars
+import os
+import re
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import agent_tools
+from weather import SIMULATED_WEATHER
+from facts import FactStore, FACTS_ENABLED, request_key, use_facts
+from telemetry import span
+
+
+# The documents a message names (orders, customers, products, cities) are
+# loaded into the request's FactStore while the supervisor is still routing.
+# Tools wait briefly for that load and then find their documents already
+# there, so the Mongo round trips overlap with the LLM calls.
+PREFETCH_ENABLED = FACTS_ENABLED and os.getenv("PREFETCH_ENABLED", "true").lower() in ("1", "true", "yes")
+PREFETCH_WORKERS = int(os.getenv("PREFETCH_WORKERS", "4"))
+# Longest a tool waits for an unfinished prefetch before querying on its own.
+PREFETCH_WAIT_SECONDS = float(os.getenv("PREFETCH_WAIT_SECONDS", "1.0"))
+# At most this many entities of each kind are prefetched per message.
+PREFETCH_MAX_IDS = 20
+
+ORDER_ID = re.compile(r"\bORD\d+\b", re.IGNORECASE)
+CUSTOMER_ID = re.compile(r"\bCUST\d+\b", re.IGNORECASE)
+PRODUCT_ID = re.compile(r"\bPRD\d+\b", re.IGNORECASE)
+# Bare city names map to the "City, ST" form the weather tools are called with.
+CITY_NAMES = {location.split(",")[0].lower(): location for location in SIMULATED_WEATHER}
+CITY = re.compile(r"\b(" + "|".join(re.escape(city) for city in CITY_NAMES) + r")\b", re.IGNORECASE)
+LOCATION = re.compile(r"\b((?:[A-Z][a-z]+ )*[A-Z][a-z]+, [A-Z]{2})\b")
+
+_executor = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="prefetch")
+# Keeps stores with a prefetch alive until the agents of the request pick them up.
+_pinned: deque = deque(maxlen=256)
+
+
+def _ids(pattern, text: str) -> List[str]:
+    return list(dict.fromkeys(match.upper() for match in pattern.findall(text)))[:PREFETCH_MAX_IDS]
+
+
+def extract_entities(text: str) -> Dict[str, List[str]]:
+    """Order, customer and product IDs and weather locations mentioned in a message."""
+    locations = LOCATION.findall(text) + [CITY_NAMES[city.lower()] for city in CITY.findall(text)]
+    return {
+        "orders": _ids(ORDER_ID, text),
+        "customers": _ids(CUSTOMER_ID, text),
+        "products": _ids(PRODUCT_ID, text),
+        "locations": list(dict.fromkeys(locations))[:PREFETCH_MAX_IDS],
+    }
+
+
+def prefetch_entities(entities: Dict[str, List[str]]) -> int:
+    """Load the entities into the current FactStore; failures are left for the tools to report."""
+    loaders = [
+        (agent_tools.load_orders, [entities["orders"]] if entities["orders"] else []),
+        (agent_tools.load_customer, entities["customers"]),
+        (agent_tools.load_products, [entities["products"]] if entities["products"] else []),
+        (agent_tools.load_weather, entities["locations"]),
+    ]
+    failures = 0
+    with span("prefetch", kind="prefetch", **{kind: len(keys) for kind, keys in entities.items()}) as prefetch_span:
+        for loader, arguments in loaders:
+            for argument in arguments:
+                try:
+                    loader(argument)
+                except Exception:
+                    failures += 1
+        if prefetch_span is not None:
+            prefetch_span.set_attribute("failures", failures)
+    return failures
+
+
+async def aprefetch_entities(entities: Dict[str, List[str]]) -> int:
+    calls = [agent_tools.aload_weather(location) for location in entities["locations"]]
+    if entities["orders"]:
+        calls.append(agent_tools.aload_orders(entities["orders"]))
+    calls += [agent_tools.aload_customer(customer_id) for customer_id in entities["customers"]]
+    if entities["products"]:
+        calls.append(agent_tools.aload_products(entities["products"]))
+    with span("prefetch", kind="prefetch", **{kind: len(keys) for kind, keys in entities.items()}) as prefetch_span:
+        results = await asyncio.gather(*calls, return_exceptions=True)
+        failures = sum(isinstance(result, Exception) for result in results)
+        if prefetch_span is not None:
+            prefetch_span.set_attribute("failures", failures)
+    return failures
+
+
+def _prefetch_store(state) -> Optional[tuple]:
+    """The request's store and its entities, when this is the request's first hop and it names any."""
+    if not PREFETCH_ENABLED:
+        return None
+    request = request_key(state["messages"])
+    if request is None or (state.get("facts") or {}).get("request") == request:
+        return None
+    store = FactStore.for_state(state)
+    if store.pending is not None:
+        return None
+    entities = extract_entities(str(next(m for m in reversed(state["messages"]) if m.id == request).content))
+    if not any(entities.values()):
+        return None
+    _pinned.append(store)
+    return store, entities
+
+
+def start_prefetch(state) -> Optional[Future]:
+    """Start loading the entities of a new customer message on a worker thread."""
+    found = _prefetch_store(state)
+    if found is None:
+        return None
+    store, entities = found
+    with use_facts(store):
+        context = contextvars.copy_context()
+    store.pending = _executor.submit(context.run, prefetch_entities, entities)
+    return store.pending
+
+
+def astart_prefetch(state) -> Optional[asyncio.Task]:
+    """Start loading the entities of a new customer message as a task on the running loop."""
+    found = _prefetch_store(state)
+    if found is None:
+        return None
+    store, entities = found
+    with use_facts(store):
+        # The task copies the current context, store included
+        store.pending = asyncio.create_task(aprefetch_entities(entities))
+    return store.pending
+
+
+def wait_for_prefetch(store: Optional[FactStore]):
+    """Block until the store's prefetch is done, for at most PREFETCH_WAIT_SECONDS."""
+    pending = store.pending if store is not None else None
+    if isinstance(pending, Future) and not pending.done():
+        try:
+            pending.result(timeout=PREFETCH_WAIT_SECONDS)
+        except Exception:
+            # Timed out or failed: the tool simply queries on its own
+            pass
+
+
+async def await_prefetch(store: Optional[FactStore]):
+    pending = store.pending if store is not None else None
+    if pending is None or pending.done():
+        return
+    if isinstance(pending, Future):
+        pending = asyncio.wrap_future(pending)
+    try:
+        await asyncio.wait_for(asyncio.shield(pending), PREFETCH_WAIT_SECONDS)
+    except Exception:
+        pass
@@ -0,0 +1,262 @@
+import bisect
+import heapq
+import math
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+
+# "memory" keeps an in-process inverted index, "text" uses a Mongo text
+# index and "regex" is the original unindexed $regex scan.
+PRODUCT_SEARCH_BACKEND = os.getenv("PRODUCT_SEARCH_BACKEND", "memory").lower()
+PRODUCT_INDEX_REFRESH_SECONDS = float(os.getenv("PRODUCT_INDEX_REFRESH_SECONDS", "600"))
+
+TEXT_INDEX_NAME = "product_text"
+
+FIELD_WEIGHTS = {"name": 3.0, "category": 2.0, "description": 1.0}
+STOP_WORDS = {"a", "an", "and", "the", "for", "with", "of", "in", "on", "to", "me", "my", "i", "some", "any"}
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+
+def stem(token: str) -> str:
+    """Very small plural stemmer so "headphones" matches "headphone"."""
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 3 and token.endswith("es") and token[-3] in "sxz":
+        return token[:-2]
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    return [stem(token) for token in re.findall(r"[a-z0-9]+", text.lower()) if token not in STOP_WORDS]
+
+
+def normalize_category(category: str) -> str:
+    return category.strip().lower()
+
+
+def name_entry(product_id: str, product: Dict[str, Any]) -> Tuple[str, str]:
+    return str(product.get("name", "")), product_id
+
+
+class ProductSearchIndex:
+    """In-process inverted index over product name, category and description with BM25 ranking.
+
+    The index is built once from the products collection, normally in the
+    background at startup, and then kept up to date with upsert()/remove(),
+    so searches never scan the collection. Every category also keeps its
+    products sorted by name, so browsing without search terms reads the head
+    of one list.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._postings: Dict[str, Dict[str, float]] = defaultdict(dict)
+        self._doc_terms: Dict[str, Dict[str, float]] = {}
+        self._doc_lengths: Dict[str, float] = {}
+        self._categories: Dict[str, set] = defaultdict(set)
+        # (name, product_id) pairs, sorted, per category and for the whole catalog
+        self._names: Dict[str, List[Tuple[str, str]]] = defaultdict(list)
+        self._all_names: List[Tuple[str, str]] = []
+        self._products: Dict[str, Dict[str, Any]] = {}
+        self._total_length = 0.0
+        self.built_at: Optional[float] = None
+        self.stale = False
+        self._rebuilding = False
+        self._build_done = threading.Event()
+        self._build_done.set()
+
+    def __len__(self) -> int:
+        return len(self._products)
+
+    @property
+    def is_built(self) -> bool:
+        return self.built_at is not None
+
+    @property
+    def building(self) -> bool:
+        return self._rebuilding
+
+    def _weighted_terms(self, product: Dict[str, Any]) -> Dict[str, float]:
+        terms: Dict[str, float] = defaultdict(float)
+        for field, weight in FIELD_WEIGHTS.items():
+            for token in tokenize(str(product.get(field, ""))):
+                terms[token] += weight
+        return terms
+
+    def _remove_locked(self, product_id: str):
+        product = self._products.pop(product_id, None)
+        if product is None:
+            return
+        for token in self._doc_terms.pop(product_id, {}):
+            postings = self._postings.get(token)
+            if postings is not None:
+                postings.pop(product_id, None)
+                if not postings:
+                    del self._postings[token]
+        self._total_length -= self._doc_lengths.pop(product_id, 0.0)
+        category = normalize_category(product.get("category", ""))
+        self._categories[category].discard(product_id)
+        entry = name_entry(product_id, product)
+        for names in (self._names[category], self._all_names):
+            position = bisect.bisect_left(names, entry)
+            if position < len(names) and names[position] == entry:
+                del names[position]
+
+    def _add_locked(self, product_id: str, product: Dict[str, Any], terms: Dict[str, float]):
+        self._products[product_id] = product
+        self._doc_terms[product_id] = terms
+        length = sum(terms.values())
+        self._doc_lengths[product_id] = length
+        self._total_length += length
+        for token, frequency in terms.items():
+            self._postings[token][product_id] = frequency
+        self._categories[normalize_category(product.get("category", ""))].add(product_id)
+
+    def upsert(self, product: Dict[str, Any]):
+        product = {key: value for key, value in product.items() if key != "_id"}
+        product_id = product["product_id"]
+        terms = self._weighted_terms(product)
+        with self._lock:
+            self._remove_locked(product_id)
+            self._add_locked(product_id, product, terms)
+            entry = name_entry(product_id, product)
+            bisect.insort(self._names[normalize_category(product.get("category", ""))], entry)
+            bisect.insort(self._all_names, entry)
+
+    def remove(self, product_id: str):
+        with self._lock:
+            self._remove_locked(product_id)
+
+    def build(self, products: Iterable[Dict[str, Any]]):
+        """Replace the index contents with the given products."""
+        fresh = ProductSearchIndex()
+        for product in products:
+            product = {key: value for key, value in product.items() if key != "_id"}
+            fresh._remove_locked(product["product_id"])
+            fresh._add_locked(product["product_id"], product, fresh._weighted_terms(product))
+        for product_id, product in fresh._products.items():
+            entry = name_entry(product_id, product)
+            fresh._names[normalize_category(product.get("category", ""))].append(entry)
+            fresh._all_names.append(entry)
+        for names in fresh._names.values():
+            names.sort()
+        fresh._all_names.sort()
+        with self._lock:
+            self._postings = fresh._postings
+            self._doc_terms = fresh._doc_terms
+            self._doc_lengths = fresh._doc_lengths
+            self._categories = fresh._categories
+            self._names = fresh._names
+            self._all_names = fresh._all_names
+            self._products = fresh._products
+            self._total_length = fresh._total_length
+            self.built_at = time.monotonic()
+            self.stale = False
+
+    def build_in_background(self, load_products: Callable[[], Iterable[Dict[str, Any]]]):
+        """Start a build on a background thread unless one is already running."""
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+            self._build_done.clear()
+
+        def rebuild():
+            try:
+                self.build(load_products())
+            except Exception as e:
+                print(f"⚠️ Could not build the product search index: {e}")
+            finally:
+                self._rebuilding = False
+                self._build_done.set()
+
+        threading.Thread(target=rebuild, name="product-index-rebuild", daemon=True).start()
+
+    def wait_built(self, timeout: Optional[float] = None) -> bool:
+        """Wait for a running background build; returns whether the index is built."""
+        self._build_done.wait(timeout)
+        return self.is_built
+
+    def ensure_built(self, load_products: Callable[[], Iterable[Dict[str, Any]]]):
+        """Build on first use (or wait for a running startup build); afterwards rebuild in the background when stale or old."""
+        if not self.is_built and not self.wait_built():
+            self.build(load_products())
+            return
+        expired = time.monotonic() - self.built_at > PRODUCT_INDEX_REFRESH_SECONDS
+        if self.stale or expired:
+            self.build_in_background(load_products)
+
+    def on_change(self, product_id: Optional[str], product: Optional[Dict[str, Any]]):
+        """Change listener compatible with cache.add_change_listener."""
+        if product is not None:
+            self.upsert(product)
+        elif product_id is not None:
+            self.remove(product_id)
+        else:
+            self.stale = True
+
+    def search(self, query: str, category: Optional[str] = None, limit: int = 10) -> List[Dict[str, Any]]:
+        """Return up to limit products ranked by BM25, optionally restricted to one category."""
+        tokens = tokenize(query or "")
+        with self._lock:
+            allowed = self._categories.get(normalize_category(category)) if category else None
+            if category and not allowed:
+                return []
+            if not tokens:
+                names = self._names[normalize_category(category)] if category else self._all_names
+                return [self._products[product_id] for _, product_id in names[:limit]]
+
+            count = len(self._products)
+            average_length = self._total_length / count if count else 0.0
+            scores: Dict[str, float] = defaultdict(float)
+            for token in set(tokens):
+                postings = self._postings.get(token)
+                if not postings:
+                    continue
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for product_id, frequency in postings.items():
+                    if allowed is not None and product_id not in allowed:
+                        continue
+                    length_norm = 1 - B + B * self._doc_lengths[product_id] / average_length
+                    scores[product_id] += idf * frequency * (K1 + 1) / (frequency + K1 * length_norm)
+
+            ranked = heapq.nsmallest(limit, scores.items(), key=lambda item: (-item[1], item[0]))
+            return [self._products[product_id] for product_id, _ in ranked]
+
+
+def text_search_query(query: str, category: Optional[str] = None) -> Dict[str, Any]:
+    """Filter for the Mongo text index backend. Categories are stored title-cased."""
+    search_filter: Dict[str, Any] = {}
+    if query:
+        search_filter["$text"] = {"$search": query}
+    if category:
+        search_filter["category"] = category.strip().title()
+    return search_filter
+
+
+def text_search_projection(query: str) -> Dict[str, Any]:
+    projection: Dict[str, Any] = {"_id": 0}
+    if query:
+        projection["score"] = {"$meta": "textScore"}
+    return projection
+
+
+def ensure_text_index(collection):
+    """Create the weighted text index used by the "text" backend (no-op if it exists)."""
+    return collection.create_index(
+        [("name", "text"), ("description", "text")],
+        name=TEXT_INDEX_NAME,
+        weights={"name": 3, "description": 1},
+    )
+
+
+product_index = ProductSearchIndex()
@@ -0,0 +1,340 @@
+import argparse
+import asyncio
+import json
+import math
+import os
+import sys
+import time
+from contextlib import asynccontextmanager, suppress
+from typing import Any, AsyncIterator, Callable, Dict, Optional
+
+import uvicorn
+from dotenv import load_dotenv
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+from telemetry import SERVER_QUEUE_SECONDS, SERVER_REQUESTS, render_prometheus
+
+
+# HTTP/SSE API for ecommerce_system. Every worker process builds its own
+# graph, models and Mongo clients once at startup. Conversation memory lives
+# in the SQLite checkpoint store, which is single-writer and cannot be
+# shared, so several workers need checkpointing turned off (see main()).
+# Metrics and admission state are per worker as well. Within a worker at most
+# SERVER_CONCURRENCY graph runs execute at once, at most SERVER_QUEUE_SIZE
+# requests wait for a slot, and everything beyond that is rejected with 503
+# straight away instead of piling up. Each request has a deadline covering
+# both its wait and its run.
+SERVER_HOST = os.getenv("SERVER_HOST", "0.0.0.0")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "8000"))
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", "1"))
+SERVER_CONCURRENCY = int(os.getenv("SERVER_CONCURRENCY", "8"))
+SERVER_QUEUE_SIZE = int(os.getenv("SERVER_QUEUE_SIZE", "32"))
+# Default and upper bound for the X-Request-Timeout header, in seconds.
+SERVER_REQUEST_TIMEOUT_SECONDS = float(os.getenv("SERVER_REQUEST_TIMEOUT_SECONDS", "60"))
+
+MAX_MESSAGE_CHARS = 4000
+# Events buffered between a graph run and a slow SSE client before the run waits.
+STREAM_BUFFER_EVENTS = 64
+
+
+class Overloaded(Exception):
+    """The request was shed; retry_after hints when to try again, in seconds."""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class AdmissionController:
+    """Bounded concurrency plus a bounded FIFO queue for one worker.
+
+    A request is shed on arrival when the queue is full, or when the expected
+    wait (queue position × recent run time ÷ slots) already exceeds its
+    deadline, so it fails fast instead of timing out in the queue.
+    """
+
+    def __init__(self, concurrency: int = SERVER_CONCURRENCY, queue_size: int = SERVER_QUEUE_SIZE):
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.running = 0
+        self.queued = 0
+        # Moving average of graph run time, once one has finished
+        self.service_seconds: Optional[float] = None
+        self._slots = asyncio.Semaphore(concurrency)
+
+    def expected_wait(self) -> float:
+        if self.running < self.concurrency or self.service_seconds is None:
+            return 0.0
+        return (self.queued + 1) / self.concurrency * self.service_seconds
+
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self.expected_wait()))
+
+    async def acquire(self, deadline: float) -> float:
+        """Wait for a slot until the deadline; returns the run's start time for release()."""
+        if self.running >= self.concurrency or self.queued:
+            if self.queued >= self.queue_size:
+                raise Overloaded("queue full", self.retry_after())
+            if self.expected_wait() > deadline - time.monotonic():
+                raise Overloaded("expected wait exceeds the request deadline", self.retry_after())
+        self.queued += 1
+        waiting_since = time.monotonic()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), max(0.0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            raise Overloaded("no free slot before the request deadline", self.retry_after())
+        finally:
+            self.queued -= 1
+        started = time.monotonic()
+        SERVER_QUEUE_SECONDS.observe(started - waiting_since)
+        self.running += 1
+        return started
+
+    def release(self, started: float):
+        self.running -= 1
+        self._slots.release()
+        elapsed = time.monotonic() - started
+        self.service_seconds = elapsed if self.service_seconds is None else 0.8 * self.service_seconds + 0.2 * elapsed
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "queued": self.queued,
+            "concurrency": self.concurrency,
+            "queue_size": self.queue_size,
+            "service_seconds": round(self.service_seconds, 3) if self.service_seconds is not None else None,
+        }
+
+
+def request_deadline(request: Request) -> float:
+    """Absolute deadline from X-Request-Timeout, capped at SERVER_REQUEST_TIMEOUT_SECONDS."""
+    timeout = SERVER_REQUEST_TIMEOUT_SECONDS
+    header = request.headers.get("x-request-timeout")
+    if header:
+        try:
+            timeout = min(timeout, max(0.0, float(header)))
+        except ValueError:
+            pass
+    return time.monotonic() + timeout
+
+
+async def read_chat_request(request: Request) -> Dict[str, Any]:
+    try:
+        body = await request.json()
+    except ValueError:
+        raise ValueError("body must be JSON")
+    message = body.get("message") if isinstance(body, dict) else None
+    if not isinstance(message, str) or not message.strip():
+        raise ValueError('"message" must be a non-empty string')
+    if len(message) > MAX_MESSAGE_CHARS:
+        raise ValueError(f'"message" is longer than {MAX_MESSAGE_CHARS} characters')
+    thread_id = body.get("thread_id")
+    if thread_id is not None and not isinstance(thread_id, str):
+        raise ValueError('"thread_id" must be a string')
+    return {"message": message, "thread_id": thread_id}
+
+
+async def run_events(system, message: str, config: dict, deadline: float) -> AsyncIterator[dict]:
+    """Events of one graph run, which is cancelled if it outlives the deadline.
+
+    The graph runs in its own task and hands events over through a bounded
+    buffer, so a slow client slows the run down instead of growing memory.
+    """
+    buffer: asyncio.Queue = asyncio.Queue(maxsize=STREAM_BUFFER_EVENTS)
+
+    async def pump():
+        try:
+            async for event in system.astream_events(message, config):
+                await buffer.put(event)
+        except Exception as e:
+            await buffer.put({"type": "error", "error": f"Error running query: {str(e)}"})
+        await buffer.put(None)
+
+    producer = asyncio.create_task(pump())
+    try:
+        while True:
+            try:
+                event = await asyncio.wait_for(buffer.get(), max(0.0, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                raise DeadlineExceeded()
+            if event is None:
+                return
+            yield event
+    finally:
+        producer.cancel()
+        with suppress(asyncio.CancelledError):
+            await producer
+
+
+def overloaded_response(error: Overloaded, endpoint: str) -> JSONResponse:
+    SERVER_REQUESTS.inc(endpoint=endpoint, outcome="shed")
+    return JSONResponse({"error": f"Server busy: {error.reason}"}, status_code=503,
+                        headers={"Retry-After": str(math.ceil(error.retry_after))})
+
+
+async def chat(request: Request) -> JSONResponse:
+    """Run a query and answer with the agents' replies once the graph is done."""
+    deadline = request_deadline(request)
+    try:
+        body = await read_chat_request(request)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    admission: AdmissionController = request.app.state.admission
+    try:
+        started = await admission.acquire(deadline)
+    except Overloaded as e:
+        return overloaded_response(e, "chat")
+
+    system = request.app.state.system
+    config = system.thread_config({"configurable": {"thread_id": body["thread_id"]}} if body["thread_id"] else None)
+    answers, routes, errors = [], [], []
+    try:
+        async for event in run_events(system, body["message"], config, deadline):
+            if event["type"] == "answer":
+                answers.append({"agent": event["agent"], "text": event["text"]})
+            elif event["type"] == "route":
+                routes.append(event)
+            elif event["type"] == "error":
+                errors.append(event["error"])
+    except DeadlineExceeded:
+        SERVER_REQUESTS.inc(endpoint="chat", outcome="timeout")
+        return JSONResponse({"error": "Request deadline exceeded", "answers": answers}, status_code=504)
+    finally:
+        admission.release(started)
+
+    if errors:
+        SERVER_REQUESTS.inc(endpoint="chat", outcome="error")
+        return JSONResponse({"error": errors[0], "answers": answers}, status_code=500)
+    SERVER_REQUESTS.inc(endpoint="chat", outcome="ok")
+    return JSONResponse({
+        "thread_id": config["configurable"]["thread_id"],
+        "answers": answers,
+        "routes": routes,
+    })
+
+
+class AdmittedStreamingResponse(StreamingResponse):
+    """Streaming response that gives its admission slot back however the response ends.
+
+    The body generator may never start, e.g. when the client is gone before
+    the headers are sent, so its own finally block cannot be relied on.
+    """
+
+    def __init__(self, content, on_close: Callable[[], None], **kwargs):
+        super().__init__(content, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.on_close()
+
+
+def sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+async def chat_stream(request: Request):
+    """Run a query and stream its events as server-sent events, ending with "done"."""
+    deadline = request_deadline(request)
+    try:
+        body = await read_chat_request(request)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    admission: AdmissionController = request.app.state.admission
+    try:
+        started = await admission.acquire(deadline)
+    except Overloaded as e:
+        return overloaded_response(e, "chat_stream")
+
+    system = request.app.state.system
+    config = system.thread_config({"configurable": {"thread_id": body["thread_id"]}} if body["thread_id"] else None)
+    thread_id = config["configurable"]["thread_id"]
+    # Stays "disconnected" unless the stream gets to its end
+    outcome = {"value": "disconnected"}
+
+    async def stream():
+        try:
+            errored = False
+            async for event in run_events(system, body["message"], config, deadline):
+                errored = errored or event["type"] == "error"
+                yield sse(event["type"], event)
+            yield sse("done", {"thread_id": thread_id})
+            outcome["value"] = "error" if errored else "ok"
+        except DeadlineExceeded:
+            outcome["value"] = "timeout"
+            yield sse("error", {"type": "error", "error": "Request deadline exceeded"})
+
+    def close():
+        admission.release(started)
+        SERVER_REQUESTS.inc(endpoint="chat_stream", outcome=outcome["value"])
+
+    return AdmittedStreamingResponse(stream(), close, media_type="text/event-stream",
+                                     headers={"Cache-Control": "no-cache", "X-Thread-Id": thread_id})
+
+
+async def health(request: Request) -> JSONResponse:
+    admission: AdmissionController = request.app.state.admission
+    return JSONResponse({"status": "ok", "pid": os.getpid(), **admission.stats()})
+
+
+async def metrics(request: Request) -> PlainTextResponse:
+    """Prometheus metrics of the worker that answered; they are not aggregated across workers."""
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4",
+                             headers={"X-Worker-Pid": str(os.getpid())})
+
+
+@asynccontextmanager
+async def lifespan(app: Starlette):
+    # Importing main builds the graph, models, checkpointer and Mongo client
+    # of this worker; the async Mongo client is bound to this event loop.
+    import agent_tools
+    import main
+
+    agent_tools.get_async_db()
+    app.state.system = main
+    app.state.admission = AdmissionController()
+    print(f"🚀 Worker {os.getpid()} ready: {SERVER_CONCURRENCY} concurrent run(s), queue of {SERVER_QUEUE_SIZE}")
+    yield
+
+
+app = Starlette(
+    routes=[
+        Route("/chat", chat, methods=["POST"]),
+        Route("/chat/stream", chat_stream, methods=["POST"]),
+        Route("/health", health),
+        Route("/metrics", metrics),
+    ],
+    lifespan=lifespan,
+)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Serve the e-commerce assistant over HTTP and SSE.")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=SERVER_WORKERS, help="worker processes, each with its own graph")
+    args = parser.parse_args(argv)
+    load_dotenv()
+    from checkpoints import CHECKPOINT_ENABLED
+
+    if args.workers > 1 and CHECKPOINT_ENABLED:
+        # Every worker would open the same single-writer SQLite file, and the
+        # turns of one thread can land on different workers.
+        parser.error("several workers need CHECKPOINT_ENABLED=false: the SQLite checkpoint store cannot be "
+                     "shared between processes. Run one worker per instance to keep conversation memory.")
+    uvicorn.run("server:app", host=args.host, port=args.port, workers=args.workers)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
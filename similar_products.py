@@ -0,0 +1,388 @@
+import argparse
+import contextlib
+import json
+import math
+import os
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from collections import defaultdict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from product_search import normalize_category, tokenize
+
+
+# Every product is embedded as a hashed TF-IDF vector of its name, category,
+# description, price band and weather tags. The vectors are L2-normalised rows
+# of one float32 matrix, so "similar items" for a batch of products is a
+# single matrix product. By default the index lives in memory only. With
+# SIMILARITY_INDEX_PATH set, the matrix is saved next to a small JSON sidecar
+# and memory-mapped on startup instead of being rebuilt. Saved files are
+# scoped to the database they were built from.
+#
+# A product only sets a dozen or so of the hashed buckets. The matrix is
+# stored column-major and a query multiplies only the columns its vectors
+# use, which reads a few percent of the matrix instead of all of it.
+SIMILAR_PRODUCTS_ENABLED = os.getenv("SIMILAR_PRODUCTS_ENABLED", "true").lower() in ("1", "true", "yes")
+# Memory is products × dimensions × 4 bytes (about 10 MB for 5,000 products at 512).
+SIMILARITY_DIMENSIONS = int(os.getenv("SIMILARITY_DIMENSIONS", "512"))
+# Files <path>.<scope>.npy and <path>.<scope>.json, where the scope names the
+# database; empty (the default) keeps the index in memory only.
+SIMILARITY_INDEX_PATH = os.getenv("SIMILARITY_INDEX_PATH", "")
+SIMILARITY_INDEX_REFRESH_SECONDS = float(os.getenv("SIMILARITY_INDEX_REFRESH_SECONDS", "3600"))
+
+TEXT_FIELD_WEIGHTS = {"name": 3.0, "category": 1.0, "description": 1.0}
+CATEGORY_WEIGHT = 3.0
+PRICE_WEIGHT = 1.5
+WEATHER_WEIGHT = 1.0
+# Products less similar than this are never suggested.
+MIN_SIMILARITY = 0.05
+
+
+def product_features(product: Dict[str, Any]) -> Dict[str, float]:
+    """Weighted features of a product before hashing."""
+    features: Dict[str, float] = defaultdict(float)
+    for field, weight in TEXT_FIELD_WEIGHTS.items():
+        for token in tokenize(str(product.get(field, ""))):
+            features[token] += weight
+    # Damp repeated words
+    features = defaultdict(float, {token: 1.0 + math.log(weight) if weight > 1 else weight
+                                   for token, weight in features.items()})
+    if product.get("category"):
+        features[f"category:{normalize_category(product['category'])}"] += CATEGORY_WEIGHT
+    price = product.get("price") or 0
+    if price > 0:
+        # Neighbouring price bands (powers of two) overlap, so close prices stay similar
+        band = int(math.log2(price))
+        features[f"price:{band}"] += PRICE_WEIGHT
+        features[f"price:{band - 1}"] += PRICE_WEIGHT / 2
+        features[f"price:{band + 1}"] += PRICE_WEIGHT / 2
+    for tag in product.get("weather_suitable") or []:
+        features[f"weather:{tag}"] += WEATHER_WEIGHT
+    return features
+
+
+def hash_features(features: Dict[str, float], dimensions: int) -> np.ndarray:
+    """Signed feature hashing; crc32 keeps buckets stable across processes."""
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for feature, weight in features.items():
+        digest = zlib.crc32(feature.encode())
+        vector[digest % dimensions] += weight if digest & 0x80000000 else -weight
+    return vector
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class SimilarityIndex:
+    """Cosine top-k over hashed TF-IDF product vectors.
+
+    IDF weights are fixed when the index is built; upsert()/remove() reuse
+    them, and a periodic rebuild picks up changes in the catalog's vocabulary.
+    Removed rows are zeroed and reused by later inserts. The scope names the
+    data the index was built from; a saved index is only loaded for the same
+    scope.
+    """
+
+    def __init__(self, dimensions: int = SIMILARITY_DIMENSIONS, path: str = SIMILARITY_INDEX_PATH,
+                 scope: str = "default"):
+        self.dimensions = dimensions
+        self.path = path
+        self.scope = scope
+        self._lock = threading.RLock()
+        self._matrix = np.zeros((0, dimensions), dtype=np.float32, order="F")
+        self._idf = np.ones(dimensions, dtype=np.float32)
+        self._ids: List[Optional[str]] = []
+        self._rows: Dict[str, int] = {}
+        self._free: List[int] = []
+        # Wall-clock time, since a loaded index may have been built by another process
+        self.built_at: Optional[float] = None
+        self.stale = False
+        self._rebuilding = False
+        self._build_done = threading.Event()
+        self._build_done.set()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    @property
+    def is_built(self) -> bool:
+        return self.built_at is not None
+
+    @property
+    def building(self) -> bool:
+        return self._rebuilding
+
+    def vectorize(self, product: Dict[str, Any]) -> np.ndarray:
+        vector = hash_features(product_features(product), self.dimensions) * self._idf
+        return normalize_rows(vector)
+
+    def files(self, scope: Optional[str] = None) -> Optional[str]:
+        """Path prefix of the saved index for a scope, or None when kept in memory."""
+        return f"{self.path}.{scope or self.scope}" if self.path else None
+
+    def build(self, products: Iterable[Dict[str, Any]], scope: Optional[str] = None):
+        """Replace the index contents with the given products and save it when a path is set."""
+        ids, rows = [], []
+        for product in products:
+            ids.append(product["product_id"])
+            rows.append(hash_features(product_features(product), self.dimensions))
+        matrix = np.vstack(rows) if rows else np.zeros((0, self.dimensions), dtype=np.float32)
+        document_frequency = np.count_nonzero(matrix, axis=0)
+        idf = (np.log((1 + len(ids)) / (1 + document_frequency)) + 1).astype(np.float32)
+        matrix = np.asfortranarray(normalize_rows(matrix * idf), dtype=np.float32)
+        with self._lock:
+            self._matrix = matrix
+            self._idf = idf
+            self._ids = ids
+            self._rows = {product_id: row for row, product_id in enumerate(ids)}
+            self._free = []
+            self.scope = scope or self.scope
+            self.built_at = time.time()
+            self.stale = False
+        if self.path:
+            self.save()
+
+    def upsert(self, product: Dict[str, Any]):
+        vector = self.vectorize(product)
+        with self._lock:
+            row = self._rows.get(product["product_id"])
+            if row is None:
+                row = self._free.pop() if self._free else self._append_row()
+                self._rows[product["product_id"]] = row
+                self._ids[row] = product["product_id"]
+            self._matrix[row] = vector
+
+    def _append_row(self) -> int:
+        row = len(self._ids)
+        if row == len(self._matrix):
+            # Grow geometrically; this also moves a memory-mapped matrix into RAM
+            grown = np.zeros((max(16, 2 * row), self.dimensions), dtype=np.float32, order="F")
+            grown[:row] = self._matrix[:row]
+            self._matrix = grown
+        self._ids.append(None)
+        return row
+
+    def remove(self, product_id: str):
+        with self._lock:
+            row = self._rows.pop(product_id, None)
+            if row is not None:
+                self._matrix[row] = 0.0
+                self._ids[row] = None
+                self._free.append(row)
+
+    def build_in_background(self, load_products: Callable[[], Iterable[Dict[str, Any]]], scope: Optional[str] = None):
+        """Start a background load (first time) or rebuild unless one is already running."""
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+            self._build_done.clear()
+
+        def rebuild():
+            try:
+                if self.is_built or not self.load(scope):
+                    self.build(load_products(), scope)
+            except Exception as e:
+                print(f"⚠️ Could not build the similarity index: {e}")
+            finally:
+                self._rebuilding = False
+                self._build_done.set()
+
+        threading.Thread(target=rebuild, name="similarity-index-rebuild", daemon=True).start()
+
+    def wait_built(self, timeout: Optional[float] = None) -> bool:
+        """Wait for a running background build; returns whether the index is built."""
+        self._build_done.wait(timeout)
+        return self.is_built
+
+    def ensure_built(self, load_products: Callable[[], Iterable[Dict[str, Any]]], scope: Optional[str] = None):
+        """Load or build on first use (or wait for a running startup build); afterwards rebuild in the background when stale or old."""
+        if not self.is_built and not self.wait_built():
+            with self._lock:
+                if not self.is_built and not self.load(scope):
+                    self.build(load_products(), scope)
+            return
+        expired = time.time() - self.built_at > SIMILARITY_INDEX_REFRESH_SECONDS
+        if self.stale or expired:
+            self.build_in_background(load_products, scope)
+
+    def on_change(self, product_id: Optional[str], product: Optional[Dict[str, Any]]):
+        """Change listener compatible with cache.add_change_listener."""
+        if product is not None:
+            self.upsert(product)
+        elif product_id is not None:
+            self.remove(product_id)
+        else:
+            self.stale = True
+
+    def similar(self, product: Dict[str, Any], limit: int = 5) -> List[str]:
+        """IDs of the products most similar to this one, best first."""
+        return self.similar_many([product], limit)[0]
+
+    def similar_many(self, products: Sequence[Dict[str, Any]], limit: int = 5) -> List[List[str]]:
+        """Top-k similar product IDs for a batch of products, with one matrix product."""
+        if not products:
+            return []
+        with self._lock:
+            rows = [self._rows.get(product["product_id"]) for product in products]
+            queries = np.vstack([
+                self._matrix[row] if row is not None else self.vectorize(product)
+                for row, product in zip(rows, products)
+            ])
+            size = len(self._ids)
+            k = min(limit, size)
+            if k == 0:
+                return [[] for _ in products]
+            columns = np.flatnonzero(np.any(queries != 0, axis=0))
+            # One row of scores per query
+            scores = queries[:, columns] @ self._matrix[:size, columns].T
+            # Never suggest the product itself
+            for query, row in enumerate(rows):
+                if row is not None:
+                    scores[query, row] = -np.inf
+            top = np.argpartition(scores, size - k, axis=1)[:, size - k:]
+            results = []
+            for query, candidates in enumerate(top):
+                candidates = candidates[np.argsort(-scores[query, candidates], kind="stable")]
+                results.append([self._ids[row] for row in candidates
+                                if scores[query, row] >= MIN_SIMILARITY and self._ids[row] is not None])
+        return results
+
+    def save(self):
+        """Write the matrix (<files>.npy) and its scope, product IDs and IDF (<files>.json)."""
+        with self._lock:
+            files = self.files()
+            size = len(self._ids)
+            matrix = np.array(self._matrix[:size], order="F")
+            meta = {
+                "scope": self.scope,
+                "dimensions": self.dimensions,
+                "built_at": self.built_at,
+                "product_ids": list(self._ids),
+                "idf": self._idf.tolist(),
+            }
+        # Each writer gets its own temporary files next to the target, so
+        # concurrent builds in several processes never write the same file and
+        # a crash never leaves a half-written index behind.
+        replace_file(f"{files}.npy", lambda out: np.save(out, matrix))
+        replace_file(f"{files}.json", lambda out: out.write(json.dumps(meta).encode()))
+
+    def load(self, scope: Optional[str] = None) -> bool:
+        """Memory-map a saved index; False if there is none for this scope and these dimensions."""
+        scope = scope or self.scope
+        files = self.files(scope)
+        if not files:
+            return False
+        try:
+            with open(f"{files}.json") as meta_file:
+                meta = json.load(meta_file)
+            # Copy-on-write: updates stay in this process and never touch the file
+            matrix = np.load(f"{files}.npy", mmap_mode="c")
+        except (OSError, ValueError):
+            return False
+        if (meta.get("scope") != scope or meta["dimensions"] != self.dimensions
+                or len(matrix) != len(meta["product_ids"])):
+            return False
+        ids = meta["product_ids"]
+        with self._lock:
+            self._matrix = matrix
+            self._idf = np.asarray(meta["idf"], dtype=np.float32)
+            self._ids = ids
+            self._rows = {product_id: row for row, product_id in enumerate(ids) if product_id is not None}
+            self._free = [row for row, product_id in enumerate(ids) if product_id is None]
+            self.scope = scope
+            self.built_at = meta["built_at"]
+            self.stale = False
+        return True
+
+
+def replace_file(path: str, write: Callable[[Any], None]):
+    """Write a file through a unique temporary file in the same directory, then rename it into place."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    descriptor, temporary = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(descriptor, "wb") as out:
+            write(out)
+        os.replace(temporary, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(temporary)
+        raise
+
+
+similarity_index = SimilarityIndex()
+
+
+def benchmark(products: int, queries: int, batch: int, limit: int, path: str) -> Dict[str, Any]:
+    """Build, save, reload and query an index over generated products."""
+    import data_generator
+
+    rng = data_generator.chunk_rng(42, "products", 0)
+    catalog = data_generator.generate_products(rng, 42, range(1, products + 1), products)
+    index = SimilarityIndex(path=path, scope="benchmark")
+    started = time.perf_counter()
+    index.build(catalog)
+    build_ms = (time.perf_counter() - started) * 1000
+
+    loaded = SimilarityIndex(path=path, scope="benchmark")
+    started = time.perf_counter()
+    loaded.load()
+    load_ms = (time.perf_counter() - started) * 1000
+
+    sample = [catalog[i * len(catalog) // queries] for i in range(queries)]
+    started = time.perf_counter()
+    for product in sample:
+        loaded.similar(product, limit)
+    single_ms = (time.perf_counter() - started) * 1000 / queries
+    started = time.perf_counter()
+    for start in range(0, queries, batch):
+        loaded.similar_many(sample[start:start + batch], limit)
+    batched_ms = (time.perf_counter() - started) * 1000 / queries
+
+    same_category = 0
+    for product, similar_ids in zip(sample, loaded.similar_many(sample, limit)):
+        categories = [catalog[int(product_id[3:]) - 1]["category"] for product_id in similar_ids]
+        same_category += sum(category == product["category"] for category in categories)
+    return {
+        "products": products,
+        "dimensions": index.dimensions,
+        "build_ms": round(build_ms, 1),
+        "load_ms": round(load_ms, 2),
+        "query_ms": round(single_ms, 4),
+        "batched_query_ms": round(batched_ms, 4),
+        "same_category": round(same_category / (queries * limit), 3),
+        "example": (sample[0]["name"], [catalog[int(i[3:]) - 1]["name"] for i in loaded.similar(sample[0], limit)]),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Build, reload and query a similarity index over generated products.")
+    parser.add_argument("--products", type=int, default=5_000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--batch", type=int, default=50, help="queries answered per matrix product")
+    parser.add_argument("--limit", type=int, default=5)
+    parser.add_argument("--path", default="/tmp/product_vectors_bench")
+    args = parser.parse_args(argv)
+
+    result = benchmark(args.products, args.queries, args.batch, args.limit, args.path)
+    print(f"🧭 {result['products']:,} products × {result['dimensions']} dims: "
+          f"build {result['build_ms']} ms, memory-mapped load {result['load_ms']} ms")
+    print(f"   top-{args.limit}: {result['query_ms']} ms per query, "
+          f"{result['batched_query_ms']} ms per query in batches of {args.batch}")
+    print(f"   {result['same_category']:.0%} of suggestions share the category")
+    name, similar_names = result["example"]
+    print(f"   {name} → {', '.join(similar_names)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
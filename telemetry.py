@@ -0,0 +1,427 @@
+import atexit
+import contextvars
+import json
+import os
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from pymongo import monitoring
+
+
+TELEMETRY_ENABLED = os.getenv("TELEMETRY_ENABLED", "true").lower() in ("1", "true", "yes")
+# Print a one-line summary with timing when a supervisor or agent span ends.
+TELEMETRY_CONSOLE = os.getenv("TELEMETRY_CONSOLE", "true").lower() in ("1", "true", "yes")
+# Spans are only exported when a trace file is configured; metrics are always kept.
+TELEMETRY_TRACE_FILE = os.getenv("TELEMETRY_TRACE_FILE", "")
+TELEMETRY_TRACE_SAMPLE = float(os.getenv("TELEMETRY_TRACE_SAMPLE", "1.0"))
+TELEMETRY_METRICS_PORT = int(os.getenv("TELEMETRY_METRICS_PORT", "0"))
+SERVICE_NAME = os.getenv("TELEMETRY_SERVICE_NAME", "ecommerce-multi-agent")
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+class Counter:
+    """Monotonic counter with labels, rendered in the Prometheus text format."""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] += amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(dict(zip(self.labelnames, key)))} {value}" for key, value in items]
+
+
+class Histogram:
+    """Cumulative-bucket histogram with labels, rendered in the Prometheus text format."""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # key -> [bucket counts..., sum, count]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[index] += 1
+            entry[-2] += value
+            entry[-1] += 1
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = [(key, list(entry)) for key, entry in self._values.items()]
+        lines = []
+        for key, entry in items:
+            labels = dict(zip(self.labelnames, key))
+            for bound, count in zip(self.buckets, entry):
+                lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': str(bound)})} {count}")
+            lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': '+Inf'})} {entry[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {entry[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {entry[-1]}")
+        return lines
+
+
+SPAN_SECONDS = Histogram(
+    "ecommerce_span_duration_seconds",
+    "Duration of supervisor decisions, agent runs, LLM calls and tool calls.",
+    ["kind", "name"],
+)
+SPAN_ERRORS = Counter("ecommerce_span_errors_total", "Spans that ended with an exception.", ["kind", "name"])
+ROUTE_DECISIONS = Counter(
+    "ecommerce_route_decisions_total",
+    "Supervisor routing decisions by target agent and by who decided (pre-router rule or llm).",
+    ["target", "source"],
+)
+LLM_TOKENS = Counter("ecommerce_llm_tokens_total", "LLM tokens used, by graph node.", ["node", "type"])
+MONGO_SECONDS = Histogram(
+    "ecommerce_mongo_command_duration_seconds",
+    "MongoDB command latency as reported by the driver.",
+    ["command", "collection"],
+)
+MONGO_FAILURES = Counter("ecommerce_mongo_command_failures_total", "Failed MongoDB commands.", ["command", "collection"])
+SERVER_REQUESTS = Counter(
+    "ecommerce_server_requests_total",
+    "API server chat requests by endpoint and outcome (ok, shed, timeout, error, disconnected).",
+    ["endpoint", "outcome"],
+)
+SERVER_QUEUE_SECONDS = Histogram("ecommerce_server_queue_wait_seconds", "Time API requests waited for a free graph slot.")
+
+metrics = [SPAN_SECONDS, SPAN_ERRORS, ROUTE_DECISIONS, LLM_TOKENS, MONGO_SECONDS, MONGO_FAILURES,
+           SERVER_REQUESTS, SERVER_QUEUE_SECONDS]
+
+
+def render_prometheus() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.type_name}")
+        lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
+
+
+class Span:
+    """A timed unit of work. Spans nest through a context variable, so graph
+    nodes, LLM calls, tool calls and Mongo commands form one trace per query."""
+
+    __slots__ = ("name", "kind", "trace_id", "span_id", "parent_id", "attributes",
+                 "start_ns", "duration", "status", "sampled", "_started")
+
+    def __init__(self, name: str, kind: str, parent: Optional["Span"], attributes: Dict[str, Any]):
+        self.name = name
+        self.kind = kind
+        self.trace_id = parent.trace_id if parent else random.getrandbits(128)
+        self.span_id = random.getrandbits(64)
+        self.parent_id = parent.span_id if parent else None
+        self.sampled = parent.sampled if parent else random.random() < TELEMETRY_TRACE_SAMPLE
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.duration = 0.0
+        self.status = "ok"
+        self._started = time.perf_counter()
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    @property
+    def duration_ms(self) -> float:
+        return self.duration * 1000
+
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def set_attribute(key: str, value: Any):
+    """Annotate the innermost active span, if any."""
+    active = _current_span.get()
+    if active is not None:
+        active.attributes[key] = value
+
+
+def _finish(finished: Span):
+    SPAN_SECONDS.observe(finished.duration, kind=finished.kind, name=finished.name)
+    if finished.status == "error":
+        SPAN_ERRORS.inc(kind=finished.kind, name=finished.name)
+    if finished.sampled and trace_exporter is not None:
+        trace_exporter.export(finished)
+    display = finished.attributes.get("display")
+    if TELEMETRY_CONSOLE and display:
+        print(f"{display} ({finished.duration_ms:.1f} ms)")
+
+
+@contextmanager
+def span(name: str, kind: str = "internal", **attributes) -> Iterator[Optional[Span]]:
+    """Time a block as a child of the active span and record it in the metrics.
+
+    An attribute named "display" is echoed to the console when the span ends.
+    """
+    if not TELEMETRY_ENABLED:
+        yield None
+        return
+    active = Span(name, kind, _current_span.get(), attributes)
+    token = _current_span.set(active)
+    try:
+        yield active
+    except Exception as e:
+        active.status = "error"
+        active.attributes["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        active.duration = time.perf_counter() - active._started
+        try:
+            _current_span.reset(token)
+        except ValueError:
+            # An async generator was closed from another context
+            pass
+        _finish(active)
+
+
+def record_route(goto: Sequence[str], source: str, confidence: Optional[float] = None):
+    """Count a supervisor decision and describe it on the supervisor span."""
+    for target in goto:
+        ROUTE_DECISIONS.inc(target=target, source=source)
+    set_attribute("route", ",".join(goto))
+    set_attribute("route.source", source)
+    details = f"{source}, confidence {confidence:.2f}" if confidence is not None else source
+    set_attribute("display", f"🎯 Supervisor Decision: Route to {', '.join(goto)} [{details}]")
+    if confidence is not None:
+        set_attribute("route.confidence", round(confidence, 4))
+
+
+def record_llm_usage(llm_span: Optional[Span], node: str, message: Any):
+    """Count the tokens reported on an AIMessage and attach them to the LLM span."""
+    usage = getattr(message, "usage_metadata", None) or {}
+    input_tokens = usage.get("input_tokens", 0)
+    output_tokens = usage.get("output_tokens", 0)
+    if input_tokens:
+        LLM_TOKENS.inc(input_tokens, node=node, type="input")
+    if output_tokens:
+        LLM_TOKENS.inc(output_tokens, node=node, type="output")
+    if llm_span is not None:
+        llm_span.attributes.update({
+            "llm.input_tokens": input_tokens,
+            "llm.output_tokens": output_tokens,
+            "llm.model": (getattr(message, "response_metadata", None) or {}).get("model_name", ""),
+        })
+
+
+def trace_tool_call(request, execute):
+    """ToolNode wrap_tool_call hook: one span per tool call."""
+    with span(request.tool_call["name"], kind="tool"):
+        return execute(request)
+
+
+async def atrace_tool_call(request, execute):
+    """ToolNode awrap_tool_call hook: one span per tool call."""
+    with span(request.tool_call["name"], kind="tool"):
+        return await execute(request)
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Driver-level listener recording the latency of every Mongo command.
+
+    Events fire on the thread (or task) that issued the command, so each
+    command becomes a child span of the tool call that caused it.
+    """
+
+    IGNORED = {"hello", "ismaster", "isMaster", "ping", "saslStart", "saslContinue", "endSessions", "killCursors"}
+
+    def __init__(self):
+        self._collections: Dict[Tuple[Any, int], str] = {}
+
+    def started(self, event):
+        if TELEMETRY_ENABLED and event.command_name not in self.IGNORED:
+            collection = event.command.get(event.command_name)
+            self._collections[(event.connection_id, event.request_id)] = (
+                collection if isinstance(collection, str) else ""
+            )
+
+    def _finish(self, event, failed: bool):
+        collection = self._collections.pop((event.connection_id, event.request_id), None)
+        if collection is None:
+            return
+        seconds = event.duration_micros / 1_000_000
+        MONGO_SECONDS.observe(seconds, command=event.command_name, collection=collection)
+        if failed:
+            MONGO_FAILURES.inc(command=event.command_name, collection=collection)
+        parent = _current_span.get()
+        if parent is not None and parent.sampled and trace_exporter is not None:
+            command = Span(event.command_name, "mongo", parent, {"db.collection": collection})
+            command.start_ns = time.time_ns() - event.duration_micros * 1000
+            command.duration = seconds
+            command.status = "error" if failed else "ok"
+            trace_exporter.export(command)
+
+    def succeeded(self, event):
+        self._finish(event, failed=False)
+
+    def failed(self, event):
+        self._finish(event, failed=True)
+
+
+mongo_listener = MongoCommandListener()
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+OTLP_SPAN_KINDS = {"llm": 3, "mongo": 3}  # SPAN_KIND_CLIENT; everything else is INTERNAL (1)
+
+
+def otlp_span(finished: Span) -> Dict[str, Any]:
+    attributes = {"ecommerce.kind": finished.kind, **finished.attributes}
+    attributes.pop("display", None)
+    encoded = {
+        "traceId": f"{finished.trace_id:032x}",
+        "spanId": f"{finished.span_id:016x}",
+        "name": finished.name,
+        "kind": OTLP_SPAN_KINDS.get(finished.kind, 1),
+        "startTimeUnixNano": str(finished.start_ns),
+        "endTimeUnixNano": str(finished.start_ns + int(finished.duration * 1e9)),
+        "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items()],
+        "status": {"code": 2, "message": finished.attributes.get("error", "")} if finished.status == "error" else {},
+    }
+    if finished.parent_id is not None:
+        encoded["parentSpanId"] = f"{finished.parent_id:016x}"
+    return encoded
+
+
+class OTLPFileExporter:
+    """Batches finished spans and appends them to a file as OTLP/JSON.
+
+    Each line is one ExportTraceServiceRequest, which is what the
+    OpenTelemetry Collector's otlpjsonfile receiver reads. Spans are queued
+    in memory and written by a background thread, so request threads never
+    touch the file; when the queue is full the oldest spans are dropped.
+    """
+
+    def __init__(self, path: str, interval: float = 1.0, max_queue: int = 10_000):
+        self.path = path
+        self.interval = interval
+        self.dropped = 0
+        self._queue: deque = deque(maxlen=max_queue)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        atexit.register(self.flush)
+
+    def export(self, finished: Span):
+        if len(self._queue) == self._queue.maxlen:
+            self.dropped += 1
+        self._queue.append(finished)
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="otlp-file-exporter", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        spans = []
+        while self._queue:
+            spans.append(otlp_span(self._queue.popleft()))
+        if not spans:
+            return
+        request = {
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+                "scopeSpans": [{"scope": {"name": "ecommerce.telemetry"}, "spans": spans}],
+            }]
+        }
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(request) + "\n")
+
+
+trace_exporter: Optional[OTLPFileExporter] = OTLPFileExporter(TELEMETRY_TRACE_FILE) if TELEMETRY_TRACE_FILE else None
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port: int = TELEMETRY_METRICS_PORT) -> Optional[ThreadingHTTPServer]:
+    """Serve /metrics on a background thread when TELEMETRY_METRICS_PORT is set."""
+    if not port:
+        return None
+    try:
+        server = ThreadingHTTPServer(("0.0.0.0", port), MetricsHandler)
+    except OSError as e:
+        # e.g. a second API server worker; its metrics are still on the API port
+        print(f"⚠️ Metrics port {port} unavailable: {e}")
+        return None
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    print(f"📈 Prometheus metrics on http://localhost:{port}/metrics")
+    return server
@@ -0,0 +1,28 @@
+import os
+import sys
+
+# The modules live at the repository root rather than in a package.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+import pytest
+
+
+@pytest.fixture
+def database(monkeypatch):
+    """The demo dataset in an in-memory Mongo, used by agent_tools' sync and async paths."""
+    mongomock = pytest.importorskip("mongomock")
+    import agent_tools
+    from benchmark import AsyncDatabase, seed_database
+    from cache import caches
+
+    database = mongomock.MongoClient()["ecommerce_test"]
+    seed_database(database)
+    async_database = AsyncDatabase(database)
+    monkeypatch.setattr(agent_tools, "db", database)
+    monkeypatch.setattr(agent_tools, "get_async_db", lambda: async_database)
+    for cache in caches:
+        cache.clear()
+    yield database
+    for cache in caches:
+        cache.clear()
@@ -0,0 +1,119 @@
+import asyncio
+import time
+
+import pytest
+
+from server import AdmissionController, Overloaded
+
+
+def test_requests_beyond_concurrency_and_queue_are_shed():
+    async def main():
+        admission = AdmissionController(concurrency=1, queue_size=1)
+        started = await admission.acquire(time.monotonic() + 5)
+        waiter = asyncio.create_task(admission.acquire(time.monotonic() + 5))
+        await asyncio.sleep(0)
+        assert admission.queued == 1
+        with pytest.raises(Overloaded) as shed:
+            await admission.acquire(time.monotonic() + 5)
+        assert shed.value.reason == "queue full"
+        admission.release(started)
+        admission.release(await waiter)
+        assert admission.running == 0 and admission.queued == 0
+
+    asyncio.run(main())
+
+
+def test_request_is_shed_when_expected_wait_exceeds_its_deadline():
+    async def main():
+        admission = AdmissionController(concurrency=1, queue_size=10)
+        admission.service_seconds = 10.0
+        started = await admission.acquire(time.monotonic() + 5)
+        with pytest.raises(Overloaded) as shed:
+            await admission.acquire(time.monotonic() + 1)
+        assert shed.value.reason == "expected wait exceeds the request deadline"
+        assert shed.value.retry_after >= 10
+        assert admission.queued == 0
+        admission.release(started)
+
+    asyncio.run(main())
+
+
+def test_queued_request_times_out_at_its_deadline():
+    async def main():
+        admission = AdmissionController(concurrency=1, queue_size=10)
+        started = await admission.acquire(time.monotonic() + 5)
+        with pytest.raises(Overloaded) as shed:
+            await admission.acquire(time.monotonic() + 0.05)
+        assert shed.value.reason == "no free slot before the request deadline"
+        assert admission.queued == 0
+        admission.release(started)
+        assert admission.service_seconds is not None
+
+    asyncio.run(main())
+
+
+class FakeSystem:
+    """Stands in for main: one answer per query, under the given thread."""
+
+    def thread_config(self, config=None):
+        return config or {"configurable": {"thread_id": "thread-1"}}
+
+    async def astream_events(self, message, config):
+        yield {"type": "answer", "agent": "order_management", "text": f"Re: {message}"}
+
+
+def stream_request(admission):
+    from starlette.applications import Starlette
+    from starlette.requests import Request
+
+    app = Starlette()
+    app.state.system = FakeSystem()
+    app.state.admission = admission
+    body = b'{"message": "Where is ORD001?"}'
+    scope = {"type": "http", "method": "POST", "path": "/chat/stream", "headers": [], "app": app,
+             "query_string": b""}
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+
+    async def receive():
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+    return Request(scope, receive), scope, receive
+
+
+def test_stream_releases_its_slot_when_the_client_is_gone_before_the_headers():
+    from server import chat_stream
+
+    async def main():
+        admission = AdmissionController(concurrency=1, queue_size=1)
+        request, scope, receive = stream_request(admission)
+        response = await chat_stream(request)
+        assert admission.running == 1
+
+        async def send(message):
+            raise OSError("client disconnected")
+
+        with pytest.raises(OSError):
+            await response(scope, receive, send)
+        assert admission.running == 0
+
+    asyncio.run(main())
+
+
+def test_stream_releases_its_slot_after_the_last_event():
+    from server import chat_stream
+
+    async def main():
+        admission = AdmissionController(concurrency=1, queue_size=1)
+        request, scope, receive = stream_request(admission)
+        response = await chat_stream(request)
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        await response(scope, receive, send)
+        body = b"".join(message.get("body", b"") for message in sent)
+        assert b"event: answer" in body and b"event: done" in body
+        assert admission.running == 0
+
+    asyncio.run(main())
@@ -0,0 +1,73 @@
+import asyncio
+
+import agent_tools
+from weather_index import WeatherProductIndex
+
+
+def counting_loader(monkeypatch):
+    """Replace agent_tools.all_products with a loader that counts its calls."""
+    calls = []
+    load = agent_tools.all_products
+
+    def all_products():
+        calls.append(1)
+        return load()
+
+    monkeypatch.setattr(agent_tools, "all_products", all_products)
+    return calls
+
+
+def test_concurrent_first_weather_recommendations_share_one_build(database, monkeypatch):
+    monkeypatch.setattr(agent_tools, "weather_index", WeatherProductIndex())
+    calls = counting_loader(monkeypatch)
+
+    async def main():
+        return await asyncio.gather(*(agent_tools.aget_weather_based_recommendations("Chicago") for _ in range(5)))
+
+    results = asyncio.run(main())
+    assert len(calls) == 1
+    assert all(result.startswith("Weather-based recommendations for Chicago") for result in results)
+
+
+def test_weather_index_is_built_at_startup(database, monkeypatch):
+    monkeypatch.setattr(agent_tools, "weather_index", WeatherProductIndex())
+    agent_tools.start_index_builds()
+    assert agent_tools.weather_index.wait_built(5)
+    assert agent_tools.get_weather_based_recommendations.invoke({"location": "Seattle"}).startswith(
+        "Weather-based recommendations for Seattle")
+
+
+def test_concurrent_first_recommendations_share_one_similarity_build(database, monkeypatch):
+    from similar_products import SimilarityIndex
+
+    monkeypatch.setattr(agent_tools, "similarity_index", SimilarityIndex(path=""))
+    monkeypatch.setattr(agent_tools, "SIMILAR_PRODUCTS_ENABLED", True)
+    database.products.update_one({"product_id": "PRD001"}, {"$set": {"recommendations": []}})
+    calls = counting_loader(monkeypatch)
+
+    async def main():
+        return await asyncio.gather(*(agent_tools.aget_product_recommendations("PRD001") for _ in range(5)))
+
+    results = asyncio.run(main())
+    assert len(calls) == 1
+    assert all(result.startswith("Similar products to") for result in results)
+    assert "PRD001)" not in results[0]
+
+
+def test_ensure_indexes_drops_the_unused_weather_index(database):
+    from db_indexes import ensure_indexes
+
+    database.products.create_index("weather_suitable", name="weather_suitable")
+    ensure_indexes(database)
+    assert "weather_suitable" not in database.products.index_information()
+    assert "product_id_unique" in database.products.index_information()
+
+
+def test_audited_query_shapes_match_the_bulk_tools():
+    from db_indexes import query_shapes
+
+    shapes = {shape["name"]: shape["filter"] for shape in query_shapes()}
+    assert "get_weather_based_recommendations" not in shapes
+    assert shapes["bulk_cancel_orders (update_many)"] == agent_tools.cancel_filter(["ORD001", "ORD002"])
+    assert shapes["bulk_process_returns (update_many)"] == agent_tools.return_filter(["ORD001", "ORD002"])
+    assert set(shapes["bulk batch_id cleanup (update_many)"]) == {"order_id", "batch_id"}
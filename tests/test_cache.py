@@ -0,0 +1,88 @@
+import threading
+import time
+
+import asyncio
+
+import cache
+from cache import SingleFlight, TTLCache
+
+
+def test_ttl_cache_hits_expires_and_evicts(monkeypatch):
+    monkeypatch.setattr(cache, "CACHE_ENABLED", True)
+    entries = TTLCache("test", maxsize=2, ttl=60)
+    entries.set("a", 1)
+    entries.set("b", 2)
+    assert entries.get("a") == 1
+    entries.set("c", 3)
+    # "b" was the least recently used entry
+    assert entries.get("b") is None
+    assert entries.get("a") == 1 and entries.get("c") == 3
+    assert entries.evictions == 1
+
+    entries.ttl = -1
+    entries.set("d", 4)
+    assert entries.get("d") is None
+    assert entries.stats()["hits"] == 3
+
+
+def test_disabled_cache_stores_nothing(monkeypatch):
+    monkeypatch.setattr(cache, "CACHE_ENABLED", False)
+    entries = TTLCache("test")
+    entries.set("a", 1)
+    assert entries.get("a") is None
+
+
+def test_single_flight_collapses_concurrent_loads():
+    flight = SingleFlight()
+    calls = []
+    started = threading.Event()
+    results = []
+
+    def load():
+        calls.append(1)
+        started.set()
+        time.sleep(0.2)
+        return "value"
+
+    def caller():
+        results.append(flight.do("key", load))
+
+    leader = threading.Thread(target=caller)
+    leader.start()
+    started.wait()
+    followers = [threading.Thread(target=caller) for _ in range(4)]
+    for thread in followers:
+        thread.start()
+    for thread in [leader] + followers:
+        thread.join()
+    assert len(calls) == 1
+    assert results == ["value"] * 5
+
+
+def test_single_flight_shares_errors_and_forgets_finished_keys():
+    flight = SingleFlight()
+
+    def fail():
+        raise ValueError("boom")
+
+    try:
+        flight.do("key", fail)
+    except ValueError:
+        pass
+    assert flight.do("key", lambda: "retried") == "retried"
+
+
+def test_async_single_flight_collapses_concurrent_loads():
+    flight = SingleFlight()
+    calls = []
+
+    async def load():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "value"
+
+    async def main():
+        return await asyncio.gather(*(flight.ado("key", load) for _ in range(5)))
+
+    assert asyncio.run(main()) == ["value"] * 5
+    assert len(calls) == 1
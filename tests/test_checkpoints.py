@@ -0,0 +1,85 @@
+import asyncio
+import time
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.graph import END, START, MessagesState, StateGraph
+
+from checkpoints import SqliteCheckpointer, acompact_thread, compact_thread, compact_update, stale_messages
+
+
+def echo_graph(checkpointer):
+    def reply(state):
+        return {"messages": [AIMessage(content=f"echo: {state['messages'][-1].content}")]}
+
+    builder = StateGraph(MessagesState)
+    builder.add_node("reply", reply)
+    builder.add_edge(START, "reply")
+    builder.add_edge("reply", END)
+    return builder.compile(checkpointer=checkpointer)
+
+
+def conversation(turns):
+    messages = []
+    for turn in range(turns):
+        messages += [HumanMessage(content=f"q{turn}", id=f"q{turn}"),
+                     AIMessage(content=f"a{turn}", id=f"a{turn}", name="order_management"),
+                     HumanMessage(content=f"a{turn}", id=f"r{turn}", name="order_management")]
+    return messages
+
+
+def checkpoint_count(checkpointer, thread_id):
+    with checkpointer.cursor(transaction=False) as cur:
+        cur.execute("SELECT COUNT(*) FROM checkpoints WHERE thread_id = ?", (thread_id,))
+        return cur.fetchone()[0]
+
+
+def test_stale_messages_cut_at_a_customer_turn():
+    messages = conversation(5)
+    # Agent replies are HumanMessages with a name, so they are not a turn boundary
+    assert [message.id for message in stale_messages(messages, 7)] == [message.id for message in messages[:9]]
+    assert stale_messages(messages, 15) == []
+    assert compact_update(messages, 15) is None
+    assert [remove.id for remove in compact_update(messages, 7)["messages"]] == [m.id for m in messages[:9]]
+
+
+def test_compaction_trims_old_turns_and_prunes_checkpoints(tmp_path):
+    checkpointer = SqliteCheckpointer(str(tmp_path / "checkpoints.sqlite"))
+    graph = echo_graph(checkpointer)
+    config = {"configurable": {"thread_id": "thread-1"}}
+    for turn in range(6):
+        graph.invoke({"messages": [HumanMessage(content=f"turn {turn}")]}, config)
+        compact_thread(graph, config, max_messages=4)
+
+    messages = graph.get_state(config).values["messages"]
+    assert [message.content for message in messages] == ["turn 4", "echo: turn 4", "turn 5", "echo: turn 5"]
+    assert checkpoint_count(checkpointer, "thread-1") <= 2
+
+
+def test_async_compaction_matches(tmp_path):
+    checkpointer = SqliteCheckpointer(str(tmp_path / "checkpoints.sqlite"))
+    graph = echo_graph(checkpointer)
+    config = {"configurable": {"thread_id": "thread-1"}}
+
+    async def main():
+        for turn in range(3):
+            await graph.ainvoke({"messages": [HumanMessage(content=f"turn {turn}")]}, config)
+            await acompact_thread(graph, config, max_messages=2)
+        return (await graph.aget_state(config)).values["messages"]
+
+    assert [message.content for message in asyncio.run(main())] == ["turn 2", "echo: turn 2"]
+
+
+def test_idle_threads_expire(tmp_path):
+    checkpointer = SqliteCheckpointer(str(tmp_path / "checkpoints.sqlite"))
+    graph = echo_graph(checkpointer)
+    for thread_id in ("old", "new"):
+        config = {"configurable": {"thread_id": thread_id}}
+        graph.invoke({"messages": [HumanMessage(content="hi")]}, config)
+        checkpointer.prune_thread(thread_id)
+    with checkpointer.cursor() as cur:
+        cur.execute("UPDATE thread_activity SET updated_at = ? WHERE thread_id = 'old'", (time.time() - 7200,))
+
+    assert checkpointer.expire_threads(ttl_hours=1) == 1
+    assert checkpoint_count(checkpointer, "old") == 0
+    assert checkpoint_count(checkpointer, "new") > 0
+    assert checkpointer.stats()["threads"] == 1
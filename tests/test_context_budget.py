@@ -0,0 +1,62 @@
+from langchain_core.messages import HumanMessage, SystemMessage
+
+import context_budget
+from context_budget import build_context, estimate_prompt_tokens, fit_current_turn
+
+
+def turn(question, agent, answer):
+    return [HumanMessage(content=question), HumanMessage(content=answer, name=agent)]
+
+
+def long_conversation(turns):
+    messages = []
+    for number in range(turns):
+        messages += turn(f"Where is order ORD{number:03d}?", "order_management",
+                         f"Order ORD{number:03d} is shipped. " + "Details. " * 30)
+    return messages + [HumanMessage(content="And what about ORD999?")]
+
+
+def test_context_stays_within_budget_and_keeps_the_latest_turns():
+    messages = long_conversation(40)
+    context = build_context(messages, budget=500)
+    assert estimate_prompt_tokens(context) <= 500
+    assert context[-1].content == "And what about ORD999?"
+    assert context[-3].content == "Where is order ORD039?"
+    assert estimate_prompt_tokens(build_context(long_conversation(400), budget=500)) <= 500
+
+
+def test_dropped_turns_are_summarised_with_their_latest_ids():
+    context = build_context(long_conversation(40), budget=500)
+    note = context[0]
+    assert isinstance(note, SystemMessage)
+    assert "earlier turn(s) of this conversation were omitted" in note.content
+    assert "ORD000" not in note.content
+    assert note.content.count("ORD") == context_budget.NOTE_MAX_IDS
+
+
+def test_agents_only_see_earlier_turns_about_their_domain():
+    messages = (turn("Show me product PRD001", "product_information", "Headphones")
+                + turn("Where is ORD001?", "order_management", "Shipped")
+                + [HumanMessage(content="Cancel ORD001 please")])
+    context = build_context(messages, budget=2000, agent="order_management")
+    contents = [message.content for message in context]
+    assert "Show me product PRD001" not in contents
+    assert "Where is ORD001?" in contents
+    assert "PRD001" in context[0].content
+    assert len(build_context(messages, budget=2000)) == len(messages)
+
+
+def test_oversized_current_turn_only_shortens_other_agents_replies():
+    question = HumanMessage(content="Tell me everything about ORD001 and PRD001")
+    replies = [HumanMessage(content="x" * 8000, name="order_management"),
+               HumanMessage(content="y" * 8000, name="product_information")]
+    fitted = fit_current_turn([question] + replies, budget=1000)
+    assert fitted[0] is question
+    assert all(len(message.content) < 8000 for message in fitted[1:])
+    assert [message.name for message in fitted[1:]] == ["order_management", "product_information"]
+
+
+def test_disabled_budget_sends_everything(monkeypatch):
+    monkeypatch.setattr(context_budget, "CONTEXT_BUDGET_ENABLED", False)
+    messages = long_conversation(40)
+    assert build_context(messages, budget=10) == messages
@@ -0,0 +1,68 @@
+from facts import FactStore, merge_facts
+
+
+def test_discarded_document_is_not_restored_by_the_reducer():
+    store = FactStore("request-1")
+    store.put("customers", "CUST001", {"customer_id": "CUST001", "preferences": ["Books"]})
+    store.put("orders", "ORD001", {"order_id": "ORD001", "status": "shipped"})
+    before = store.snapshot()
+
+    store.discard("customers", ["CUST001"])
+    merged = merge_facts(before, store.snapshot())
+    assert "CUST001" not in merged["customers"]
+    assert "ORD001" in merged["orders"]
+
+    # A snapshot from before the write, e.g. of an agent running in parallel,
+    # does not bring it back when it is merged last
+    assert "CUST001" not in merge_facts(merged, before)["customers"]
+    assert "CUST001" not in merge_facts(store.snapshot(), before)["customers"]
+
+
+def test_document_fetched_again_after_a_discard_is_kept():
+    store = FactStore("request-1")
+    store.put("customers", "CUST001", {"customer_id": "CUST001", "preferences": ["Books"]})
+    before = store.snapshot()
+    store.discard("customers", ["CUST001"])
+    discarded = merge_facts(before, store.snapshot())
+
+    store.put("customers", "CUST001", {"customer_id": "CUST001", "preferences": ["Sports"]})
+    merged = merge_facts(discarded, store.snapshot())
+    assert merged["customers"]["CUST001"]["preferences"] == ["Sports"]
+
+
+def test_store_rebuilt_from_state_keeps_tombstones():
+    store = FactStore("request-1")
+    store.put("orders", "ORD001", {"order_id": "ORD001"})
+    before = store.snapshot()
+    store.discard("orders", ["ORD001"])
+    rebuilt = FactStore("request-1", merge_facts(before, store.snapshot()))
+    assert rebuilt.get("orders", "ORD001") is None
+    assert "ORD001" not in merge_facts(before, rebuilt.snapshot())["orders"]
+
+
+def test_new_request_replaces_facts():
+    old = FactStore("request-1")
+    old.put("orders", "ORD001", {"order_id": "ORD001"})
+    new = FactStore("request-2")
+    assert merge_facts(old.snapshot(), new.snapshot())["orders"] == {}
+
+
+def test_preference_update_is_not_undone_by_the_reducer(database):
+    import agent_tools
+    from facts import use_facts
+
+    with use_facts(FactStore("request-1")) as store:
+        assert agent_tools.load_customer("CUST001")["preferences"] == ["Electronics", "Fitness"]
+        agent_tools.load_customer("CUST001")
+        assert store.hits == 1
+        before = store.snapshot()
+
+        result = agent_tools.update_customer_preferences.invoke(
+            {"customer_id": "CUST001", "new_preferences": "Books, Garden"})
+        assert result.startswith("Successfully updated preferences")
+        merged = merge_facts(before, store.snapshot())
+        assert "CUST001" not in merged["customers"]
+
+    # The next hop starts from the merged state and reads the new preferences
+    with use_facts(FactStore("request-1", merged)):
+        assert agent_tools.load_customer("CUST001")["preferences"] == ["Books", "Garden"]
@@ -0,0 +1,42 @@
+from langchain_core.messages import AIMessage, HumanMessage
+
+from message_log import MessageLog, append_messages
+
+
+def test_append_messages_keeps_order_and_accepts_single_messages():
+    log = append_messages([], [HumanMessage(content="hi", id="1")])
+    log = append_messages(log, AIMessage(content="hello", id="2"))
+    assert isinstance(log, MessageLog)
+    assert [message.content for message in log] == ["hi", "hello"]
+    assert log[-1].content == "hello"
+    assert [message.id for message in reversed(log)] == ["2", "1"]
+
+
+def test_entering_a_subgraph_shares_the_parent_list():
+    parent = [HumanMessage(content="hi", id="1")]
+    log = append_messages([], parent)
+    assert log._base is parent
+    assert log == parent
+
+
+def test_message_with_a_known_id_replaces_it():
+    log = append_messages([], [HumanMessage(content="draft", id="1"), AIMessage(content="reply", id="2")])
+    log = append_messages(log, [HumanMessage(content="edited", id="1")])
+    assert [message.content for message in log] == ["edited", "reply"]
+
+
+def test_older_views_keep_their_length_and_branch_on_append():
+    base = append_messages([], [HumanMessage(content="q", id="1")])
+    first = append_messages(base, [AIMessage(content="a", id="2")])
+    second = append_messages(base, [AIMessage(content="b", id="3")])
+    assert len(base) == 1
+    assert [message.content for message in first] == ["q", "a"]
+    assert [message.content for message in second] == ["q", "b"]
+    # The branch does not see the other branch's IDs
+    again = append_messages(second, [AIMessage(content="a again", id="2")])
+    assert [message.content for message in again] == ["q", "b", "a again"]
+
+
+def test_dict_messages_are_converted():
+    log = append_messages([], [{"role": "user", "content": "hi"}])
+    assert isinstance(log[0], HumanMessage)
@@ -0,0 +1,76 @@
+import asyncio
+import re
+from datetime import datetime, timedelta
+
+import agent_tools
+
+
+def add_history(database, customer_id, count):
+    """Orders with pairs sharing a timestamp, so the order_id tie-break is exercised."""
+    start = datetime(2024, 1, 1, 12, 0, 0)
+    orders = [{
+        "order_id": f"ORD9{number:03d}",
+        "customer_id": customer_id,
+        "status": "delivered",
+        "items": [{"product_id": "PRD001", "quantity": 1, "price": 10.0}],
+        "total_amount": 10.0,
+        "order_date": start + timedelta(days=number // 2),
+    } for number in range(count)]
+    database.orders.insert_many(orders)
+    newest_first = sorted(orders, key=lambda order: (order["order_date"], order["order_id"]), reverse=True)
+    return [order["order_id"] for order in newest_first]
+
+
+def page_ids(page):
+    return re.findall(r"^• (ORD\d+)", page, re.MULTILINE)
+
+
+def next_cursor(page):
+    match = re.search(r"Next cursor: (\S+)", page)
+    return match.group(1) if match else None
+
+
+def test_cursor_round_trips():
+    order = {"order_id": "ORD042", "order_date": datetime(2024, 5, 6, 7, 8, 9, 123000)}
+    assert agent_tools.decode_history_cursor(agent_tools.encode_history_cursor(order)) == (
+        order["order_date"], "ORD042")
+
+
+def test_pages_cover_the_history_once_newest_first(database):
+    expected = add_history(database, "CUST900", 25)
+    seen, cursor, pages = [], None, 0
+    while True:
+        page = agent_tools.get_customer_order_history.invoke(
+            {"customer_id": "CUST900", "cursor": cursor, "page_size": 10})
+        seen += page_ids(page)
+        pages += 1
+        cursor = next_cursor(page)
+        if cursor is None:
+            assert page.endswith("End of order history.")
+            break
+    assert seen == expected
+    assert pages == 3
+
+
+def test_async_page_matches_sync_page(database):
+    add_history(database, "CUST900", 12)
+    first = agent_tools.get_customer_order_history.invoke({"customer_id": "CUST900", "page_size": 5})
+    cursor = next_cursor(first)
+    sync_page = agent_tools.get_customer_order_history.invoke(
+        {"customer_id": "CUST900", "cursor": cursor, "page_size": 5})
+    async_page = asyncio.run(agent_tools.aget_customer_order_history("CUST900", cursor, 5))
+    assert async_page == sync_page
+    assert not set(page_ids(first)) & set(page_ids(sync_page))
+
+
+def test_page_size_is_clamped_and_empty_histories_are_reported(database):
+    add_history(database, "CUST900", 60)
+    page = agent_tools.get_customer_order_history.invoke({"customer_id": "CUST900", "page_size": 500})
+    assert len(page_ids(page)) == agent_tools.MAX_HISTORY_PAGE_SIZE
+    assert agent_tools.get_customer_order_history.invoke({"customer_id": "CUST999"}) == (
+        "No orders found for customer CUST999.")
+
+
+def test_invalid_cursor_is_an_error_message(database):
+    result = agent_tools.get_customer_order_history.invoke({"customer_id": "CUST001", "cursor": "not-a-cursor"})
+    assert result.startswith("Error getting order history:")
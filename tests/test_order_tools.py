@@ -0,0 +1,95 @@
+import asyncio
+
+import pytest
+
+import agent_tools
+
+
+def mongo_calls(steps):
+    """Drive a tool body with run()'s I/O and return the collection methods it called, in order."""
+    calls, result, error = [], None, None
+    while True:
+        try:
+            call = steps.throw(error) if error is not None else steps.send(result)
+        except StopIteration as stop:
+            return calls, stop.value
+        calls.append(call.method if isinstance(call.method, str) else call.method.__name__)
+        result, error = None, None
+        try:
+            result = call.run()
+        except Exception as e:
+            error = e
+
+
+def test_cancel_is_one_conditional_update(database):
+    calls, result = mongo_calls(agent_tools.cancel_order_steps("ORD002"))
+    assert calls == ["find_one_and_update"]
+    assert result == "Order ORD002 has been successfully cancelled."
+    order = database.orders.find_one({"order_id": "ORD002"})
+    assert order["status"] == "cancelled" and not order["can_cancel"] and not order["can_return"]
+
+
+def test_ineligible_or_unknown_order_is_looked_up_only_on_failure(database):
+    calls, result = mongo_calls(agent_tools.cancel_order_steps("ORD001"))
+    assert calls == ["find_one_and_update", "find_one"]
+    assert result == "Order ORD001 cannot be cancelled. Status: delivered"
+    assert agent_tools.cancel_order.invoke({"order_id": "ORD999"}) == "Order ORD999 not found."
+
+
+def test_concurrent_cancels_succeed_once(database):
+    async def main():
+        return await asyncio.gather(*(agent_tools.acancel_order("ORD004") for _ in range(5)))
+
+    results = asyncio.run(main())
+    assert results.count("Order ORD004 has been successfully cancelled.") == 1
+    assert results.count("Order ORD004 cannot be cancelled. Status: cancelled") == 4
+
+
+@pytest.mark.parametrize("order_id, expected", [
+    ("ORD001", "Return processed for order ORD001. Refund of $209.97 will be processed within 3-5 business days. "
+               "Reason: Too small"),
+    ("ORD002", "Order ORD002 is not eligible for return. Status: processing"),
+    ("ORD999", "Order ORD999 not found."),
+])
+def test_process_return(database, order_id, expected):
+    assert agent_tools.process_return.invoke({"order_id": order_id, "reason": "Too small"}) == expected
+
+
+def test_order_is_returned_only_once(database):
+    assert agent_tools.process_return.invoke({"order_id": "ORD003"}).startswith("Return processed")
+    again = asyncio.run(agent_tools.aprocess_return("ORD003"))
+    assert again == "Order ORD003 is not eligible for return. Status: returned"
+    assert database.orders.find_one({"order_id": "ORD003"})["return_reason"] == "Customer request"
+
+
+def test_bulk_cancel_reports_each_order_and_leaves_no_batch_id(database):
+    result = agent_tools.bulk_cancel_orders.invoke({"order_ids": ["ORD002", "ORD001", "ORD999", "ORD002"]})
+    assert result.splitlines() == [
+        "• Order ORD002 has been successfully cancelled.",
+        "• Order ORD001 cannot be cancelled. Status: delivered",
+        "• Order ORD999 not found.",
+    ]
+    assert database.orders.find_one({"order_id": "ORD002"})["status"] == "cancelled"
+    assert database.orders.count_documents({"batch_id": {"$exists": True}}) == 0
+
+
+def test_second_bulk_cancel_does_not_claim_orders_the_first_one_cancelled(database):
+    first = agent_tools.bulk_cancel_orders.invoke({"order_ids": ["ORD002"]})
+    second = asyncio.run(agent_tools.abulk_cancel_orders(["ORD002", "ORD004"]))
+    assert first == "• Order ORD002 has been successfully cancelled."
+    assert second.splitlines() == [
+        "• Order ORD002 cannot be cancelled. Status: cancelled",
+        "• Order ORD004 has been successfully cancelled.",
+    ]
+
+
+def test_bulk_returns_report_refunds_and_leave_no_batch_id(database):
+    result = asyncio.run(agent_tools.abulk_process_returns(["ORD001", "ORD002"], "Damaged"))
+    assert result.splitlines() == [
+        "• Return processed for order ORD001. Refund of $209.97 will be processed within 3-5 business days. "
+        "Reason: Damaged",
+        "• Order ORD002 is not eligible for return. Status: processing",
+    ]
+    returned = database.orders.find_one({"order_id": "ORD001"})
+    assert returned["status"] == "returned" and returned["return_reason"] == "Damaged"
+    assert "batch_id" not in returned
@@ -0,0 +1,62 @@
+from langchain_core.messages import HumanMessage
+
+from pre_router import FINISH, PreRouter
+
+
+def conversation(query, *answers):
+    """A customer query followed by the replies of the given agents."""
+    return [HumanMessage(content=query)] + [HumanMessage(content="done", name=agent) for agent in answers]
+
+
+def test_order_id_routes_to_order_management():
+    decision = PreRouter().route(conversation("Check my order ORD001"))
+    assert decision.next == "order_management"
+    assert decision.source == "id"
+
+
+def test_single_intent_query_is_fully_handled():
+    router = PreRouter()
+    messages = conversation("Check my order ORD001", "order_management")
+    assert router.fully_handled(messages, "order_management")
+    assert router.route(messages).next == FINISH
+
+
+def test_customer_id_next_to_another_request_only_identifies_the_caller():
+    intents = PreRouter().detect_intents("I am CUST001, where is order ORD001?")
+    assert [match.agent for match in intents] == ["order_management"]
+
+
+def test_queries_with_an_unrouted_clause_do_not_finish_early():
+    router = PreRouter()
+    for query, agent in [
+        ("Check order ORD001 and what is the email on file for CUST001", "order_management"),
+        ("Cancel ORD002 and tell me the shipping address you have for CUST002", "order_management"),
+        ("Check my order ORD001, also do you ship to Canada?", "order_management"),
+    ]:
+        messages = conversation(query, agent)
+        assert router.clause_agents(query) is None, query
+        assert not router.fully_handled(messages, agent), query
+        assert router.route(messages) is None, query
+
+
+def test_negated_keyword_is_not_an_intent():
+    router = PreRouter()
+    query = "I don't want to cancel anything, what's the weather in Chicago?"
+    confident = [match.agent for match in router.detect_intents(query) if match.confidence >= router.threshold]
+    assert "order_management" not in confident
+    decision = router.route(conversation(query))
+    assert decision is None or decision.next != "order_management"
+
+
+def test_keyword_alone_defers_to_the_llm():
+    assert PreRouter().route(conversation("I want to cancel my order")) is None
+
+
+def test_stats_count_hits_and_fallbacks():
+    router = PreRouter()
+    router.route(conversation("Where is ORD001?"))
+    router.route(conversation("Tell me something nice"))
+    stats = router.stats.snapshot()
+    assert stats["total"] == 2
+    assert stats["hits"] == 1 and stats["fallbacks"] == 1
+    assert stats["routes"] == {"order_management": 1}
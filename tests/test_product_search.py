@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+
+import agent_tools
+from mongodb_population import sample_products
+from product_search import ProductSearchIndex, text_search_query, tokenize
+
+
+def built_index():
+    index = ProductSearchIndex()
+    index.build([dict(product) for product in sample_products])
+    return index
+
+
+def ids(products):
+    return [product["product_id"] for product in products]
+
+
+def test_tokens_are_stemmed_and_stop_words_dropped():
+    assert tokenize("Some Headphones and Batteries for me") == ["headphone", "battery"]
+
+
+def test_search_ranks_name_matches_and_filters_by_exact_category():
+    index = built_index()
+    assert ids(index.search("headphone"))[0] == "PRD001"
+    assert ids(index.search("jacket", "clothing")) == ["PRD004"]
+    assert index.search("jacket", "Electronics") == []
+    assert index.search("jacket", "Cloth") == []
+
+
+def test_browse_without_terms_is_sorted_by_name():
+    index = built_index()
+    names = [product["name"] for product in index.search("", "Electronics")]
+    assert names == sorted(names) and len(names) == 3
+    assert len(index.search("", limit=4)) == 4
+
+
+def test_upsert_and_remove_keep_postings_and_browse_lists_current():
+    index = built_index()
+    index.upsert({"product_id": "PRD009", "name": "Rain Poncho", "category": "Clothing",
+                  "description": "Light poncho for wet days"})
+    assert ids(index.search("poncho")) == ["PRD009"]
+    assert "PRD009" in ids(index.search("", "Clothing"))
+
+    index.upsert({"product_id": "PRD009", "name": "Rain Cape", "category": "Accessories",
+                  "description": "Light cape"})
+    assert index.search("poncho") == []
+    assert "PRD009" not in ids(index.search("", "Clothing"))
+    assert "PRD009" in ids(index.search("", "Accessories"))
+
+    index.remove("PRD009")
+    assert index.search("cape") == []
+    assert "PRD009" not in ids(index.search("", "Accessories"))
+
+
+def test_text_backend_filter_title_cases_the_category():
+    assert text_search_query("rain jacket", " clothing ") == {"$text": {"$search": "rain jacket"}, "category": "Clothing"}
+    assert text_search_query("", None) == {}
+
+
+def test_memory_backend_through_the_tool(database, monkeypatch):
+    monkeypatch.setattr(agent_tools, "PRODUCT_SEARCH_BACKEND", "memory")
+    monkeypatch.setattr(agent_tools, "product_index", ProductSearchIndex())
+
+    async def main():
+        return await asyncio.gather(*(agent_tools.afind_products("waterproof jacket") for _ in range(3)))
+
+    assert all(ids(found)[0] == "PRD004" for found in asyncio.run(main()))
+    assert ids(agent_tools.find_products("watch")) == ["PRD002"]
+
+
+@pytest.mark.parametrize("query, category, expected", [
+    ("headphones", None, ["PRD001"]),
+    ("", "fitness", ["PRD006"]),
+    ("charger", "Electronics", ["PRD003"]),
+])
+def test_regex_backend_through_the_tool(database, monkeypatch, query, category, expected):
+    monkeypatch.setattr(agent_tools, "PRODUCT_SEARCH_BACKEND", "regex")
+    assert ids(agent_tools.find_products(query, category)) == expected
+    assert ids(asyncio.run(agent_tools.afind_products(query, category))) == expected
@@ -0,0 +1,75 @@
+from data_generator import chunk_rng, generate_products
+from mongodb_population import sample_products
+from similar_products import SimilarityIndex
+
+
+def catalog(count=300):
+    return generate_products(chunk_rng(7, "products", 0), 7, range(1, count + 1), count)
+
+
+def built_index(products, **kwargs):
+    index = SimilarityIndex(path="", **kwargs)
+    index.build(products)
+    return index
+
+
+def test_suggestions_exclude_the_product_and_mostly_share_its_category():
+    products = catalog()
+    index = built_index(products)
+    by_id = {product["product_id"]: product for product in products}
+    same_category = total = 0
+    for product in products[:50]:
+        similar = index.similar(product, 5)
+        assert product["product_id"] not in similar
+        assert len(similar) == len(set(similar))
+        same_category += sum(by_id[product_id]["category"] == product["category"] for product_id in similar)
+        total += len(similar)
+    assert same_category / total > 0.8
+
+
+def test_batch_query_matches_single_queries():
+    products = catalog()
+    index = built_index(products)
+    assert index.similar_many(products[:10], 5) == [index.similar(product, 5) for product in products[:10]]
+
+
+def test_upsert_and_remove_follow_catalog_changes():
+    index = built_index([dict(product) for product in sample_products])
+    jacket = next(product for product in sample_products if product["product_id"] == "PRD004")
+    twin = dict(jacket, product_id="PRD100")
+    index.upsert(twin)
+    assert index.similar(jacket, 1) == ["PRD100"]
+    index.remove("PRD100")
+    assert "PRD100" not in index.similar(jacket, 5)
+    # A removed row is reused by the next insert
+    index.upsert(dict(twin, product_id="PRD101"))
+    assert index.similar(jacket, 1) == ["PRD101"]
+    assert len(index) == len(sample_products) + 1
+
+
+def test_saved_index_is_only_loaded_for_its_own_scope(tmp_path):
+    products = catalog(50)
+    path = str(tmp_path / "vectors")
+    saved = SimilarityIndex(path=path)
+    saved.build(products, scope="db-a")
+
+    loaded = SimilarityIndex(path=path)
+    assert loaded.load("db-a")
+    assert loaded.similar(products[0], 5) == saved.similar(products[0], 5)
+    assert not SimilarityIndex(path=path).load("db-b")
+    assert not SimilarityIndex(path="").load("db-a")
+    assert sorted(file.name for file in tmp_path.iterdir()) == ["vectors.db-a.json", "vectors.db-a.npy"]
+
+
+def test_recommendations_fall_back_to_similar_products(database, monkeypatch):
+    import agent_tools
+
+    monkeypatch.setattr(agent_tools, "similarity_index", SimilarityIndex(path=""))
+    monkeypatch.setattr(agent_tools, "SIMILAR_PRODUCTS_ENABLED", True)
+    curated = agent_tools.get_product_recommendations.invoke({"product_id": "PRD001"})
+    assert curated.startswith("Recommendations for")
+    assert not agent_tools.similarity_index.is_built
+
+    database.products.update_one({"product_id": "PRD004"}, {"$set": {"recommendations": []}})
+    similar = agent_tools.get_product_recommendations.invoke({"product_id": "PRD004"})
+    assert similar.startswith("Similar products to Waterproof Jacket")
@@ -0,0 +1,33 @@
+import asyncio
+
+import cache
+from cache import TTLCache
+from weather import (DEFAULT_WEATHER, SIMULATED_WEATHER, CachedWeatherProvider, WeatherProvider,
+                     normalize_location, simulated_weather)
+
+
+class RecordingProvider(WeatherProvider):
+    def __init__(self):
+        self.asked = []
+
+    def get(self, location):
+        self.asked.append(location)
+        return simulated_weather(location)
+
+
+def test_differently_written_locations_get_the_same_weather():
+    assert normalize_location("  Chicago,   IL ") == "chicago, il"
+    assert simulated_weather("  CHICAGO,   il ") == SIMULATED_WEATHER["Chicago, IL"]
+    assert simulated_weather("  CHICAGO,   il ") != DEFAULT_WEATHER
+
+
+def test_cached_provider_asks_upstream_once_with_the_normalized_location(monkeypatch):
+    monkeypatch.setattr(cache, "CACHE_ENABLED", True)
+    upstream = RecordingProvider()
+    provider = CachedWeatherProvider(upstream, TTLCache("test-weather"))
+
+    assert provider.get("Chicago,  IL")["condition"] == "cold"
+    assert provider.get("chicago, il")["condition"] == "cold"
+    assert asyncio.run(provider.aget("CHICAGO, IL"))["condition"] == "cold"
+    assert upstream.asked == ["chicago, il"]
+    assert provider.upstream_calls == 1
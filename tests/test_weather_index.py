@@ -0,0 +1,37 @@
+from weather_index import WeatherProductIndex, price_band
+
+
+def product(product_id, price, availability=50, tags=("rainy",), category="Clothing"):
+    return {"product_id": product_id, "price": price, "availability": availability,
+            "weather_suitable": list(tags), "category": category}
+
+
+def test_recommendations_are_spread_over_price_bands():
+    index = WeatherProductIndex()
+    index.build([product(f"PRD{n:03d}", 10.0 + n) for n in range(10)]
+                + [product("PRD100", 50.0, availability=1), product("PRD200", 150.0, availability=1)])
+    picked = index.recommend("rainy", limit=4)
+    # The budget items rank higher, but only two of the four slots go to them
+    assert [price_band(item["price"]) for item in picked] == ["budget", "budget", "mid", "premium"]
+
+
+def test_band_cap_is_relaxed_when_there_are_not_enough_candidates():
+    index = WeatherProductIndex()
+    index.build([product(f"PRD{n:03d}", 10.0 + n) for n in range(5)])
+    assert len(index.recommend("rainy", limit=4)) == 4
+
+
+def test_out_of_stock_products_are_not_listed_and_updates_apply():
+    index = WeatherProductIndex()
+    index.build([product("PRD001", 10.0), product("PRD002", 20.0, availability=0)])
+    assert [item["product_id"] for item in index.recommend("rainy")] == ["PRD001"]
+    index.on_change("PRD001", product("PRD001", 10.0, availability=0))
+    index.on_change("PRD002", product("PRD002", 20.0))
+    assert [item["product_id"] for item in index.recommend("rainy")] == ["PRD002"]
+
+
+def test_preferred_categories_rank_first():
+    index = WeatherProductIndex()
+    index.build([product("PRD001", 10.0, availability=100), product("PRD002", 60.0, availability=1, category="Sports")])
+    picked = index.recommend("rainy", limit=2, preferences=["sports"])
+    assert picked[0]["product_id"] == "PRD002"
@@ -0,0 +1,285 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+import weakref
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional
+from urllib.parse import parse_qs, urlparse
+
+import httpx
+
+from cache import SingleFlight, TTLCache, weather_cache
+
+
+# Both weather tools get their data from one provider. The simulated
+# provider serves the demo cities; the OpenWeatherMap provider calls the real
+# API (or the stub server below) through pooled HTTP clients. Either way the
+# provider is wrapped in a per-location TTL cache, and concurrent requests
+# for the same location share one upstream call.
+WEATHER_PROVIDER = os.getenv("WEATHER_PROVIDER", "simulated").lower()
+OPENWEATHER_API_KEY = os.getenv("OPENWEATHER_API_KEY", "")
+WEATHER_API_URL = os.getenv("WEATHER_API_URL", "https://api.openweathermap.org").rstrip("/")
+WEATHER_TIMEOUT_SECONDS = float(os.getenv("WEATHER_TIMEOUT_SECONDS", "2.0"))
+WEATHER_MAX_CONNECTIONS = int(os.getenv("WEATHER_MAX_CONNECTIONS", "20"))
+
+SIMULATED_WEATHER = {
+    "New York, NY": {"temp": 22, "condition": "rainy", "humidity": 78},
+    "Los Angeles, CA": {"temp": 28, "condition": "sunny", "humidity": 45},
+    "Chicago, IL": {"temp": 15, "condition": "cold", "humidity": 65},
+    "Miami, FL": {"temp": 32, "condition": "sunny", "humidity": 82}
+}
+DEFAULT_WEATHER = {"temp": 20, "condition": "mild", "humidity": 60}
+# Clear or cloudy weather below this temperature (°C) counts as cold.
+COLD_BELOW_C = 16
+
+
+def normalize_location(location: str) -> str:
+    """Lowercase and collapse whitespace, so "Chicago,  IL" and "chicago, il" are one location."""
+    return " ".join(location.lower().split())
+
+
+SIMULATED_BY_LOCATION = {normalize_location(location): weather for location, weather in SIMULATED_WEATHER.items()}
+
+
+def simulated_weather(location: str) -> Dict[str, Any]:
+    return SIMULATED_BY_LOCATION.get(normalize_location(location), DEFAULT_WEATHER)
+
+
+class WeatherProvider:
+    """Current weather for a location as {"temp", "condition", "humidity"}.
+
+    condition is one of the tags products are labelled with: sunny, rainy,
+    snowy, cold or mild.
+    """
+
+    def get(self, location: str) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    async def aget(self, location: str) -> Dict[str, Any]:
+        return self.get(location)
+
+
+class SimulatedWeatherProvider(WeatherProvider):
+    """Fixed demo data; unknown locations get mild weather."""
+
+    def get(self, location: str) -> Dict[str, Any]:
+        return simulated_weather(location)
+
+
+def parse_openweathermap(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Map an OpenWeatherMap current-weather response onto the product weather tags."""
+    temp = round(payload["main"]["temp"])
+    kind = payload["weather"][0]["main"].lower()
+    if kind in ("rain", "drizzle", "thunderstorm"):
+        condition = "rainy"
+    elif kind == "snow":
+        condition = "snowy"
+    elif temp < COLD_BELOW_C:
+        condition = "cold"
+    elif kind == "clear":
+        condition = "sunny"
+    else:
+        condition = "mild"
+    return {"temp": temp, "condition": condition, "humidity": payload["main"]["humidity"]}
+
+
+class OpenWeatherMapProvider(WeatherProvider):
+    """OpenWeatherMap current weather over keep-alive connection pools.
+
+    The sync client is shared by all threads. Async clients are bound to the
+    event loop they were created on, so there is one per loop.
+    """
+
+    def __init__(self, api_key: str = OPENWEATHER_API_KEY, base_url: str = WEATHER_API_URL,
+                 timeout: float = WEATHER_TIMEOUT_SECONDS, max_connections: int = WEATHER_MAX_CONNECTIONS):
+        self.api_key = api_key
+        self.url = f"{base_url.rstrip('/')}/data/2.5/weather"
+        self.timeout = httpx.Timeout(timeout)
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self._client: Optional[httpx.Client] = None
+        self._client_lock = threading.Lock()
+        self._async_clients = weakref.WeakKeyDictionary()
+
+    def params(self, location: str) -> Dict[str, str]:
+        return {"q": location, "appid": self.api_key, "units": "metric"}
+
+    def client(self) -> httpx.Client:
+        with self._client_lock:
+            if self._client is None:
+                self._client = httpx.Client(timeout=self.timeout, limits=self.limits)
+            return self._client
+
+    def async_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(timeout=self.timeout, limits=self.limits)
+            self._async_clients[loop] = client
+        return client
+
+    def get(self, location: str) -> Dict[str, Any]:
+        response = self.client().get(self.url, params=self.params(location))
+        response.raise_for_status()
+        return parse_openweathermap(response.json())
+
+    async def aget(self, location: str) -> Dict[str, Any]:
+        response = await self.async_client().get(self.url, params=self.params(location))
+        response.raise_for_status()
+        return parse_openweathermap(response.json())
+
+    def close(self):
+        if self._client is not None:
+            self._client.close()
+
+
+class CachedWeatherProvider(WeatherProvider):
+    """TTL cache and single-flight coalescing in front of another provider.
+
+    The location is normalized once; the same normalized value is the cache
+    key and what the wrapped provider is asked for, so a cached entry always
+    answers the question that filled it.
+    """
+
+    def __init__(self, provider: WeatherProvider, cache: TTLCache = weather_cache):
+        self.provider = provider
+        self.cache = cache
+        self.upstream_calls = 0
+        self._flight = SingleFlight()
+
+    def get(self, location: str) -> Dict[str, Any]:
+        key = normalize_location(location)
+        weather = self.cache.get(key)
+        if weather is None:
+            weather = self._flight.do(key, lambda: self._store(key, self.provider.get(key)))
+        return weather
+
+    async def aget(self, location: str) -> Dict[str, Any]:
+        key = normalize_location(location)
+        weather = self.cache.get(key)
+        if weather is None:
+            weather = await self._flight.ado(key, lambda: self._astore(key))
+        return weather
+
+    async def _astore(self, key: str) -> Dict[str, Any]:
+        return self._store(key, await self.provider.aget(key))
+
+    def _store(self, key: str, weather: Dict[str, Any]) -> Dict[str, Any]:
+        self.upstream_calls += 1
+        self.cache.set(key, weather)
+        return weather
+
+
+def create_weather_provider(name: str = WEATHER_PROVIDER) -> CachedWeatherProvider:
+    if name == "openweathermap":
+        return CachedWeatherProvider(OpenWeatherMapProvider())
+    if name != "simulated":
+        print(f"⚠️ Unknown WEATHER_PROVIDER '{name}', using simulated weather")
+    return CachedWeatherProvider(SimulatedWeatherProvider())
+
+
+weather_provider = create_weather_provider()
+
+
+# Local stand-in for the OpenWeatherMap API, serving the simulated cities.
+# Point WEATHER_API_URL at it to exercise the HTTP path without a key.
+
+STUB_WEATHER_KINDS = {"rainy": "Rain", "snowy": "Snow", "sunny": "Clear", "cold": "Clouds", "mild": "Clouds"}
+
+
+class StubWeatherHandler(BaseHTTPRequestHandler):
+    delay_seconds = 0.0
+    requests_served = 0
+    _count_lock = threading.Lock()
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/stats":
+            return self._send(200, {"requests": StubWeatherHandler.requests_served})
+        if url.path != "/data/2.5/weather":
+            return self._send(404, {"message": "not found"})
+        with StubWeatherHandler._count_lock:
+            StubWeatherHandler.requests_served += 1
+        if self.delay_seconds:
+            time.sleep(self.delay_seconds)
+        location = parse_qs(url.query).get("q", [""])[0]
+        weather = simulated_weather(location)
+        self._send(200, {
+            "name": location.split(",")[0],
+            "weather": [{"main": STUB_WEATHER_KINDS[weather["condition"]]}],
+            "main": {"temp": weather["temp"], "humidity": weather["humidity"]},
+        })
+
+    def _send(self, status: int, body: Dict[str, Any]):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server(port: int = 0, delay_ms: float = 0.0) -> ThreadingHTTPServer:
+    """Serve the stub API on a background thread; port 0 picks a free port."""
+    StubWeatherHandler.delay_seconds = delay_ms / 1000
+    server = ThreadingHTTPServer(("127.0.0.1", port), StubWeatherHandler)
+    threading.Thread(target=server.serve_forever, name="weather-stub", daemon=True).start()
+    return server
+
+
+async def coalescing_check(requests: int, location: str, delay_ms: float) -> Dict[str, Any]:
+    """Fire concurrent lookups for one location at the stub and count the upstream calls."""
+    server = start_stub_server(delay_ms=delay_ms)
+    provider = CachedWeatherProvider(
+        OpenWeatherMapProvider(api_key="stub", base_url=f"http://127.0.0.1:{server.server_port}"),
+        TTLCache("weather_check", maxsize=16),
+    )
+    started = time.perf_counter()
+    results = await asyncio.gather(*(provider.aget(location) for _ in range(requests)))
+    elapsed = time.perf_counter() - started
+    server.shutdown()
+    return {
+        "requests": requests,
+        "upstream_calls": StubWeatherHandler.requests_served,
+        "elapsed_ms": round(elapsed * 1000, 2),
+        "weather": results[0],
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Weather stub server and request coalescing check.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    serve = subparsers.add_parser("serve", help="run the OpenWeatherMap-compatible stub server")
+    serve.add_argument("--port", type=int, default=8081)
+    serve.add_argument("--delay-ms", type=float, default=0.0, help="simulated upstream latency")
+    check = subparsers.add_parser("check", help="send concurrent lookups for one location through the stub")
+    check.add_argument("--requests", type=int, default=100)
+    check.add_argument("--location", default="Chicago, IL")
+    check.add_argument("--delay-ms", type=float, default=200.0)
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        server = start_stub_server(args.port, args.delay_ms)
+        print(f"🌤️ Weather stub listening on http://127.0.0.1:{server.server_port} (WEATHER_API_URL)")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            server.shutdown()
+        return 0
+
+    result = asyncio.run(coalescing_check(args.requests, args.location, args.delay_ms))
+    print(f"🌤️ {result['requests']} concurrent lookups for {args.location}: "
+          f"{result['upstream_calls']} upstream call(s) in {result['elapsed_ms']} ms")
+    print(f"   {result['weather']}")
+    return 0 if result["upstream_calls"] == 1 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,201 @@
+import bisect
+import math
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+
+# Weather conditions a product can be recommended for. Products tagged
+# "all_weather" are ranked into every one of them.
+CONDITIONS = ("sunny", "rainy", "snowy", "cold", "mild")
+ALL_WEATHER = "all_weather"
+WEATHER_INDEX_REFRESH_SECONDS = float(os.getenv("WEATHER_INDEX_REFRESH_SECONDS", "600"))
+
+# Ranking: a product made for the condition beats a generic all-weather one,
+# and deeper stock beats a nearly sold-out item. Out-of-stock products are
+# not listed at all.
+CONDITION_MATCH_SCORE = 1.0
+ALL_WEATHER_SCORE = 0.4
+STOCK_WEIGHT = 0.5
+STOCK_SATURATION = 100
+# Added at lookup time for products in one of the customer's preferred categories.
+PREFERENCE_BOOST = 0.6
+# Candidates re-ranked per lookup, as a multiple of the number of results.
+CANDIDATE_FACTOR = 6
+PRICE_BANDS = ((25.0, "budget"), (100.0, "mid"))
+
+
+def price_band(price: float) -> str:
+    for upper, band in PRICE_BANDS:
+        if price < upper:
+            return band
+    return "premium"
+
+
+def product_scores(product: Dict[str, Any]) -> Dict[str, float]:
+    """Ranking score of a product for every condition it can be recommended for."""
+    availability = product.get("availability") or 0
+    if availability <= 0:
+        return {}
+    stock = STOCK_WEIGHT * min(1.0, math.log1p(availability) / math.log1p(STOCK_SATURATION))
+    tags = set(product.get("weather_suitable") or [])
+    scores = {tag: CONDITION_MATCH_SCORE + stock for tag in tags if tag != ALL_WEATHER}
+    if ALL_WEATHER in tags:
+        scores[ALL_WEATHER] = ALL_WEATHER_SCORE + stock
+        for condition in CONDITIONS:
+            scores.setdefault(condition, ALL_WEATHER_SCORE + stock)
+    return scores
+
+
+class WeatherProductIndex:
+    """Materialised map from weather condition to products ranked for it.
+
+    Each condition keeps a list sorted by score, maintained incrementally with
+    upsert()/remove(), so a lookup only reads the head of one list.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._ranked: Dict[str, List[Tuple[float, str]]] = defaultdict(list)
+        self._entries: Dict[str, Dict[str, float]] = {}
+        self._products: Dict[str, Dict[str, Any]] = {}
+        self.built_at: Optional[float] = None
+        self.stale = False
+        self._rebuilding = False
+        self._build_done = threading.Event()
+        self._build_done.set()
+
+    def __len__(self) -> int:
+        return len(self._products)
+
+    @property
+    def is_built(self) -> bool:
+        return self.built_at is not None
+
+    @property
+    def building(self) -> bool:
+        return self._rebuilding
+
+    def _remove_locked(self, product_id: str):
+        self._products.pop(product_id, None)
+        for condition, score in self._entries.pop(product_id, {}).items():
+            ranked = self._ranked[condition]
+            position = bisect.bisect_left(ranked, (-score, product_id))
+            if position < len(ranked) and ranked[position] == (-score, product_id):
+                del ranked[position]
+
+    def upsert(self, product: Dict[str, Any]):
+        product = {key: value for key, value in product.items() if key != "_id"}
+        product_id = product["product_id"]
+        scores = product_scores(product)
+        with self._lock:
+            self._remove_locked(product_id)
+            if not scores:
+                return
+            self._products[product_id] = product
+            self._entries[product_id] = scores
+            for condition, score in scores.items():
+                bisect.insort(self._ranked[condition], (-score, product_id))
+
+    def remove(self, product_id: str):
+        with self._lock:
+            self._remove_locked(product_id)
+
+    def build(self, products: Iterable[Dict[str, Any]]):
+        """Replace the index contents with the given products."""
+        fresh = WeatherProductIndex()
+        for product in products:
+            product = {key: value for key, value in product.items() if key != "_id"}
+            scores = product_scores(product)
+            if not scores:
+                continue
+            fresh._products[product["product_id"]] = product
+            fresh._entries[product["product_id"]] = scores
+            for condition, score in scores.items():
+                fresh._ranked[condition].append((-score, product["product_id"]))
+        for ranked in fresh._ranked.values():
+            ranked.sort()
+        with self._lock:
+            self._ranked = fresh._ranked
+            self._entries = fresh._entries
+            self._products = fresh._products
+            self.built_at = time.monotonic()
+            self.stale = False
+
+    def build_in_background(self, load_products: Callable[[], Iterable[Dict[str, Any]]]):
+        """Start a build on a background thread unless one is already running."""
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+            self._build_done.clear()
+
+        def rebuild():
+            try:
+                self.build(load_products())
+            except Exception as e:
+                print(f"⚠️ Could not build the weather product index: {e}")
+            finally:
+                self._rebuilding = False
+                self._build_done.set()
+
+        threading.Thread(target=rebuild, name="weather-index-rebuild", daemon=True).start()
+
+    def wait_built(self, timeout: Optional[float] = None) -> bool:
+        """Wait for a running background build; returns whether the index is built."""
+        self._build_done.wait(timeout)
+        return self.is_built
+
+    def ensure_built(self, load_products: Callable[[], Iterable[Dict[str, Any]]]):
+        """Build on first use (or wait for a running startup build); afterwards rebuild in the background when stale or old."""
+        if not self.is_built and not self.wait_built():
+            self.build(load_products())
+            return
+        expired = time.monotonic() - self.built_at > WEATHER_INDEX_REFRESH_SECONDS
+        if self.stale or expired:
+            self.build_in_background(load_products)
+
+    def on_change(self, product_id: Optional[str], product: Optional[Dict[str, Any]]):
+        """Change listener compatible with cache.add_change_listener."""
+        if product is not None:
+            self.upsert(product)
+        elif product_id is not None:
+            self.remove(product_id)
+        else:
+            self.stale = True
+
+    def recommend(self, condition: str, limit: int = 5, preferences: Sequence[str] = ()) -> List[Dict[str, Any]]:
+        """Top products for a condition, preferred categories first, spread over price bands.
+
+        Conditions no product is tagged with fall back to all-weather products.
+        """
+        preferred = {category.strip().lower() for category in preferences}
+        with self._lock:
+            ranked = self._ranked.get(condition) or self._ranked.get(ALL_WEATHER) or []
+            candidates = [
+                (-negative_score, self._products[product_id])
+                for negative_score, product_id in ranked[:limit * CANDIDATE_FACTOR]
+            ]
+        if preferred:
+            candidates = [
+                (score + (PREFERENCE_BOOST if str(product.get("category", "")).lower() in preferred else 0.0), product)
+                for score, product in candidates
+            ]
+            candidates.sort(key=lambda candidate: (-candidate[0], candidate[1]["product_id"]))
+
+        # At most about half of the results from one price band, as long as
+        # there are enough candidates to choose from
+        per_band = max(2, math.ceil(limit / 2))
+        picked, skipped, band_counts = [], [], defaultdict(int)
+        for _, product in candidates:
+            band = price_band(product.get("price") or 0.0)
+            if band_counts[band] < per_band:
+                band_counts[band] += 1
+                picked.append(product)
+            else:
+                skipped.append(product)
+            if len(picked) == limit:
+                break
+        return picked + skipped[:limit - len(picked)]